@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+import extract
+
+# Measures listing and detail extraction speed and peak memory for every installed backend.
+# fixtures/ holds a trimmed ultra.md category page and product page; --save refreshes them
+# from the live site. --synthetic uses a generated page with the same product markup instead.
+
+# Inline script, style and svg bodies are dropped from saved pages, they are most of the bytes
+# and none of the scrapers look inside them
+TRIM_RE = re.compile(r"(<(script|style|svg)\b[^>]*>).*?(</\2>)", re.IGNORECASE | re.DOTALL)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+LISTING_FIXTURE = os.path.join(FIXTURES, "category.html")
+DETAIL_FIXTURE = os.path.join(FIXTURES, "product.html")
+
+
+def synthetic_listing(products=60):
+    filler = "".join(f'<li class="menu-item"><a href="/category/c{i}">Category {i}</a></li>' for i in range(300))
+    blocks = "".join(
+        f'<div class="product-block flex flex-col"><div class="image"><img src="/img/{i}.webp" alt="TV {i}"></div>'
+        f'<a class="product-text line-clamp-2" href="https://ultra.md/product/tv-{i}">Televizor Model {i} 55" 4K</a>'
+        f'<div class="prices"><span class="text-blue text-xl font-bold dark:text-white"> {i + 5} 999 lei </span>'
+        f'<span class="line-through text-gray">{i + 7} 499 lei</span></div></div>'
+        for i in range(products))
+    script = "<script>" + "var x = 1;" * 2000 + "</script>"
+    return f"<html><head>{script}</head><body><nav><ul>{filler}</ul></nav><main>{blocks}</main></body></html>"
+
+
+def synthetic_detail():
+    specs = "".join(f"<tr><td>Spec {i}</td><td>Value {i}</td></tr>" for i in range(400))
+    script = "<script>" + "var y = 2;" * 4000 + "</script>"
+    label = '<label class="cursor-pointer font-semibold">12 499 lei</label>'
+    return f"<html><head>{script}</head><body><table>{specs}</table><form>{label}</form></body></html>"
+
+
+def trim_page(html):
+    return TRIM_RE.sub(r"\1\3", html)
+
+
+def load_fixtures(synthetic=False):
+    if not synthetic and os.path.exists(LISTING_FIXTURE) and os.path.exists(DETAIL_FIXTURE):
+        with open(LISTING_FIXTURE, encoding="utf-8") as f:
+            listing = f.read()
+        with open(DETAIL_FIXTURE, encoding="utf-8") as f:
+            detail = f.read()
+        return listing, detail, "saved"
+    return synthetic_listing(), synthetic_detail(), "synthetic"
+
+
+def save_fixtures(host, path):
+    from main import get_html_body, send_http_request
+
+    os.makedirs(FIXTURES, exist_ok=True)
+    listing = get_html_body(send_http_request(host, path))
+    link = next(extract.extract_listing(listing))[2]
+    detail = get_html_body(send_http_request(host, link))
+    for fixture, html in ((LISTING_FIXTURE, listing), (DETAIL_FIXTURE, detail)):
+        with open(fixture, "w", encoding="utf-8") as f:
+            f.write(trim_page(html))
+    print(f"Saved {LISTING_FIXTURE} and {DETAIL_FIXTURE}")
+
+
+def measure(backend_name, iterations, synthetic=False):
+    listing, detail, _ = load_fixtures(synthetic)
+    backend = extract.get_backend(backend_name)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        products = list(backend.listing(listing))
+    listing_rate = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        info = backend.detail_info(detail)
+    detail_rate = iterations / (time.perf_counter() - start)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb
+    return {"backend": backend_name, "products": len(products), "info": info,
+            "listing_rate": listing_rate, "detail_rate": detail_rate, "peak_mb": peak_kb / 1024}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark product extraction backends")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--save", action="store_true", help="Download real pages into fixtures/ first")
+    parser.add_argument("--synthetic", action="store_true", help="Use the generated pages instead of fixtures/")
+    parser.add_argument("--host", default="ultra.md")
+    parser.add_argument("--path", default="/category/tv-televizory")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Each backend runs in its own process so peak memory is not shared between them
+        print(json.dumps(measure(args.child, args.iterations, args.synthetic)))
+        sys.exit(0)
+
+    if args.save:
+        save_fixtures(args.host, args.path)
+
+    listing, detail, kind = load_fixtures(args.synthetic)
+    print(f"Fixtures: {kind} (listing {len(listing) // 1024} KB, detail {len(detail) // 1024} KB)")
+    print(f"{'backend':<10}{'products':>9}{'listing pages/s':>17}{'detail pages/s':>16}{'peak MB':>9}")
+    for name in extract.available_backends():
+        command = [sys.executable, __file__, "--child", name, "--iterations", str(args.iterations)]
+        if args.synthetic:
+            command.append("--synthetic")
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        print(f"{name:<10}{result['products']:>9}{result['listing_rate']:>17.1f}{result['detail_rate']:>16.1f}"
+              f"{result['peak_mb']:>9.1f}")
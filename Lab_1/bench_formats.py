@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+from binary_format import QUEUE_SCHEMA, RecordDecoder, RecordEncoder, decode_batch, encode_batch
+from serializers import deserialize, serialize, serialize_to_json
+
+# Size and speed of the product exchange formats, for a whole batch and for
+# one record per message as on the RabbitMQ queue.
+
+
+def make_products(count):
+    return [{"name": f"Televizor Samsung UE55AU7100 {i} 55\" 4K", "price": f"{5000 + i % 20000} lei",
+             "link": f"https://ultra.md/product/televizor-samsung-{i}", "additional_info": f"{5500 + i % 20000} lei"}
+            for i in range(count)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def per_message(products):
+    encoder = RecordEncoder(QUEUE_SCHEMA)
+    decoder = RecordDecoder(QUEUE_SCHEMA)
+    cases = {
+        "json": (lambda p: json.dumps(p).encode(), json.loads),
+        "custom": (lambda p: serialize(p).encode(), lambda m: deserialize(m.decode())),
+        # A queue consumer already knows the schema, so each message carries only the record
+        "binary": (encoder.encode, decoder.decode),
+    }
+    for name, (encode, decode) in cases.items():
+        messages, encode_time = timed(lambda: [encode(p) for p in products])
+        _, decode_time = timed(lambda: [decode(m) for m in messages])
+        yield name, sum(map(len, messages)), encode_time, decode_time
+
+
+def whole_batch(products):
+    cases = {
+        "json": (lambda p: serialize_to_json(p).encode(), json.loads),
+        "custom": (lambda p: serialize(p).encode(), lambda data: deserialize(data.decode())),
+        "binary": (lambda p: encode_batch(p, QUEUE_SCHEMA), decode_batch),
+    }
+    for name, (encode, decode) in cases.items():
+        data, encode_time = timed(encode, products)
+        decoded, decode_time = timed(decode, data)
+        assert decoded == products, name
+        yield name, len(data), encode_time, decode_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the JSON, custom and binary product formats")
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    products = make_products(args.records)
+    for title, rows in (("Whole batch", whole_batch(products)), ("One record per message", per_message(products))):
+        print(f"{title}, {args.records} records")
+        print(f"{'format':<8}{'MB':>8}{'bytes/rec':>11}{'encode rec/s':>14}{'decode rec/s':>14}")
+        for name, size, encode_time, decode_time in rows:
+            print(f"{name:<8}{size / 2 ** 20:>8.1f}{size / args.records:>11.1f}"
+                  f"{args.records / encode_time:>14.0f}{args.records / decode_time:>14.0f}")
+        print()
@@ -0,0 +1,34 @@
+import argparse
+import time
+from extract import extract_listing
+from http_client import HTTPConnectionPool
+
+# Compares one-connection-per-request fetching (the old send_http_request behaviour)
+# with the keep-alive pool on the listing page plus its product detail pages.
+
+def crawl(pool, host, path, limit):
+    listing = pool.request(host, path)
+    links = [link for _, _, link in extract_listing(listing.text())][:limit]
+    for link in links:
+        pool.request(host, link)
+    return len(links) + 1
+
+def run(keep_alive, host, path, limit):
+    with HTTPConnectionPool(keep_alive=keep_alive) as pool:
+        start = time.perf_counter()
+        requests_made = crawl(pool, host, path, limit)
+        elapsed = time.perf_counter() - start
+        return requests_made, elapsed, dict(pool.stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark keep-alive connection pooling")
+    parser.add_argument("--host", default="ultra.md")
+    parser.add_argument("--path", default="/category/tv-televizory")
+    parser.add_argument("--limit", type=int, default=50, help="Number of detail pages to fetch")
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'requests':>10}{'seconds':>10}{'req/s':>10}{'connections':>13}{'handshakes':>12}{'resumed':>9}")
+    for label, keep_alive in (("close", False), ("keep-alive", True)):
+        requests_made, elapsed, stats = run(keep_alive, args.host, args.path, args.limit)
+        print(f"{label:<12}{requests_made:>10}{elapsed:>10.2f}{requests_made / elapsed:>10.1f}"
+              f"{stats['connections']:>13}{stats['handshakes']:>12}{stats['resumed_sessions']:>9}")
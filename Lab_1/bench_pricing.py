@@ -0,0 +1,46 @@
+import argparse
+import random
+import time
+from functools import reduce
+from pricing import ExchangeRates, ProductBatch, np
+
+# Converts, filters and totals historical price rows the old way (a dict per
+# row with map/filter/reduce) and with ProductBatch columns.
+
+
+def dict_report(records, rates, min_price, max_price):
+    factor = rates.factor("MDL", "EUR")
+    in_eur = list(map(lambda p: {**p, 'price': p['price'] * factor}, records))
+    filtered = list(filter(lambda p: min_price <= p['price'] <= max_price, in_eur))
+    return len(filtered), reduce(lambda acc, p: acc + p['price'], filtered, 0)
+
+
+def batch_report(records, rates, min_price, max_price, use_numpy):
+    batch = ProductBatch.from_records(records, use_numpy=use_numpy)
+    filtered = batch.convert("EUR", rates).filter_range(min_price, max_price)
+    filtered.stats()
+    return len(filtered), filtered.total()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark price conversion, filtering and totals")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    records = [{"name": f"Product {i}", "price": random.randint(500, 60000), "link": f"/product/{i}"}
+               for i in range(args.rows)]
+    rates = ExchangeRates({"EUR": 19.6})
+
+    cases = [("dict per row", lambda: dict_report(records, rates, 100, 1000)),
+             ("batch (array)", lambda: batch_report(records, rates, 100, 1000, use_numpy=False))]
+    if np is not None:
+        cases.append(("batch (numpy)", lambda: batch_report(records, rates, 100, 1000, use_numpy=True)))
+
+    print(f"{args.rows} rows")
+    print(f"{'approach':<16}{'seconds':>9}{'rows/s':>13}{'matched':>9}{'total EUR':>15}")
+    for name, run in cases:
+        start = time.perf_counter()
+        matched, total = run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16}{elapsed:>9.3f}{args.rows / elapsed:>13.0f}{matched:>9}{total:>15.2f}")
@@ -0,0 +1,192 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from serializers import deserialize, dump, dump_json, dump_xml, iter_deserialize, serialize
+
+# Compares the streaming serializers and the custom format parser with the original
+# versions from main.py (kept below verbatim) on a large synthetic product list.
+
+def legacy_serialize(data):
+    if isinstance(data, dict):
+        serialized_str = "[D:"
+        for key, value in data.items():
+            serialized_str += f"{key}={legacy_serialize(value)};"
+        return serialized_str.rstrip(';') + "]"
+
+    elif isinstance(data, list):
+        serialized_str = "[L:"
+        for item in data:
+            serialized_str += f"{legacy_serialize(item)};"
+        return serialized_str.rstrip(';') + "]"
+
+    elif isinstance(data, str):
+        return f'str("{data}")'
+
+    elif isinstance(data, int):
+        return f'int({data})'
+
+    elif isinstance(data, float):
+        return f'float({data})'
+
+    else:
+        return "unknown"
+
+def legacy_serialize_to_json(data):
+    if isinstance(data, list):
+        json_str = "["
+        for item in data:
+            json_str += legacy_serialize_to_json(item) + ","
+        json_str = json_str.rstrip(',') + "]"
+        return json_str
+    elif isinstance(data, dict):
+        json_str = "{"
+        for key, value in data.items():
+            json_str += f'"{key}": {legacy_serialize_to_json(value)},'
+        json_str = json_str.rstrip(',') + "}"
+        return json_str
+    elif isinstance(data, str):
+        return f'"{data}"'
+    elif isinstance(data, (int, float)):
+        return str(data)
+    else:
+        return "null"
+
+def legacy_serialize_to_xml(data):
+    if isinstance(data, list):
+        xml_str = "<products>"
+        for item in data:
+            xml_str += legacy_serialize_to_xml(item)
+        xml_str += "</products>"
+        return xml_str
+    elif isinstance(data, dict):
+        xml_str = "<product>"
+        for key, value in data.items():
+            xml_str += f"<{key}>{legacy_serialize_to_xml(value)}</{key}>"
+        xml_str += "</product>"
+        return xml_str
+    elif isinstance(data, str):
+        return data
+    elif isinstance(data, (int, float)):
+        return str(data)
+    else:
+        return ""
+
+
+def legacy_deserialize(data):
+    result = []
+    # Split by the delimiter used for different products
+    products = data.strip('[]').split('];[')
+
+    for product in products:
+        product_dict = {}
+        # Extract name
+        name_part = product.split(';')[0].split('=')[1].strip('str("').strip('")')
+        product_dict['name'] = name_part
+
+        # Extract price
+        price_part = product.split(';')[1].split('=')[1].strip('int()')
+        product_dict['price'] = int(price_part)
+
+        # Extract link
+        link_part = product.split(';')[2].split('=')[1].strip('str("').strip('")')
+        product_dict['link'] = link_part
+
+        # Extract price with interest
+        price_with_interest_part = product.split(';')[3].split('=')[1].strip('int()')
+        product_dict['price_with_interest'] = int(price_with_interest_part)
+
+        result.append(product_dict)
+
+    return result
+
+
+def make_products(count, plain=False):
+    # The original deserialize cannot cope with quotes or separators in names, so it gets plain ones
+    name = "Televizor Model {} 55 4K" if plain else "Televizor Model {} 55\" 4K & <HDR>; [new]"
+    return [{"name": name.format(i), "price": 5000 + i % 20000,
+             "link": f"https://ultra.md/product/tv-{i}", "price_with_interest": 5500 + i % 20000}
+            for i in range(count)]
+
+
+def legacy_to_file(function):
+    def write(data, fp):
+        fp.write(function(data))
+    return write
+
+
+def measure_parse(parse, source, repeat=3):
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(source)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(source)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def stream_parse(path):
+    with open(path, encoding="utf-8") as fp:
+        for _ in iter_deserialize(fp):
+            pass
+
+
+def measure(write, products):
+    with open(os.devnull, "w", encoding="utf-8") as fp:
+        start = time.perf_counter()
+        write(products, fp)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        write(products, fp)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark product serializers")
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    products = make_products(args.records)
+    cases = [
+        ("custom", "legacy", legacy_to_file(legacy_serialize)),
+        ("custom", "stream", dump),
+        ("json", "legacy", legacy_to_file(legacy_serialize_to_json)),
+        ("json", "stream", dump_json),
+        ("xml", "legacy", legacy_to_file(legacy_serialize_to_xml)),
+        ("xml", "stream", dump_xml),
+    ]
+    print(f"{args.records} records")
+    print(f"{'format':<8}{'version':<8}{'seconds':>9}{'records/s':>12}{'peak MB':>9}")
+    for fmt, version, write in cases:
+        elapsed, peak = measure(write, products)
+        print(f"{fmt:<8}{version:<8}{elapsed:>9.3f}{args.records / elapsed:>12.0f}{peak / 2 ** 20:>9.1f}")
+
+    # Round-trip check on names the old parser could not handle, then parsing speed on plain data
+    # (test_serializers.py covers the edge cases)
+    text = serialize(products)
+    if deserialize(text) != products or list(iter_deserialize(io.StringIO(text))) != products:
+        raise SystemExit("Round trip through the custom format changed the products")
+
+    text = serialize(make_products(args.records, plain=True))
+    megabytes = len(text.encode()) / 2 ** 20
+    print(f"\nParsing {megabytes:.1f} MB of the custom format")
+    print(f"{'parser':<16}{'seconds':>9}{'MB/s':>9}{'peak MB':>9}")
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as fp:
+        fp.write(text)
+    try:
+        cases = (("legacy", legacy_deserialize, text), ("deserialize", deserialize, text),
+                 ("iter_deserialize", stream_parse, fp.name))
+        for name, parse, source in cases:
+            elapsed, peak = measure_parse(parse, source)
+            print(f"{name:<16}{elapsed:>9.3f}{megabytes / elapsed:>9.1f}{peak / 2 ** 20:>9.1f}")
+    finally:
+        os.remove(fp.name)
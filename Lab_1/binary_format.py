@@ -0,0 +1,248 @@
+import mmap
+import os
+import struct
+from array import array
+from contextlib import contextmanager
+
+# Length-prefixed binary encoding for batches of product records.
+#
+# A batch starts with a header describing its schema:
+#   magic "PRB1" | u8 field count | per field: u8 type code, u8 name length, name (UTF-8)
+# followed by records:
+#   u32 record length | null bitmap (1 bit per field) | field values
+# where "i" fields are int64, "d" fields are float64 and "s" fields are a u32
+# length followed by UTF-8 bytes. All integers are little-endian. Null fields
+# take no space beyond their bit in the bitmap.
+
+MAGIC = b"PRB1"
+INT, FLOAT, STRING = "i", "d", "s"
+
+PRODUCT_SCHEMA = (("name", STRING), ("price", INT), ("link", STRING), ("price_with_interest", INT))
+# Shape of the messages Lab_3 puts on the queue, where price is still the scraped text
+QUEUE_SCHEMA = (("name", STRING), ("price", STRING), ("link", STRING), ("additional_info", STRING))
+
+U8 = struct.Struct("<B")
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+
+
+class BinaryFormatError(ValueError):
+    pass
+
+
+def check_schema(schema):
+    for name, kind in schema:
+        if kind not in (INT, FLOAT, STRING):
+            raise BinaryFormatError(f"Unknown field type {kind!r} for {name!r}")
+    return tuple(schema)
+
+
+def encode_header(schema):
+    parts = [MAGIC, U8.pack(len(schema))]
+    for name, kind in check_schema(schema):
+        encoded_name = name.encode()
+        parts.append(U8.pack(ord(kind)) + U8.pack(len(encoded_name)) + encoded_name)
+    return b"".join(parts)
+
+
+def decode_header(view):
+    if len(view) < 5 or bytes(view[:4]) != MAGIC:
+        raise BinaryFormatError("Not a product batch (bad magic)")
+    count = view[4]
+    pos = 5
+    schema = []
+    for _ in range(count):
+        if pos + 2 > len(view):
+            raise BinaryFormatError("Truncated header")
+        kind, length = chr(view[pos]), view[pos + 1]
+        pos += 2
+        if pos + length > len(view):
+            raise BinaryFormatError("Truncated header")
+        try:
+            name = str(view[pos:pos + length], "utf-8")
+        except UnicodeDecodeError:
+            raise BinaryFormatError(f"Field name at offset {pos} is not UTF-8") from None
+        schema.append((name, kind))
+        pos += length
+    return check_schema(schema), pos
+
+
+class RecordEncoder:
+    """Encodes records (dicts) for one schema, with the per-field packers chosen up front."""
+
+    def __init__(self, schema=PRODUCT_SCHEMA):
+        self.schema = tuple(schema)
+        self.header = encode_header(self.schema)
+        self.bitmap_size = (len(self.schema) + 7) // 8
+
+    def encode(self, record):
+        parts = []
+        nulls = 0
+        for index, (name, kind) in enumerate(self.schema):
+            value = record.get(name)
+            if value is None:
+                nulls |= 1 << index
+            elif kind == STRING:
+                encoded = value.encode()
+                parts.append(U32.pack(len(encoded)))
+                parts.append(encoded)
+            elif kind == INT:
+                parts.append(I64.pack(value))
+            else:
+                parts.append(F64.pack(value))
+        body = nulls.to_bytes(self.bitmap_size, "little") + b"".join(parts)
+        return U32.pack(len(body)) + body
+
+
+def encode_batch(records, schema=PRODUCT_SCHEMA):
+    encoder = RecordEncoder(schema)
+    return encoder.header + b"".join([encoder.encode(record) for record in records])
+
+
+class RecordDecoder:
+    """Decodes single records of one schema from a buffer, e.g. one queue message per record."""
+
+    def __init__(self, schema=PRODUCT_SCHEMA):
+        self.schema = check_schema(schema)
+        self.names = [name for name, _ in self.schema]
+        self.kinds = [kind for _, kind in self.schema]
+        self.bitmap_size = (len(self.schema) + 7) // 8
+
+    def decode(self, message):
+        """Decode a record produced by RecordEncoder.encode."""
+        return self.decode_at(memoryview(message), 4)
+
+    def decode_at(self, view, pos, wanted=None):
+        """Decode the record body starting at pos, or only the field at index wanted."""
+        try:
+            return self._decode_at(view, pos, wanted)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise BinaryFormatError(f"Malformed record at offset {pos}: {e}") from None
+
+    def _decode_at(self, view, pos, wanted):
+        nulls = int.from_bytes(view[pos:pos + self.bitmap_size], "little")
+        pos += self.bitmap_size
+        record = {}
+        for index, kind in enumerate(self.kinds):
+            if nulls >> index & 1:
+                value = None
+            elif kind == STRING:
+                length = U32.unpack_from(view, pos)[0]
+                pos += 4
+                if pos + length > len(view):
+                    raise struct.error(f"string of {length} bytes runs past the end")
+                # Strings before the wanted field are skipped, not decoded
+                value = str(view[pos:pos + length], "utf-8") if wanted is None or index == wanted else None
+                pos += length
+            elif kind == INT:
+                value = I64.unpack_from(view, pos)[0]
+                pos += 8
+            else:
+                value = F64.unpack_from(view, pos)[0]
+                pos += 8
+            if wanted is None:
+                record[self.names[index]] = value
+            elif index == wanted:
+                return value
+        return record
+
+
+class BatchWriter:
+    """Streams records to a binary file object, writing the header first."""
+
+    def __init__(self, fp, schema=PRODUCT_SCHEMA):
+        self.fp = fp
+        self.encoder = RecordEncoder(schema)
+        fp.write(self.encoder.header)
+
+    def write(self, record):
+        self.fp.write(self.encoder.encode(record))
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+
+class BatchReader:
+    """Reads records from any buffer (bytes, bytearray, mmap) through a memoryview, without copying it.
+
+    Record offsets are indexed on first use so records can be accessed by
+    position, and single fields can be decoded without decoding the rest.
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        try:
+            self.schema, self.start = decode_header(self.view)
+        except BinaryFormatError:
+            # Otherwise the buffer (e.g. an mmap) could not be closed by the caller
+            self.view.release()
+            raise
+        self.decoder = RecordDecoder(self.schema)
+        self._offsets = None
+
+    def __iter__(self):
+        view, pos, end = self.view, self.start, len(self.view)
+        while pos < end:
+            if pos + 4 > end:
+                raise BinaryFormatError("Truncated record at the end of the batch")
+            length = U32.unpack_from(view, pos)[0]
+            pos += 4
+            if pos + length > end:
+                raise BinaryFormatError("Truncated record at the end of the batch")
+            yield self.decoder.decode_at(view, pos)
+            pos += length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        return self.decoder.decode_at(self.view, self.offsets[index])
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            offsets = array("Q")
+            view, pos, end = self.view, self.start, len(self.view)
+            while pos + 4 <= end:
+                length = U32.unpack_from(view, pos)[0]
+                offsets.append(pos + 4)
+                pos += 4 + length
+            if pos != end:
+                raise BinaryFormatError("Truncated record at the end of the batch")
+            self._offsets = offsets
+        return self._offsets
+
+    def field(self, index, name):
+        """Decode one field of one record."""
+        wanted = self.decoder.names.index(name)
+        return self.decoder.decode_at(self.view, self.offsets[index], wanted)
+
+    def release(self):
+        self.view.release()
+
+
+def decode_batch(buffer):
+    return list(BatchReader(buffer))
+
+
+@contextmanager
+def open_batch_file(path):
+    """Memory-map a batch file and yield a BatchReader over it; pages are loaded only as records are read."""
+    with open(path, "rb") as f:
+        # An empty file cannot be mapped, and has no header either
+        if os.fstat(f.fileno()).st_size == 0:
+            raise BinaryFormatError(f"{path} is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        reader = BatchReader(mapped)
+    except BaseException:
+        mapped.close()
+        raise
+    try:
+        yield reader
+    finally:
+        # The memoryview has to be released before the map can be closed
+        reader.release()
+        mapped.close()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import sqlite3
+from extract import extract_detail_info, extract_listing, extract_pagination
+from fetcher import FetchEngine
+from main import (MAX_PER_HOST, MAX_WORKERS, RATE_LIMIT, fetch_detail_page, get_html_body, http_pool,
+                  send_http_request, validate_product)
+
+# Every stage below is a generator, so only the current listing page and the
+# detail pages in flight are held in memory, whatever the catalog size.
+
+HOST = "ultra.md"
+CATEGORIES = ["/category/tv-televizory"]
+
+
+def fetch_html(path):
+    return get_html_body(send_http_request(HOST, path, use_https=True))
+
+
+def next_page_path(html, category, page):
+    # Prefer an explicit rel="next" link, then fall back to numbered ?page=N links
+    next_href, last_page = extract_pagination(html)
+    if next_href:
+        return next_href
+    if last_page > page:
+        return f"{category}?page={page + 1}"
+    return None
+
+
+def iter_listing_pages(category, max_pages=None):
+    """Yield the HTML of each listing page of a category, following pagination until it runs out."""
+    path, page = category, 1
+    visited = set()
+    while path and path not in visited and (max_pages is None or page <= max_pages):
+        visited.add(path)
+        html = fetch_html(path)
+        if not html:
+            print(f"Failed to retrieve {path}")
+            return
+        yield html
+        path = next_page_path(html, category, page)
+        page += 1
+
+
+def iter_listed_products(categories, max_pages=None):
+    """Yield validated listing entries for every page of every category, skipping links already seen."""
+    seen = set()
+    for category in categories:
+        for html in iter_listing_pages(category, max_pages):
+            new_on_page = 0
+            for name, price, link in extract_listing(html):
+                validated_data = validate_product(name, price)
+                if validated_data is None or link in seen:
+                    continue
+                seen.add(link)
+                new_on_page += 1
+                validated_data['link'] = link
+                validated_data['category'] = category
+                yield validated_data
+
+            # Some sites serve the last page again for out-of-range page numbers
+            if new_on_page == 0:
+                break
+
+
+def iter_products(categories, max_pages=None):
+    """Fetch the detail page of every listed product and yield complete, validated records."""
+    in_flight = {}
+
+    def links():
+        for listed in iter_listed_products(categories, max_pages):
+            in_flight[listed['link']] = listed
+            yield listed['link']
+
+    engine = FetchEngine(lambda link: fetch_detail_page(HOST, link),
+                         max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, rate_limit=RATE_LIMIT,
+                         default_host=HOST)
+    for result in engine.fetch_all(links()):
+        record = in_flight.pop(result.link)
+        if result.error is not None:
+            print(f"Failed to fetch {result.link}: {result.error}")
+            continue
+
+        info = extract_detail_info(result.value)
+        if info is None:
+            continue
+        validated_info = validate_product(record['name'], info)
+        if validated_info is None:
+            continue
+
+        record['price_with_interest'] = validated_info['price']
+        record['additional_info'] = info
+        yield record
+
+
+# Sinks receive records one at a time through write() and release their resources in close()
+
+class PrintSink:
+    def write(self, record):
+        print(f"Product: {record['name']}\n"
+              f"Price: {record['price']} MDL\n"
+              f"Price with interest: {record['price_with_interest']} MDL\n"
+              f"Link: {record['link']}\n")
+
+    def close(self):
+        pass
+
+
+class SQLiteSink:
+    """Stores records in the same products table that Lab_2/db_init.py creates."""
+
+    def __init__(self, path="products.db", commit_every=100):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS products (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                name TEXT,
+                                price TEXT,
+                                link TEXT UNIQUE,
+                                additional_info TEXT
+                            )''')
+        self.commit_every = commit_every
+        self.pending = 0
+
+    def write(self, record):
+        self.conn.execute('''INSERT OR IGNORE INTO products (name, price, link, additional_info)
+                             VALUES (?, ?, ?, ?)''',
+                          (record['name'], f"{record['price']} lei", record['link'], record['additional_info']))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class RabbitMQSink:
+    """Publishes records to the queue Lab_3/consumer.py reads, over a single connection."""
+
+    def __init__(self, queue_name="scraper_queue", host="localhost"):
+        import pika
+
+        self.queue_name = queue_name
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host))
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=queue_name)
+
+    def write(self, record):
+        message = {"name": record['name'], "price": f"{record['price']} lei", "link": record['link'],
+                   "additional_info": record['additional_info']}
+        self.channel.basic_publish(exchange='', routing_key=self.queue_name, body=json.dumps(message))
+
+    def close(self):
+        self.connection.close()
+
+
+def run_pipeline(records, sink):
+    count = 0
+    try:
+        for record in records:
+            sink.write(record)
+            count += 1
+    finally:
+        sink.close()
+    return count
+
+
+def create_sink(args):
+    if args.sink == "sqlite":
+        return SQLiteSink(args.db)
+    if args.sink == "rabbitmq":
+        return RabbitMQSink(args.queue)
+    return PrintSink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl every page of one or more ultra.md categories")
+    parser.add_argument("--category", action="append", dest="categories",
+                        help="Category path, may be repeated (default: the CATEGORIES list)")
+    parser.add_argument("--max-pages", type=int, default=None, help="Stop after this many pages per category")
+    parser.add_argument("--sink", choices=["print", "sqlite", "rabbitmq"], default="print")
+    parser.add_argument("--db", default="products.db", help="SQLite database for the sqlite sink")
+    parser.add_argument("--queue", default="scraper_queue", help="Queue name for the rabbitmq sink")
+    args = parser.parse_args()
+
+    total = run_pipeline(iter_products(args.categories or CATEGORIES, args.max_pages), create_sink(args))
+    print(f"Crawled {total} products with {http_pool.stats['requests']} HTTP requests.")
+    http_pool.close()
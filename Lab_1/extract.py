@@ -0,0 +1,149 @@
+# Copied into Lab_2 and Lab_3: edit the Lab_1 version and run sync_shared.py --write
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml is optional, the strainer backend only needs BeautifulSoup
+    etree = lxml_html = None
+
+# Class lists the scrapers look for; matching is on class tokens, so their order in the page does not matter
+PRODUCT_BLOCK = ("product-block",)
+PRODUCT_LINK = ("product-text",)
+PRODUCT_PRICE = ("text-blue", "text-xl", "font-bold", "dark:text-white")
+DETAIL_LABEL = ("cursor-pointer", "font-semibold")
+
+NEXT_LINK_RE = re.compile(r"<(?:a|link)\b[^>]*\brel=[\"']?next\b[^>]*>", re.IGNORECASE)
+HREF_RE = re.compile(r"\bhref=[\"']([^\"']*)[\"']", re.IGNORECASE)
+PAGE_LINK_RE = re.compile(r"\bhref=[\"'][^\"']*[?&]page=(\d+)", re.IGNORECASE)
+
+
+def has_classes(required):
+    required = set(required)
+
+    def match(value):
+        if not value:
+            return False
+        classes = value if isinstance(value, list) else value.split()
+        return required.issubset(classes)
+    return match
+
+
+def class_xpath(tag, classes):
+    conditions = " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in classes)
+    return f"{tag}[{conditions}]"
+
+
+class StrainerBackend:
+    """BeautifulSoup restricted by SoupStrainers, so only the product blocks or the detail label become a tree."""
+
+    name = "strainer"
+
+    def __init__(self, parser=None):
+        self.parser = parser or ("lxml" if etree is not None else "html.parser")
+        self.block_match = has_classes(PRODUCT_BLOCK)
+        self.listing_strainer = SoupStrainer("div", class_=self.block_match)
+        self.detail_strainer = SoupStrainer("label", class_=has_classes(DETAIL_LABEL))
+        self.link_match = has_classes(PRODUCT_LINK)
+        self.price_match = has_classes(PRODUCT_PRICE)
+
+    def listing(self, html):
+        soup = BeautifulSoup(html, self.parser, parse_only=self.listing_strainer)
+        for block in soup.find_all("div", class_=self.block_match):
+            anchor = block.find("a", class_=self.link_match)
+            price = block.find("span", class_=self.price_match)
+            if anchor is None or price is None or not anchor.get("href"):
+                continue
+            yield anchor.text, " ".join(price.text.split()), anchor["href"]
+
+    def detail_info(self, html):
+        label = BeautifulSoup(html, self.parser, parse_only=self.detail_strainer).find("label")
+        return label.text.strip() if label is not None else None
+
+
+class LxmlBackend:
+    """lxml's C parser with XPath expressions compiled once and reused for every page."""
+
+    name = "lxml"
+
+    def __init__(self):
+        self.blocks = etree.XPath("//" + class_xpath("div", PRODUCT_BLOCK))
+        self.anchor = etree.XPath(".//" + class_xpath("a", PRODUCT_LINK))
+        self.price = etree.XPath(".//" + class_xpath("span", PRODUCT_PRICE))
+        self.label = etree.XPath("//" + class_xpath("label", DETAIL_LABEL))
+
+    def listing(self, html):
+        if not html.strip():
+            return
+        root = lxml_html.fromstring(html)
+        for block in self.blocks(root):
+            anchors = self.anchor(block)
+            prices = self.price(block)
+            if not anchors or not prices or not anchors[0].get("href"):
+                continue
+            yield anchors[0].text_content(), " ".join(prices[0].text_content().split()), anchors[0].get("href")
+
+    def detail_info(self, html):
+        if not html.strip():
+            return None
+        labels = self.label(lxml_html.fromstring(html))
+        return labels[0].text_content().strip() if labels else None
+
+
+class SoupBackend:
+    """The full html.parser tree the scrapers used originally, kept as the benchmark baseline."""
+
+    name = "soup"
+
+    def listing(self, html):
+        soup = BeautifulSoup(html, "html.parser")
+        for block in soup.find_all("div", class_="product-block"):
+            anchor = block.find("a", class_="product-text")
+            price = block.find("span", class_="text-blue text-xl font-bold dark:text-white")
+            if anchor is None or price is None or not anchor.get("href"):
+                continue
+            yield anchor.text, " ".join(price.text.split()), anchor["href"]
+
+    def detail_info(self, html):
+        label = BeautifulSoup(html, "html.parser").find("label", class_="cursor-pointer font-semibold")
+        return label.text.strip() if label is not None else None
+
+
+BACKENDS = {"lxml": LxmlBackend, "strainer": StrainerBackend, "soup": SoupBackend}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != "lxml" or etree is not None]
+
+
+def get_backend(name=None):
+    """Return the named backend, or the fastest one installed."""
+    if name is None:
+        name = "lxml" if etree is not None else "strainer"
+    if name not in available_backends():
+        raise ValueError(f"Extraction backend {name!r} is not available")
+    return BACKENDS[name]()
+
+
+default_backend = get_backend()
+
+
+def extract_listing(html, backend=None):
+    """Yield (name, price, link) for every product block on a listing page."""
+    return (backend or default_backend).listing(html)
+
+
+def extract_detail_info(html, backend=None):
+    """Return the text of the detail page's price-with-interest label, or None."""
+    return (backend or default_backend).detail_info(html)
+
+
+def extract_pagination(html):
+    """Return (rel="next" href or None, highest ?page=N number linked) without building a tree."""
+    next_href = None
+    tag = NEXT_LINK_RE.search(html)
+    if tag:
+        href = HREF_RE.search(tag.group(0))
+        next_href = href.group(1) if href else None
+    pages = [int(number) for number in PAGE_LINK_RE.findall(html)]
+    return next_href, max(pages, default=0)
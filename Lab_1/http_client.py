@@ -0,0 +1,232 @@
+import socket
+import ssl
+import threading
+import time
+
+
+class HTTPResponse:
+    def __init__(self, version, status, reason, headers, body):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # Header names are lower-cased
+        self.body = body
+
+    def text(self, encoding="utf-8"):
+        return self.body.decode(encoding, errors="replace")
+
+    def raw(self):
+        """Rebuild the response as one string, the way send_http_request used to return it."""
+        lines = [f"{self.version} {self.status} {self.reason}"]
+        for name, value in self.headers.items():
+            # The body is already de-chunked, so the framing header no longer applies
+            if name != "transfer-encoding":
+                lines.append(f"{name}: {value}")
+        return "\r\n".join(lines) + "\r\n\r\n" + self.text()
+
+
+class PooledConnection:
+    def __init__(self, sock, key):
+        self.sock = sock
+        self.key = key
+        self.rfile = sock.makefile("rb")
+        self.last_used = time.monotonic()
+        self.requests_served = 0
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class HTTPConnectionPool:
+    """Keeps idle HTTP/1.1 connections per (host, port, scheme) so repeated requests skip the TCP and TLS handshakes.
+
+    With keep_alive=False every request opens its own connection and sends
+    "Connection: close", which is how send_http_request used to behave.
+    """
+
+    def __init__(self, max_per_host=4, timeout=10.0, idle_timeout=15.0, keep_alive=True, verify=False):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.keep_alive = keep_alive
+
+        self.context = ssl.create_default_context()
+        if not verify:
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE  # Skip SSL verification
+
+        self._idle = {}  # (host, port, use_https) -> [PooledConnection]
+        self._sessions = {}  # (host, port) -> ssl.SSLSession, reused for TLS session resumption
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "handshakes": 0, "resumed_sessions": 0, "reused": 0}
+
+    def request(self, host, path, use_https=True, method="GET", headers=None, port=None):
+        port = port or (443 if use_https else 80)
+        key = (host, port, use_https)
+        request = self._build_request(host, path, method, headers)
+
+        # A pooled socket may have been closed by the server while idle, so one retry on a fresh connection is allowed
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            try:
+                conn.sock.sendall(request)
+                response, reusable = self._read_response(conn.rfile, method)
+            except (OSError, ConnectionError, ValueError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+
+            conn.requests_served += 1
+            with self._lock:
+                self.stats["requests"] += 1
+            if use_https:
+                self._remember_session(conn)
+            if self.keep_alive and reusable:
+                self._release(conn)
+            else:
+                conn.close()
+            return response
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _build_request(self, host, path, method, headers):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}",
+                 "Connection: keep-alive" if self.keep_alive else "Connection: close"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                conn = connections.pop()
+                if now - conn.last_used < self.idle_timeout:
+                    self.stats["reused"] += 1
+                    return conn, True
+                conn.close()
+        return self._connect(key), False
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        with self._lock:
+            connections = self._idle.setdefault(conn.key, [])
+            if len(connections) < self.max_per_host:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def _connect(self, key):
+        host, port, use_https = key
+        sock = socket.create_connection((host, port), timeout=self.timeout)
+        if use_https:
+            with self._lock:
+                session = self._sessions.get((host, port))
+            try:
+                sock = self.context.wrap_socket(sock, server_hostname=host, session=session)
+            except Exception:
+                sock.close()
+                raise
+        with self._lock:
+            self.stats["connections"] += 1
+            if use_https:
+                self.stats["handshakes"] += 1
+                if sock.session_reused:
+                    self.stats["resumed_sessions"] += 1
+        return PooledConnection(sock, key)
+
+    def _remember_session(self, conn):
+        # TLS 1.3 tickets only arrive after the first read, so the session is picked up after a response
+        session = conn.sock.session
+        if session is not None:
+            host, port, _ = conn.key
+            with self._lock:
+                self._sessions[(host, port)] = session
+
+    def _read_response(self, rfile, method):
+        status_line = rfile.readline(65537)
+        if not status_line:
+            raise ConnectionError("Connection closed before a response was received")
+        version, status, reason = self._parse_status_line(status_line)
+        headers = self._read_headers(rfile)
+
+        # Skip interim 1xx responses (e.g. 100 Continue)
+        while 100 <= status < 200:
+            version, status, reason = self._parse_status_line(rfile.readline(65537))
+            headers = self._read_headers(rfile)
+
+        connection = headers.get("connection", "").lower()
+        reusable = connection != "close" and (version != "HTTP/1.0" or connection == "keep-alive")
+
+        if method == "HEAD" or status in (204, 304):
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = self._read_chunked(rfile)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            body = rfile.read(length)
+            if len(body) < length:
+                raise ConnectionError("Connection closed before the full body was received")
+        else:
+            # No framing information: the body ends when the server closes the connection
+            body = rfile.read()
+            reusable = False
+
+        return HTTPResponse(version, status, reason, headers, body), reusable
+
+    @staticmethod
+    def _parse_status_line(line):
+        parts = line.decode("iso-8859-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise ValueError(f"Malformed status line: {line!r}")
+        reason = parts[2] if len(parts) == 3 else ""
+        return parts[0], int(parts[1]), reason
+
+    @staticmethod
+    def _read_headers(rfile):
+        headers = {}
+        while True:
+            line = rfile.readline(65537)
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("iso-8859-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+    @staticmethod
+    def _read_chunked(rfile):
+        chunks = []
+        while True:
+            size_line = rfile.readline(65537)
+            if not size_line:
+                raise ConnectionError("Connection closed inside a chunked body")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                break
+            chunk = rfile.read(size)
+            if len(chunk) < size:
+                raise ConnectionError("Connection closed inside a chunked body")
+            chunks.append(chunk)
+            rfile.readline(65537)  # CRLF after each chunk
+        # Discard optional trailer headers
+        while rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
@@ -0,0 +1,187 @@
+import json
+import math
+import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the array-backed columns work without it
+    np = None
+
+BASE_CURRENCY = "MDL"
+# MDL per one unit of each currency
+DEFAULT_RATES = {"MDL": 1.0, "EUR": 20.0}
+
+
+def check_rate(currency, rate):
+    # A zero, negative, infinite or NaN rate would only fail later, as a division by zero or a nonsense price
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not math.isfinite(rate) or rate <= 0:
+        raise ValueError(f"Exchange rate for {currency} must be a positive number, got {rate!r}")
+    return float(rate)
+
+
+class ExchangeRates:
+    """Exchange rates expressed as the amount of MDL one unit of each currency is worth."""
+
+    def __init__(self, rates=None):
+        self.rates = dict(DEFAULT_RATES)
+        for currency, rate in (rates or {}).items():
+            self.rates[currency] = check_rate(currency, rate)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_env(cls, variable="EXCHANGE_RATES"):
+        """Read rates like "EUR=19.6,USD=17.8" from an environment variable."""
+        rates = {}
+        for item in filter(None, os.environ.get(variable, "").split(",")):
+            currency, _, rate = item.partition("=")
+            currency = currency.strip().upper()
+            try:
+                rates[currency] = float(rate)
+            except ValueError:
+                raise ValueError(f"Invalid {variable} entry {item.strip()!r}, expected CURRENCY=RATE "
+                                 f"like EUR=19.6") from None
+            if not currency:
+                raise ValueError(f"Invalid {variable} entry {item.strip()!r}, the currency is missing")
+        try:
+            return cls(rates)
+        except ValueError as e:
+            raise ValueError(f"Invalid {variable}: {e}") from None
+
+    def rate(self, currency):
+        try:
+            return self.rates[currency]
+        except KeyError:
+            raise ValueError(f"No exchange rate for {currency}") from None
+
+    def factor(self, from_currency, to_currency):
+        return self.rate(from_currency) / self.rate(to_currency)
+
+    def convert(self, amount, from_currency, to_currency):
+        return amount * self.factor(from_currency, to_currency)
+
+
+def percentile(sorted_values, q):
+    # Linear interpolation between closest ranks, the same method as numpy.percentile's default
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class ProductBatch:
+    """Prices and currencies of many products held as columns instead of one dict per product.
+
+    Columns are NumPy arrays when NumPy is installed (or use_numpy=True) and
+    array.array otherwise. rows holds the position of every price in the
+    records the batch was built from, so to_records() can rebuild the dicts
+    after filtering.
+    """
+
+    def __init__(self, prices, codes, currencies, rows=None, records=None, use_numpy=None):
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy:
+            self.prices = np.asarray(prices, dtype=np.float64)
+            self.codes = np.asarray(codes, dtype=np.int16)
+            self.rows = np.arange(len(self.prices)) if rows is None else np.asarray(rows, dtype=np.int64)
+        else:
+            self.prices = prices if isinstance(prices, array) else array("d", prices)
+            self.codes = codes if isinstance(codes, array) else array("h", codes)
+            self.rows = array("q", range(len(self.prices)) if rows is None else rows)
+        self.currencies = list(currencies)
+        self.records = records
+
+    @classmethod
+    def from_records(cls, records, currency=BASE_CURRENCY, price_key="price", use_numpy=None):
+        records = records if isinstance(records, list) else list(records)
+        prices = array("d", [record[price_key] for record in records])
+        codes = array("h", bytes(2 * len(records)))  # Every record starts in the same currency
+        return cls(prices, codes, [currency], records=records, use_numpy=use_numpy)
+
+    @classmethod
+    def from_columns(cls, prices, currencies, use_numpy=None):
+        """Build a batch from a price sequence and a parallel sequence of currency names."""
+        names = []
+        index = {}
+        codes = array("h")
+        for currency in currencies:
+            code = index.get(currency)
+            if code is None:
+                code = index[currency] = len(names)
+                names.append(currency)
+            codes.append(code)
+        return cls(array("d", prices), codes, names, use_numpy=use_numpy)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def _derive(self, prices, codes, rows, currencies=None):
+        return ProductBatch(prices, codes, currencies or self.currencies, rows, self.records, self.use_numpy)
+
+    def convert(self, to_currency, rates=None):
+        """Return a batch with every price converted to to_currency."""
+        rates = rates or ExchangeRates()
+        factors = [rates.factor(currency, to_currency) for currency in self.currencies]
+        if self.use_numpy:
+            prices = self.prices * np.asarray(factors)[self.codes]
+            codes = np.zeros(len(prices), dtype=np.int16)
+        elif len(factors) == 1:
+            factor = factors[0]
+            prices = array("d", [price * factor for price in self.prices])
+            codes = array("h", bytes(2 * len(prices)))
+        else:
+            prices = array("d", [price * factors[code] for price, code in zip(self.prices, self.codes)])
+            codes = array("h", bytes(2 * len(prices)))
+        return self._derive(prices, codes, self.rows, [to_currency])
+
+    def filter_range(self, min_price, max_price):
+        """Return the products whose price lies in [min_price, max_price]."""
+        if self.use_numpy:
+            mask = (self.prices >= min_price) & (self.prices <= max_price)
+            return self._derive(self.prices[mask], self.codes[mask], self.rows[mask])
+        keep = [i for i, price in enumerate(self.prices) if min_price <= price <= max_price]
+        return self._derive(array("d", [self.prices[i] for i in keep]), array("h", [self.codes[i] for i in keep]),
+                            array("q", [self.rows[i] for i in keep]))
+
+    def total(self):
+        if self.use_numpy:
+            return float(self.prices.sum())
+        return sum(self.prices)
+
+    def stats(self, percentiles=(50, 90, 99)):
+        """Count, total, min, max, mean and percentiles of the prices, per currency."""
+        result = {}
+        for code, currency in enumerate(self.currencies):
+            if self.use_numpy:
+                values = self.prices[self.codes == code]
+                if not len(values):
+                    continue
+                points = np.percentile(values, percentiles) if percentiles else []
+                summary = {"count": int(len(values)), "total": float(values.sum()), "min": float(values.min()),
+                           "max": float(values.max()), "mean": float(values.mean())}
+            else:
+                values = sorted(price for price, c in zip(self.prices, self.codes) if c == code)
+                if not values:
+                    continue
+                points = [percentile(values, q) for q in percentiles]
+                total = sum(values)
+                summary = {"count": len(values), "total": total, "min": values[0], "max": values[-1],
+                           "mean": total / len(values)}
+            for q, value in zip(percentiles, points):
+                summary[f"p{q}"] = float(value)
+            result[currency] = summary
+        return result
+
+    def to_records(self, price_key="price"):
+        """Rebuild the source dicts with their current (converted) prices."""
+        if self.records is None:
+            raise ValueError("Batch was not built from records")
+        prices = self.prices.tolist()
+        rows = self.rows.tolist()
+        return [{**self.records[row], price_key: price} for row, price in zip(rows, prices)]
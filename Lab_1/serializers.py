@@ -0,0 +1,405 @@
+import re
+from functools import lru_cache
+from json.encoder import encode_basestring as json_string
+from xml.sax.saxutils import escape as xml_escape
+
+# Streaming writers for the custom, JSON and XML product formats.
+#
+# Each format has an encode_* function for a single value, an iter_* generator
+# that yields one encoded chunk per top-level item and a dump_* function that
+# writes those chunks to a file-like object. The top-level value may be a list
+# or any other iterable (e.g. a generator of records), so a catalog never has
+# to be held in memory as one string.
+
+WRITE_BUFFER_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+# A scalar value, or an empty match in front of a nested "[D:"/"[L:" container
+SCALAR = (r'(?:str\("([^"\\]*(?:\\.[^"\\]*)*)"\)|int\((-?\d+|True|False)\)|float\(([-+0-9.eEinfa]+)\)|(unknown)'
+          r'|(?=\[[DL]:))')
+# Dict keys are written bare, or quoted and escaped like strings when they contain a separator
+KEY = r'(?:"([^"\\]*(?:\\.[^"\\]*)*)"|([^=;\[\]"\\]*))'
+# One match covers a whole dict field or list item including the separator that follows it
+FIELD_RE = re.compile(KEY + "=" + SCALAR + r"([;\]])?", re.DOTALL)
+ITEM_RE = re.compile(SCALAR + r"([;\]])?", re.DOTALL)
+# A dict holding only scalars, like every product record, is checked with one match and its
+# fields are then read with one findall instead of a match per field
+FLAT_VALUE = r'(?:str\("[^"\\]*(?:\\.[^"\\]*)*"\)|int\((?:-?\d+|True|False)\)|float\([-+0-9.eEinfa]+\)|unknown)'
+FLAT_KEY = r'(?:"[^"\\]*(?:\\.[^"\\]*)*"|[^=;\[\]"\\]*)'
+FLAT_RECORD_RE = re.compile(r"\[D:(?:{0}={1}(?:;{0}={1})*)?\]([;\]])?".format(FLAT_KEY, FLAT_VALUE), re.DOTALL)
+FLAT_FIELD_RE = re.compile(r'(?:"([^"\\]*(?:\\.[^"\\]*)*)"|([^=;\[\]"\\]*))=(?:str\("([^"\\]*(?:\\.[^"\\]*)*)"\)'
+                           r'|int\((-?\d+)\)|int\((True|False)\)|float\(([-+0-9.eEinfa]+)\)|(u)nknown)', re.DOTALL)
+# Used by parse_uniform_records to cut the numbers out of a list of records
+INT_SPLIT_RE = re.compile(r"int\((-?\d+)\)")
+FLOAT_SPLIT_RE = re.compile(r"float\(([-+0-9.eEinfa]+)\)")
+STRING_SLOT = "\x01"
+SLOTS = {str: "str(\x01)", int: "int()", float: "float()"}
+KEY_SPECIAL_RE = re.compile(r'[=;\[\]"\\]')
+XML_NAME_RE = re.compile(r"[^\W\d][\w.-]*")
+UNESCAPE_RE = re.compile(r"\\(.)", re.DOTALL)
+
+
+def is_stream(data):
+    return not isinstance(data, (dict, str, bytes, int, float)) and hasattr(data, "__iter__")
+
+
+def custom_string(value):
+    # Backslashes and quotes are escaped so names containing them survive a round trip
+    return 'str("' + value.replace("\\", "\\\\").replace('"', '\\"') + '")'
+
+
+@lru_cache(maxsize=1024)
+def custom_key(key):
+    # Records repeat the same few keys, so their encoded form is computed once
+    key = str(key)
+    if KEY_SPECIAL_RE.search(key):
+        return '"' + key.replace("\\", "\\\\").replace('"', '\\"') + '"='
+    return key + "="
+
+
+def encode_custom(data):
+    if isinstance(data, dict):
+        return "[D:" + ";".join([custom_key(key) + encode_custom(value) for key, value in data.items()]) + "]"
+    elif isinstance(data, list):
+        return "[L:" + ";".join([encode_custom(item) for item in data]) + "]"
+    elif isinstance(data, str):
+        return custom_string(data)
+    elif isinstance(data, int):
+        return f"int({data})"
+    elif isinstance(data, float):
+        return f"float({data})"
+    else:
+        return "unknown"
+
+
+@lru_cache(maxsize=1024)
+def json_key(key):
+    # Same as custom_key, the escaped form of each key is computed once
+    return json_string(str(key)) + ": "
+
+
+def encode_json(data):
+    if isinstance(data, dict):
+        return "{" + ",".join([json_key(key) + encode_json(value) for key, value in data.items()]) + "}"
+    elif isinstance(data, (list, tuple)):
+        return "[" + ",".join([encode_json(item) for item in data]) + "]"
+    elif isinstance(data, str):
+        return json_string(data)
+    elif isinstance(data, bool):
+        return "true" if data else "false"
+    elif isinstance(data, (int, float)):
+        return str(data)
+    else:
+        return "null"
+
+
+@lru_cache(maxsize=1024)
+def xml_tags(keys):
+    """Return the (opening, closing) tag pair for each key of a record, keyed by the tuple of its keys."""
+    tags = []
+    for key in map(str, keys):
+        # Keys become element names, so anything that would not parse back as one is refused
+        if not XML_NAME_RE.fullmatch(key) or key.lower().startswith("xml"):
+            raise ValueError(f"{key!r} is not a valid XML element name")
+        tags.append((f"<{key}>", f"</{key}>"))
+    return tags
+
+
+def encode_xml(data):
+    if isinstance(data, list):
+        return "<products>" + "".join([encode_xml(item) for item in data]) + "</products>"
+    elif isinstance(data, dict):
+        tags = xml_tags(tuple(data))
+        return "<product>" + "".join([opening + encode_xml(value) + closing
+                                      for (opening, closing), value in zip(tags, data.values())]) + "</product>"
+    elif isinstance(data, str):
+        return xml_escape(data)
+    elif isinstance(data, (int, float)):
+        return str(data)
+    else:
+        return ""
+
+
+def iter_chunks(data, encode, opening, separator, closing):
+    """Yield the opening, then one encoded chunk per top-level item, then the closing."""
+    if not is_stream(data) and not isinstance(data, list):
+        yield encode(data)
+        return
+
+    yield opening
+    first = True
+    for item in data:
+        yield encode(item) if first else separator + encode(item)
+        first = False
+    yield closing
+
+
+def iter_serialize(data):
+    return iter_chunks(data, encode_custom, "[L:", ";", "]")
+
+
+def iter_serialize_to_json(data):
+    return iter_chunks(data, encode_json, "[", ",", "]")
+
+
+def iter_serialize_to_xml(data):
+    return iter_chunks(data, encode_xml, "<products>", "", "</products>")
+
+
+def write_chunks(chunks, fp, buffer_size=WRITE_BUFFER_SIZE):
+    # Small per-record chunks are grouped so the file sees few large writes
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            fp.write("".join(buffer))
+            buffer = []
+            size = 0
+    if buffer:
+        fp.write("".join(buffer))
+
+
+def dump(data, fp):
+    write_chunks(iter_serialize(data), fp)
+
+
+def dump_json(data, fp):
+    write_chunks(iter_serialize_to_json(data), fp)
+
+
+def dump_xml(data, fp):
+    write_chunks(iter_serialize_to_xml(data), fp)
+
+
+def serialize(data):
+    return "".join(iter_serialize(data))
+
+
+def serialize_to_json(data):
+    return "".join(iter_serialize_to_json(data))
+
+
+def serialize_to_xml(data):
+    return "".join(iter_serialize_to_xml(data))
+
+
+class DeserializeError(ValueError):
+    def __init__(self, message, position):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+def unescape(value):
+    return UNESCAPE_RE.sub(r"\1", value) if "\\" in value else value
+
+
+def parse_custom(text, pos=0):
+    """Parse one value of the custom format starting at pos and return (value, end position)."""
+    if text.startswith("[D:", pos):
+        result = {}
+        pos += 3
+        if text.startswith("]", pos):
+            return result, pos + 1
+        while True:
+            match = FIELD_RE.match(text, pos)
+            if match is None:
+                raise DeserializeError("Expected a key and a value", pos)
+            quoted, key, string, integer, number, unknown, separator = match.groups()
+            key = unescape(quoted) if quoted is not None else key
+            result[key], pos, separator = parse_match(text, match, string, integer, number, unknown, separator)
+            if separator == "]":
+                return result, pos
+
+    if text.startswith("[L:", pos):
+        result = []
+        pos += 3
+        if text.startswith("]", pos):
+            return result, pos + 1
+        while True:
+            value, pos, separator = parse_item(text, pos)
+            result.append(value)
+            if separator == "]":
+                return result, pos
+
+    match = ITEM_RE.match(text, pos)
+    if match is None or match.end() == pos:
+        raise DeserializeError("Unexpected input", pos)
+    string, integer, number, unknown, separator = match.groups()
+    # A scalar outside a container has no separator of its own, so one that was matched is left in place
+    value = parse_match(text, match, string, integer, number, unknown, separator or "")[0]
+    return value, match.end() - (separator is not None)
+
+
+def parse_item(text, pos):
+    """Parse one list item and the separator after it, return (value, position after it, separator)."""
+    flat = FLAT_RECORD_RE.match(text, pos)
+    if flat is not None and flat.group(1) is not None:
+        return parse_flat_record(text, pos + 3, flat.start(1) - 1), flat.end(), flat.group(1)
+    match = ITEM_RE.match(text, pos)
+    if match is None:
+        raise DeserializeError("Expected a value", pos)
+    return parse_match(text, match, *match.groups())
+
+
+def parse_flat_record(text, start, end):
+    """Build the dict for the fields between start and end, already validated by FLAT_RECORD_RE."""
+    record = {}
+    try:
+        for quoted, key, string, integer, boolean, number, unknown in FLAT_FIELD_RE.findall(text, start, end):
+            # findall reports groups that did not take part as "", and only the string may really be empty
+            if integer:
+                value = int(integer)
+            elif boolean:
+                value = boolean == "True"
+            elif number:
+                value = float(number)
+            elif unknown:
+                value = None
+            else:
+                value = unescape(string)
+            record[unescape(quoted) if quoted else key] = value
+    except ValueError:
+        raise DeserializeError("Invalid float", start) from None
+    return record
+
+
+def parse_match(text, match, string, integer, number, unknown, separator):
+    """Turn a FIELD_RE/ITEM_RE match into (value, position after the separator, separator)."""
+    pos = match.end()
+    if string is not None:
+        value = unescape(string)
+    elif integer is not None:
+        value = integer == "True" if integer in ("True", "False") else int(integer)
+    elif number is not None:
+        try:
+            value = float(number)
+        except ValueError:
+            raise DeserializeError("Invalid float", match.start()) from None
+    elif unknown is not None:
+        value = None
+    else:
+        # Nested container, parsed recursively
+        value, pos = parse_custom(text, pos)
+        if pos >= len(text) or text[pos] not in ";]":
+            raise DeserializeError("Expected ';' or ']'", pos)
+        return value, pos + 1, text[pos]
+    if separator is None:
+        raise DeserializeError("Expected ';' or ']'", pos)
+    return value, pos, separator
+
+
+def parse_uniform_records(text):
+    """Parse a list of flat records that all have the first record's keys and value types, or return None.
+
+    That is what the scrapers write. Rather than matching every field, the string
+    contents are split off at the quotes and the numbers are cut out of what is left;
+    the remainder must then be exactly the first record's layout repeated once per
+    record, and each field becomes a slice of the strings or numbers.
+    """
+    # Without backslashes every quote delimits a string, so splitting on quotes is exact
+    if not text.startswith("[L:[D:") or "\\" in text:
+        return None
+    try:
+        first = parse_item(text, 3)[0]
+    except DeserializeError:
+        return None
+    kinds = [type(value) for value in first.values()]
+    keys = list(first)
+    if not keys or any(kind not in SLOTS for kind in kinds) or any(KEY_SPECIAL_RE.search(key) or STRING_SLOT in key
+                                                       for key in keys):
+        return None
+    layout = "[D:" + ";".join([f"{key}={SLOTS[kind]}" for key, kind in zip(keys, kinds)]) + "]"
+
+    parts = text.split('"')
+    values = {str: parts[1::2]}
+    skeleton = STRING_SLOT.join(parts[0::2])
+    for kind, pattern in ((int, INT_SPLIT_RE), (float, FLOAT_SPLIT_RE)):
+        if kind in kinds:
+            pieces = pattern.split(skeleton)
+            values[kind] = pieces[1::2]
+            skeleton = SLOTS[kind].join(pieces[0::2])
+
+    count = skeleton.count("[D:")
+    if skeleton != "[L:" + ";".join([layout] * count) + "]":
+        return None
+    # The layout check alone would accept a literal "int()" or \x01 in the input, the counts would not
+    if any(len(values.get(kind, ())) != count * kinds.count(kind) for kind in SLOTS):
+        return None
+
+    # Records are filled one column at a time, which is cheaper than zipping a row per record
+    records = [{} for _ in range(count)]
+    taken = dict.fromkeys(SLOTS, 0)
+    for key, kind in zip(keys, kinds):
+        column = values[kind][taken[kind]::kinds.count(kind)]
+        taken[kind] += 1
+        try:
+            column = column if kind is str else map(kind, column)
+            for record, value in zip(records, column):
+                record[key] = value
+        except ValueError:  # e.g. float(1e), left to the full parser to report
+            return None
+    return records
+
+
+def deserialize(data):
+    # Product lists take the fast path, anything else is parsed field by field
+    records = parse_uniform_records(data)
+    if records is not None:
+        return records
+    value, pos = parse_custom(data)
+    if pos != len(data):
+        raise DeserializeError("Unexpected trailing data", pos)
+    return value
+
+
+def iter_deserialize(fp, chunk_size=READ_CHUNK_SIZE):
+    """Yield the items of a serialized top-level list from a text stream one at a time.
+
+    Only the item being parsed is kept in the buffer, so arbitrarily large
+    files can be read with constant memory. A stream holding a single
+    non-list value yields that value.
+    """
+    buffer = ""
+    eof = False
+
+    def fill(size=chunk_size):
+        nonlocal buffer, eof
+        chunk = fp.read(size)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+    while len(buffer) < 4 and not eof:
+        fill()
+    if not buffer.startswith("[L:"):
+        while not eof:
+            fill()
+        yield deserialize(buffer)
+        return
+    if buffer.startswith("]", 3):
+        return
+
+    pos = 3
+    while True:
+        try:
+            value, end, separator = parse_item(buffer, pos)
+        except DeserializeError:
+            # The item may just be cut off at the end of the buffer. The buffer at least doubles
+            # on every retry, so an item spanning many chunks is re-parsed only a few times
+            if eof:
+                raise
+            buffer, pos = buffer[pos:], 0
+            fill(max(chunk_size, len(buffer)))
+            continue
+        yield value
+        pos = end
+        if separator == "]":
+            break
+
+    while not eof:
+        fill()
+    if buffer[pos:].strip():
+        raise DeserializeError("Unexpected trailing data", pos)
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from binary_format import (FLOAT, INT, PRODUCT_SCHEMA, STRING, BatchReader, BatchWriter, BinaryFormatError,
+                           RecordDecoder, RecordEncoder, decode_batch, decode_header, encode_batch, open_batch_file)
+
+# Run with: python -m unittest test_binary_format (or pytest) from Lab_1
+
+PRODUCTS = [{"name": 'Televizor 55" 4K', "price": 5999, "link": "https://ultra.md/product/tv-1",
+             "price_with_interest": 6599},
+            {"name": "Televizor ăîșț", "price": 0, "link": "", "price_with_interest": None}]
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_batch(self):
+        self.assertEqual(decode_batch(encode_batch(PRODUCTS)), PRODUCTS)
+
+    def test_single_message(self):
+        schema = (("name", STRING), ("ratio", FLOAT), ("count", INT))
+        message = RecordEncoder(schema).encode({"name": "x", "ratio": 0.5, "count": -3})
+        self.assertEqual(RecordDecoder(schema).decode(message), {"name": "x", "ratio": 0.5, "count": -3})
+
+    def test_random_access(self):
+        reader = BatchReader(encode_batch(PRODUCTS))
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader[1], PRODUCTS[1])
+        self.assertEqual(reader.field(0, "link"), PRODUCTS[0]["link"])
+
+
+class MalformedInputTest(unittest.TestCase):
+    def test_truncated_header(self):
+        for data in [b"", b"PRB", b"PRB1", b"PRB1\x02i", b"PRB1\x01i\x05na"]:
+            with self.subTest(data=data):
+                with self.assertRaises(BinaryFormatError):
+                    decode_header(memoryview(data))
+
+    def test_unknown_type_code(self):
+        with self.assertRaises(BinaryFormatError):
+            decode_batch(b"PRB1\x01x\x01a")
+        with self.assertRaises(BinaryFormatError):
+            RecordDecoder((("a", "x"),))
+
+    def test_truncated_records(self):
+        data = encode_batch(PRODUCTS)
+        for cut in (1, 3, 10):
+            with self.subTest(cut=cut):
+                with self.assertRaises(BinaryFormatError):
+                    decode_batch(data[:-cut])
+                with self.assertRaises(BinaryFormatError):
+                    len(BatchReader(data[:-cut]))
+
+    def test_string_length_past_record(self):
+        message = bytearray(RecordEncoder().encode(PRODUCTS[0]))
+        message[5:9] = (10 ** 6).to_bytes(4, "little")
+        with self.assertRaises(BinaryFormatError):
+            RecordDecoder().decode(bytes(message))
+
+
+class BatchFileTest(unittest.TestCase):
+    def write(self, data):
+        fd, path = tempfile.mkstemp(suffix=".bin")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_written_file(self):
+        fd, path = tempfile.mkstemp(suffix=".bin")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "wb") as f:
+            BatchWriter(f, PRODUCT_SCHEMA).write_all(PRODUCTS)
+        with open_batch_file(path) as reader:
+            self.assertEqual(list(reader), PRODUCTS)
+
+    def test_empty_and_bad_files(self):
+        for data in [b"", b"not a batch"]:
+            with self.subTest(data=data):
+                with self.assertRaises(BinaryFormatError):
+                    with open_batch_file(self.write(data)):
+                        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import io
+import json
+import math
+import unittest
+from serializers import (DeserializeError, deserialize, iter_deserialize, parse_custom, parse_uniform_records,
+                         serialize, serialize_to_json, serialize_to_xml)
+
+# Run with: python -m unittest test_serializers (or pytest) from Lab_1
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def products(count):
+    return [{"name": f"Televizor Model {i} 55 4K", "price": 5000 + i, "link": f"https://ultra.md/product/tv-{i}",
+             "price_with_interest": 5500 + i} for i in range(count)]
+
+
+class RoundTripTest(unittest.TestCase):
+    def assertRoundTrip(self, value):
+        text = serialize(value)
+        self.assertEqual(deserialize(text), value)
+        return text
+
+    def test_nested_values(self):
+        self.assertRoundTrip({"products": [{"name": "TV", "tags": ["4K", "HDR"], "specs": {"size": 55}}],
+                              "empty_list": [], "empty_dict": {}, "deep": [[[1, [2]], {}], []]})
+
+    def test_escaped_strings(self):
+        for name in ['55" TV', "back\\slash", 'ends with \\', '\\"', "a;b]c[d=e", 'str("x")', "line\nbreak", ""]:
+            with self.subTest(name=name):
+                self.assertRoundTrip([{"name": name, "price": 1}])
+                self.assertRoundTrip(name)
+
+    def test_keys_with_separators(self):
+        text = self.assertRoundTrip({"a;b": 1, "x=y": 2, 'q"uote': 3, "back\\slash": 4, "[k]": 5, "": 6})
+        self.assertTrue(text.startswith('[D:"a;b"=int(1)'))
+
+    def test_plain_keys_stay_bare(self):
+        self.assertEqual(serialize({"name": "TV"}), '[D:name=str("TV")]')
+
+    def test_bools_and_unknown(self):
+        value = {"in_stock": True, "discontinued": False, "rating": None, "other": object()}
+        self.assertEqual(deserialize(serialize(value)),
+                         {"in_stock": True, "discontinued": False, "rating": None, "other": None})
+        self.assertIs(deserialize("int(True)"), True)
+
+    def test_special_floats(self):
+        result = deserialize(serialize([float("inf"), float("-inf"), float("nan"), 1.5, -2e-10]))
+        self.assertEqual(result[:2], [float("inf"), float("-inf")])
+        self.assertTrue(math.isnan(result[2]))
+        self.assertEqual(result[3:], [1.5, -2e-10])
+
+    def test_scalars(self):
+        for value in [0, -7, 3.25, "x", None, [], {}]:
+            with self.subTest(value=value):
+                self.assertRoundTrip(value)
+
+    def test_generator_input(self):
+        self.assertEqual(deserialize(serialize(item for item in products(3))), products(3))
+
+    def test_malformed_input(self):
+        for text in ["", "[L:", "[L:int(1)", "[D:a=int(x)]", "[L:int(1)]junk", "[D:a]", "float(nope)",
+                     "[L:[D:a=int(1)];[D:a=int()]]", '[L:[D:a=str("x")];[D:a=str("y")]']:
+            with self.subTest(text=text):
+                with self.assertRaises(DeserializeError):
+                    deserialize(text)
+
+
+class UniformRecordsTest(unittest.TestCase):
+    def test_matches_field_by_field_parser(self):
+        records = products(50)
+        records[10]["price_ratio"] = 1.25  # A different layout falls back to the full parser
+        for value in (products(50), [dict(record, ratio=0.5, score=-1.0) for record in products(5)], records):
+            with self.subTest(length=len(value)):
+                text = serialize(value)
+                self.assertEqual(deserialize(text), parse_custom(text)[0])
+                self.assertEqual(deserialize(text), value)
+
+    def test_falls_back_when_not_uniform(self):
+        self.assertIsNone(parse_uniform_records(serialize([{"a": 1}, {"a": "1"}])))
+        self.assertIsNone(parse_uniform_records(serialize([{"a": 1}, {"b": 1}])))
+        self.assertIsNone(parse_uniform_records(serialize([{"a": "x\\y"}])))
+        self.assertIsNone(parse_uniform_records(serialize([{"a": True}])))
+        self.assertIsNone(parse_uniform_records(serialize([{}, {}])))
+        self.assertEqual(deserialize(serialize([{}, {}])), [{}, {}])
+
+    def test_rejects_literal_slots(self):
+        # The skeleton of this input equals the layout, only the value counts give it away
+        with self.assertRaises(DeserializeError):
+            deserialize("[L:[D:a=int(1)];[D:a=int()]]")
+
+
+class IterDeserializeTest(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        value = [{"name": 'TV "55"; [new]', "price": i, "nested": {"list": [i, str(i), None, True]}} for i in range(20)]
+        text = serialize(value)
+        for chunk_size in (1, 2, 3, 7, 16, 64, len(text), len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_deserialize(io.StringIO(text), chunk_size=chunk_size)), value)
+
+    def test_non_list_and_empty(self):
+        self.assertEqual(list(iter_deserialize(io.StringIO(serialize({"a": 1})))), [{"a": 1}])
+        self.assertEqual(list(iter_deserialize(io.StringIO("[L:]"))), [])
+
+    def test_errors_are_reported(self):
+        with self.assertRaises(DeserializeError):
+            list(iter_deserialize(io.StringIO("[L:int(1);int(x)]"), chunk_size=4))
+        with self.assertRaises(DeserializeError):
+            list(iter_deserialize(io.StringIO("[L:int(1)]extra"), chunk_size=4))
+
+    def test_large_item_is_not_reparsed_per_chunk(self):
+        value = [{"items": [{"name": f"Product {i}", "price": i} for i in range(5000)]}]
+        reader = CountingReader(serialize(value))
+        self.assertEqual(list(iter_deserialize(reader, chunk_size=64)), value)
+        # Reads grow geometrically, so a ~150 KB item takes a few dozen reads rather than thousands
+        self.assertLess(reader.reads, 40)
+
+
+class OtherFormatsTest(unittest.TestCase):
+    def test_json_round_trip(self):
+        value = [{"name": 'TV "55"\n', "price": 1, "ok": True, "missing": None, "tags": ["a"], 5: 1.5}]
+        self.assertEqual(json.loads(serialize_to_json(value)),
+                         [{"name": 'TV "55"\n', "price": 1, "ok": True, "missing": None, "tags": ["a"], "5": 1.5}])
+
+    def test_xml_escapes_values_and_rejects_bad_names(self):
+        self.assertEqual(serialize_to_xml([{"name": "<b>&"}]),
+                         "<products><product><name>&lt;b&gt;&amp;</name></product></products>")
+        for key in ["a b", "1st", "a<b", "", "xmlns"]:
+            with self.subTest(key=key):
+                with self.assertRaises(ValueError):
+                    serialize_to_xml([{key: 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,49 @@
-from flask import Flask, request, jsonify
-from flask_socketio import SocketIO, join_room, leave_room, send
+import atexit
+import base64
+from flask import Flask, g, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import sqlite3
 import threading
 import json
+import re
+from db import ConnectionPool
+import batch
+import chat
+import importer
+from cache import ResponseCache
 
 app = Flask(__name__)
 socketio = SocketIO(app)  # Initialize SocketIO for WebSocket support
 
+# One pool shared by every route; each request borrows a connection and returns it on teardown
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
+
 # Database helper function
 def get_db_connection():
-    conn = sqlite3.connect("products.db")
-    conn.row_factory = sqlite3.Row  # Allows us to return rows as dictionaries
-    return conn
+    if "db" not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# Product reads are cached until the next write (or for a few seconds at most)
+response_cache = ResponseCache()
+
+@app.after_request
+def invalidate_response_cache(response):
+    # Every route other than a read may have changed products; this runs after they commit
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        response_cache.invalidate()
+    return response
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats()), 200
 
 # CRUD Operations (HTTP Server)
 
@@ -34,30 +66,221 @@ def create_product():
         return jsonify({"message": "Product created successfully"}), 201
     except sqlite3.IntegrityError:
         return jsonify({"message": "Product already exists"}), 400
-    finally:
-        conn.close()
+
+# Create, upsert, update and delete many products in one transaction
+# The body is a list of operations (see batch.py), or {"operations": [...], "atomic": true}
+# to apply all of them or none.
+@app.route('/products/batch', methods=['POST'])
+def batch_products():
+    data = request.get_json(silent=True)
+    atomic = False
+    if isinstance(data, dict):
+        atomic = bool(data.get('atomic', False))
+        data = data.get('operations')
+    if not isinstance(data, list):
+        return jsonify({"message": "Expected a list of operations"}), 400
+    if len(data) > batch.MAX_OPERATIONS:
+        return jsonify({"message": f"At most {batch.MAX_OPERATIONS} operations per batch"}), 413
+
+    report = batch.apply_batch(get_db_connection(), data, atomic)
+    return jsonify(report), 200 if report["committed"] else 409
+
+# Fields a client can pick with ?fields=, and what ?sort= accepts (prefixed with - for descending)
+FIELDS = ("id", "name", "price", "price_value", "link", "additional_info")
+SORTS = {"id": "id", "price": "price_value", "name": "name"}
+# Ranking costs time for every match, searches matching more products than this are returned by id
+MAX_RANKED_MATCHES = 2000
+
+# Cursors are opaque to clients: the sort key of the last row on a page, as base64 JSON
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, lengths=(1,)):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, list) or len(key) not in lengths or not isinstance(key[-1], int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key
+
+def product_count(cursor):
+    # Maintained by triggers on products, see db.MIGRATIONS
+    cursor.execute("SELECT row_count FROM product_stats WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row is not None else 0
+
+def parse_fields(args):
+    fields = args.get('fields')
+    columns = [field.strip() for field in fields.split(',')] if fields else list(FIELDS)
+    unknown = [column for column in columns if column not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}, expected some of {', '.join(FIELDS)}")
+    return columns
+
+def parse_sort(args):
+    sort = args.get('sort', 'id')
+    sort_column = SORTS.get(sort.lstrip('-'))
+    if sort_column is None:
+        raise ValueError(f"Unknown sort {sort!r}, expected one of {', '.join(SORTS)}")
+    return sort_column, sort.startswith('-')
+
+def build_page(rows, columns, limit, total_count, page_cursor, offset, cursor_key):
+    # The query fetched one row more than the limit when there is a next page
+    next_cursor = None
+    if limit >= 0 and len(rows) > limit:
+        rows = rows[:limit]
+        if rows:
+            next_cursor = encode_cursor(cursor_key(rows[-1]))
+
+    page = {
+        "total_count": total_count,
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "products": [{column: row[column] for column in columns} for row in rows]
+    }
+    if page_cursor is None:
+        page["offset"] = offset
+    else:
+        page["cursor"] = page_cursor
+    return page
 
 # Read (Retrieve) with Pagination
+# ?limit=&offset= pages by position. ?cursor= (empty for the first page) pages by the sort key
+# instead, which costs the same at any depth; pass back next_cursor to get the next page.
+# ?min_price=&max_price= filter on the parsed price, ?sort=price|-price|name|-name|id|-id
+# orders the rows (sorting by a column leaves out rows where it is empty) and ?fields=
+# picks the columns. Filters and sorts are answered from the price and name indexes.
 @app.route('/products', methods=['GET'])
+@response_cache.cached
 def get_products():
     limit = request.args.get('limit', default=5, type=int)
     offset = request.args.get('offset', default=0, type=int)
+    min_price = request.args.get('min_price', type=int)
+    max_price = request.args.get('max_price', type=int)
+    page_cursor = request.args.get('cursor')
+
+    try:
+        columns = parse_fields(request.args)
+        sort_column, descending = parse_sort(request.args)
+        after = decode_cursor(page_cursor, (1,) if sort_column == "id" else (2,)) if page_cursor else None
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    conditions, params = [], []
+    if min_price is not None:
+        conditions.append("price_value >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price_value <= ?")
+        params.append(max_price)
+    if sort_column != "id":
+        conditions.append(f"{sort_column} IS NOT NULL")
 
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM products LIMIT ? OFFSET ?", (limit, offset))
-    products = cursor.fetchall()
+    if min_price is not None or max_price is not None:
+        cursor.execute(f"SELECT COUNT(*) FROM products WHERE {' AND '.join(conditions)}", params)
+        total_count = cursor.fetchone()[0]
+    else:
+        total_count = product_count(cursor)
+        if sort_column != "id":
+            # Counting the left out rows is an index lookup, counting the others would scan
+            cursor.execute(f"SELECT COUNT(*) FROM products WHERE {sort_column} IS NULL")
+            total_count -= cursor.fetchone()[0]
+
+    order, comparison = ("DESC", "<") if descending else ("ASC", ">")
+    if sort_column == "id":
+        order_by = f"id {order}"
+        if after is not None:
+            conditions.append(f"id {comparison} ?")
+    else:
+        order_by = f"{sort_column} {order}, id {order}"
+        if after is not None:
+            conditions.append(f"({sort_column}, id) {comparison} (?, ?)")
+    if after is not None:
+        params.extend(after)
+    # The id and sort column are needed for next_cursor even when not asked for
+    selected = columns + [column for column in ("id", sort_column) if column not in columns]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT {', '.join(selected)} FROM products{where} ORDER BY {order_by} LIMIT ?"
+    # One extra row tells whether there is a next page
+    params.append(limit + 1 if limit >= 0 else -1)
+    if page_cursor is None:
+        sql += " OFFSET ?"
+        params.append(offset)
+    cursor.execute(sql, params)
+
+    if sort_column == "id":
+        cursor_key = lambda row: [row["id"]]
+    else:
+        cursor_key = lambda row: [row[sort_column], row["id"]]
+    return jsonify(build_page(cursor.fetchall(), columns, limit, total_count, page_cursor, offset, cursor_key)), 200
+
+def search_query(text):
+    # Every word of the input has to match, as a word or the start of one. Words are
+    # quoted so FTS5 operators typed by the user (AND, NEAR, -, *) are searched literally.
+    # Single characters are only matched as whole words: prefixes that short are not
+    # indexed and would match most of the catalog anyway.
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' if len(word) > 1 else f'"{word}"' for word in words)
+
+# Search by name and additional_info
+# ?q= is matched against the products_fts index and results are ordered by relevance
+# (bm25, name weighted over additional_info), or by id when more than MAX_RANKED_MATCHES
+# products match. Takes the same limit/offset/cursor and fields parameters as GET /products.
+@app.route('/products/search', methods=['GET'])
+@response_cache.cached
+def search_products():
+    query = search_query(request.args.get('q', ''))
+    limit = request.args.get('limit', default=5, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    page_cursor = request.args.get('cursor')
+    if not query:
+        return jsonify({"message": "The q parameter needs at least one word"}), 400
 
-    cursor.execute("SELECT COUNT(*) FROM products")
-    total_count = cursor.fetchone()[0]
+    try:
+        columns = parse_fields(request.args)
+        after = decode_cursor(page_cursor, (1, 2)) if page_cursor else None
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-    return jsonify({
-        "total_count": total_count,
-        "offset": offset,
-        "limit": limit,
-        "products": [dict(product) for product in products]
-    }), 200
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH ?", (query,))
+    total_count = cursor.fetchone()[0]
+    # A cursor keeps the order of the page it came from: [rank, id] or [id]
+    ranked = len(after) == 2 if after is not None else total_count <= MAX_RANKED_MATCHES
+
+    # rank is the bm25 score configured in db.MIGRATIONS, lower is better. The page is picked
+    # from the index alone and only its rows are joined with products.
+    key = "rank, rowid" if ranked else "rowid"
+    sql = f"SELECT {key} FROM products_fts WHERE products_fts MATCH ?"
+    params = [query]
+    if after is not None:
+        sql += f" AND ({key}) > ({', '.join('?' * len(after))})"
+        params.extend(after)
+    sql += f" ORDER BY {key} LIMIT ?"
+    params.append(limit + 1 if limit >= 0 else -1)
+    if page_cursor is None:
+        sql += " OFFSET ?"
+        params.append(offset)
+    selected = "".join(f", p.{column}" for column in columns if column != "id")
+    score = ", m.rank AS score" if ranked else ""
+    order = "m.rank, m.rowid" if ranked else "m.rowid"
+    cursor.execute(f'''SELECT p.id{selected}{score}
+                      FROM ({sql}) AS m JOIN products p ON p.id = m.rowid
+                      ORDER BY {order}''', params)
+
+    if ranked:
+        cursor_key = lambda row: [row["score"], row["id"]]
+    else:
+        cursor_key = lambda row: [row["id"]]
+    page = build_page(cursor.fetchall(), columns, limit, total_count, page_cursor, offset, cursor_key)
+    page["ranked"] = ranked
+    return jsonify(page), 200
 
 # Update (PUT)
 @app.route('/products/<int:product_id>', methods=['PUT'])
@@ -94,7 +317,9 @@ def delete_product(product_id):
     return jsonify({"message": "Product deleted successfully"}), 200
 
 # Route to handle file uploads (Multipart Form Data)
-# Route to handle file uploads (Multipart Form Data)
+# The file is a JSON array, NDJSON or CSV (by extension, or ?format=json|ndjson|csv).
+# It is parsed as it is read and inserted ?batch_size= rows per transaction; the response
+# has the inserted/ignored/invalid counts of every batch.
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -104,116 +329,76 @@ def upload_file():
     if file.filename == '':
         return jsonify({"message": "No selected file"}), 400
 
-    conn = None
-    try:
-        # Decode file contents to a string and parse it as JSON
-        data = file.read().decode("utf-8")
-        json_data = json.loads(data)
-
-        # Check if json_data is a list
-        if not isinstance(json_data, list):
-            return jsonify({"message": "Uploaded file is not in expected format (should be a list of products)."}), 400
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        for item in json_data:
-            # Ensure each item is a dictionary
-            if not isinstance(item, dict):
-                return jsonify({"message": "Each product entry must be a JSON object."}), 400
-
-            name = item.get('name')
-            price = item.get('price')
-            link = item.get('link')
-            additional_info = item.get('additional_info', '')
-
-            # Insert the product data into the database
-            cursor.execute('''INSERT OR IGNORE INTO products (name, price, link, additional_info)
-                              VALUES (?, ?, ?, ?)''', (name, price, link, additional_info))
-        conn.commit()
-        return jsonify({"message": "File data inserted successfully"}), 201
+    batch_size = request.args.get('batch_size', default=importer.BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({"message": "batch_size must be at least 1"}), 400
 
-    except json.JSONDecodeError as e:
+    try:
+        items = importer.iter_items(file.stream, file.filename, request.args.get('format'))
+        report = importer.import_products(get_db_connection(), items, batch_size)
+    except (importer.ImportFormatError, UnicodeDecodeError) as e:
         return jsonify({"message": f"Error parsing file: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"message": f"Unexpected error: {str(e)}"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+    if report["error"] is not None:
+        report["message"] = f"Error parsing file: {report['error']}"
+        return jsonify(report), 400
+    report["message"] = "File data inserted successfully"
+    return jsonify(report), 201
 
 # WebSocket Chat Room (WebSocket Server)
+# The same events are served by asgi.py in single-port mode, see chat.py
+
+def flush_broadcasts():
+    # Sends what the handlers queued, one event per room per window
+    while True:
+        socketio.sleep(chat.broadcaster.window)
+        for event, args, room in chat.broadcaster.drain():
+            socketio.emit(event, args, to=room)  # A tuple is sent as separate arguments
+
+@socketio.on('connect')
+def handle_connect():
+    chat.start(lambda: socketio.start_background_task(flush_broadcasts))
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    chat.rooms.disconnect(request.sid)
 
 @socketio.on('join')
 def handle_join(data):
-    # If data is a string, try parsing it as JSON
-    if isinstance(data, str):
-        try:
-            data = json.loads(data)  # Parse the string as JSON
-        except json.JSONDecodeError:
-            print("Received data is not valid JSON:", data)
-            return
-
-    # Now data should be a dictionary, so you can safely access the 'username' and 'room' keys
-    if isinstance(data, dict):
-        username = data.get('username')
-        room = data.get('room')
-
-        if username and room:
-            join_room(room)
-            print(f"\033[92m{username} has joined the room {room}.\033[0m")  # Green color
-            send(f"{username} has joined the room {room}.", to=room)
-        else:
-            print("Invalid join data received:", data)
-    else:
-        print("Received data is not in the expected format:", data)
+    event = chat.parse_event(data, 'username', 'room', event='join',
+                             optional=('history', 'since', 'since_seq'))
+    if event is not None:
+        username, room, wants_history, since, since_seq = event
+        join_room(room)
+        chat.rooms.join(request.sid, room)
+        payload = chat.replay(room, wants_history, since, since_seq)
+        if payload is not None:
+            emit('history', payload)
+        chat.publish(room, chat.joined(username, room))
 
 @socketio.on('leave')
 def handle_leave(data):
-    # If data is a string, try parsing it as JSON
-    if isinstance(data, str):
-        try:
-            data = json.loads(data)  # Parse the string as JSON
-        except json.JSONDecodeError:
-            print("Received data is not valid JSON:", data)
-            return
-
-    # Now data should be a dictionary, so you can safely access the 'username' and 'room' keys
-    if isinstance(data, dict):
-        username = data.get('username')
-        room = data.get('room')
-
-        if username and room:
-            leave_room(room)
-            print(f"\033[91m{username} has left the room {room}.\033[0m")  # Red color
-            send(f"{username} has left the room {room}.", to=room)
-        else:
-            print("Invalid leave data received:", data)
-    else:
-        print("Received leave data is not in the expected format:", data)
-
+    event = chat.parse_event(data, 'username', 'room', event='leave')
+    if event is not None:
+        username, room = event
+        leave_room(room)
+        chat.rooms.leave(request.sid, room)
+        chat.publish(room, chat.left(username, room))
 
 @socketio.on('message')
 def handle_message(data):
-    # If data is a string, try parsing it as JSON
-    if isinstance(data, str):
-        try:
-            data = json.loads(data)  # Parse the string as JSON
-        except json.JSONDecodeError:
-            print("Received data is not valid JSON:", data)
-            return
-
-    # Now data should be a dictionary, so you can safely access the 'room' and 'message' keys
-    if isinstance(data, dict):
-        room = data.get('room')
-        message = data.get('message')
-
-        if room and message:
-            print(f"\033[94m[{room}] Message: {message}\033[0m")  # Blue color
-            send(message, to=room)
-        else:
-            print("Invalid message data received:", data)
-    else:
-        print("Received message data is not in the expected format:", data)
+    event = chat.parse_event(data, 'room', 'message')
+    if event is not None:
+        room, message = event
+        chat.publish(room, chat.received(room, message))
+
+@app.route('/chat/rooms', methods=['GET'])
+def chat_rooms():
+    # Members per room, counted by this process
+    return jsonify({"rooms": chat.rooms.counts(), "broadcast": chat.broadcaster.stats(),
+                    "history": chat.history.stats()}), 200
 
 def run_http_server():
     app.run(port=5000)
@@ -222,6 +407,7 @@ def run_websocket_server():
     socketio.run(app, port=5001, allow_unsafe_werkzeug=True)
 
 if __name__ == '__main__':
+    chat.setup_logging()
     http_thread = threading.Thread(target=run_http_server)
     websocket_thread = threading.Thread(target=run_websocket_server)
     http_thread.start()
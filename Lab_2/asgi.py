@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import socketio
+import uvicorn
+import chat
+from app import app, db_pool
+
+# Production serving mode: one asyncio server per worker process answers both the REST
+# API and the Socket.IO chat on a single port. Socket.IO runs natively on the event loop;
+# the Flask routes run in a thread pool sized to the database pool, so neither Flask nor
+# SQLite ever blocks the loop.
+#
+#   python asgi.py --port 5000 --workers 4
+#
+# Worker processes share the port, not memory: with more than one, clients must use the
+# websocket transport (long-polling needs every request of a session to reach the same
+# worker), and room broadcasts go through a unix socket bus (--bus, see bus.py) so each
+# worker sends them to its own members of the room. /chat/rooms counts the members of
+# the worker that answers it.
+
+THREADS = int(os.environ.get("ASGI_THREADS", db_pool.max_size))
+WEBSOCKET_ONLY = os.environ.get("ASGI_WEBSOCKET_ONLY") == "1"
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input for a request whose body is still arriving through ASGI receive()."""
+
+    def __init__(self, receive):
+        self._receive = receive  # Blocking: runs the coroutine on the event loop and waits
+        self._buffer = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer and not self._done:
+            message = self._receive()
+            if message["type"] == "http.disconnect":
+                self._done = True
+                break
+            self._buffer = message.get("body", b"")
+            self._done = not message.get("more_body", False)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class WSGIBridge:
+    """Serves a WSGI app to an ASGI server, one worker thread per request.
+
+    Request bodies are streamed to the app and responses are streamed back, so a large
+    /upload is not held in memory.
+    """
+
+    def __init__(self, wsgi_app, threads=THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            # Websockets are only served under /socket.io
+            await send({"type": "websocket.close", "code": 1000})
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.run, scope, receive, send, loop)
+
+    def environ(self, scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            # WSGI wants the raw path bytes as latin-1 text
+            "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+            "PATH_INFO": scope["path"].encode().decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BufferedReader(body, 64 * 1024),
+            "wsgi.input_terminated": True,  # The body ends where receive() says, length or not
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1"), value.decode("latin-1")
+            if name == "content-type":
+                key = "CONTENT_TYPE"
+            elif name == "content-length":
+                key = "CONTENT_LENGTH"
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def run(self, scope, receive, send, loop):
+        def wait(coroutine):
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+
+        def send_start():
+            response["sent"] = True
+            wait(send({"type": "http.response.start", "status": response["status"],
+                       "headers": response["headers"]}))
+
+        result = self.wsgi_app(self.environ(scope, RequestBody(lambda: wait(receive()))), start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    if not response.get("sent"):
+                        send_start()
+                    wait(send({"type": "http.response.body", "body": chunk, "more_body": True}))
+            if not response.get("sent"):
+                send_start()
+            wait(send({"type": "http.response.body", "body": b"", "more_body": False}))
+        finally:
+            # Flask releases the request's database connection here
+            if hasattr(result, "close"):
+                result.close()
+
+
+sio = socketio.AsyncServer(async_mode="asgi", transports=["websocket"] if WEBSOCKET_ONLY else None)
+
+
+async def flush_broadcasts():
+    # Same loop as app.flush_broadcasts, on the event loop
+    while True:
+        await sio.sleep(chat.broadcaster.window)
+        for event, args, room in chat.broadcaster.drain():
+            await sio.emit(event, args, to=room)
+
+
+@sio.on("connect")
+async def handle_connect(sid, environ):
+    chat.start(lambda: sio.start_background_task(flush_broadcasts))
+
+
+@sio.on("disconnect")
+async def handle_disconnect(sid):
+    chat.rooms.disconnect(sid)
+
+
+@sio.on("join")
+async def handle_join(sid, data):
+    event = chat.parse_event(data, "username", "room", event="join",
+                             optional=("history", "since", "since_seq"))
+    if event is not None:
+        username, room, wants_history, since, since_seq = event
+        await sio.enter_room(sid, room)
+        chat.rooms.join(sid, room)
+        # May read the database
+        payload = await asyncio.to_thread(chat.replay, room, wants_history, since, since_seq)
+        if payload is not None:
+            await sio.emit("history", payload, to=sid)
+        chat.publish(room, chat.joined(username, room))
+
+
+@sio.on("leave")
+async def handle_leave(sid, data):
+    event = chat.parse_event(data, "username", "room", event="leave")
+    if event is not None:
+        username, room = event
+        await sio.leave_room(sid, room)
+        chat.rooms.leave(sid, room)
+        chat.publish(room, chat.left(username, room))
+
+
+@sio.on("message")
+async def handle_message(sid, data):
+    event = chat.parse_event(data, "room", "message")
+    if event is not None:
+        room, message = event
+        chat.publish(room, chat.received(room, message))
+
+
+bridge = WSGIBridge(app)
+
+
+def shutdown():
+    bridge.executor.shutdown(wait=True)
+    db_pool.close_all()
+
+
+application = socketio.ASGIApp(sio, other_asgi_app=bridge, on_startup=chat.setup_logging, on_shutdown=shutdown)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the products API and the chat on one port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1, help="Server processes sharing the port")
+    parser.add_argument("--threads", type=int, default=THREADS, help="Threads running Flask routes, per worker")
+    parser.add_argument("--bus", default=os.environ.get("CHAT_BUS"),
+                        help="Chat bus, local or unix:/path (default: a socket in the temp directory with --workers)")
+    args = parser.parse_args()
+
+    # Workers import this module afresh, so their settings are passed in the environment
+    os.environ["ASGI_THREADS"] = str(args.threads)
+    if args.workers > 1:
+        os.environ["ASGI_WEBSOCKET_ONLY"] = "1"
+        if args.bus is None:
+            args.bus = f"unix:{os.path.join(tempfile.gettempdir(), f'chat-bus-{args.port}.sock')}"
+    if args.bus:
+        os.environ["CHAT_BUS"] = args.bus
+    uvicorn.run("asgi:application", host=args.host, port=args.port, workers=args.workers,
+                ws="wsproto", log_level="warning")
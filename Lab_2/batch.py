@@ -0,0 +1,130 @@
+# Copied into Lab_3: edit the Lab_2 version and run sync_shared.py --write
+import sqlite3
+
+# Applies a list of product writes in one transaction, for POST /products/batch.
+# Every operation is a dict with an "op" key:
+#   {"op": "create", "product": {...}}               insert, fails if the link exists
+#   {"op": "upsert", "product": {...}}               insert, or update the product with that link
+#   {"op": "update", "id": 1, "product": {...}}      change the given fields (or pick it by "link")
+#   {"op": "delete", "id": 1}                        (or by "link")
+# Each one gets a result with an HTTP-like status. One failing operation doesn't affect the
+# others, unless the batch is atomic: then the first failure rolls the whole batch back.
+
+MAX_OPERATIONS = 10_000
+COLUMNS = ("name", "price", "link", "additional_info")
+UPDATABLE = ("name", "price", "additional_info")
+
+
+class OperationError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class BatchAborted(Exception):
+    pass
+
+
+def product_values(operation):
+    product = operation.get("product")
+    if not isinstance(product, dict):
+        raise OperationError(400, "product must be an object")
+    values = tuple(product.get(column) for column in COLUMNS)
+    if any(isinstance(value, (dict, list)) for value in values):
+        raise OperationError(400, "Product fields must be strings or numbers")
+    return product, values
+
+
+def target(operation):
+    # The product an update or delete applies to
+    if isinstance(operation.get("id"), int):
+        return "id", operation["id"]
+    if isinstance(operation.get("link"), str):
+        return "link", operation["link"]
+    raise OperationError(400, "An id or a link is required")
+
+
+def create(cursor, operation):
+    _, values = product_values(operation)
+    try:
+        cursor.execute("INSERT INTO products (name, price, link, additional_info) VALUES (?, ?, ?, ?)", values)
+    except sqlite3.IntegrityError:
+        raise OperationError(400, "Product already exists") from None
+    return 201, "Product created successfully", cursor.lastrowid
+
+
+def upsert(cursor, operation):
+    _, values = product_values(operation)
+    if not values[2]:
+        raise OperationError(400, "An upsert needs a link")
+    # Only an actual change rewrites the row, so the indexes are not touched for nothing
+    cursor.execute('''INSERT INTO products (name, price, link, additional_info) VALUES (?, ?, ?, ?)
+                      ON CONFLICT (link) DO UPDATE SET name = excluded.name, price = excluded.price,
+                                                       additional_info = excluded.additional_info
+                      WHERE name IS NOT excluded.name OR price IS NOT excluded.price
+                         OR additional_info IS NOT excluded.additional_info
+                      RETURNING id''', values)
+    row = cursor.fetchone()
+    if row is None:
+        # Nothing changed, so nothing was returned
+        cursor.execute("SELECT id FROM products WHERE link = ?", (values[2],))
+        row = cursor.fetchone()
+    return 200, "Product saved", row[0]
+
+
+def update(cursor, operation):
+    product, _ = product_values(operation)
+    key, value = target(operation)
+    columns = [column for column in UPDATABLE if column in product]
+    if not columns:
+        raise OperationError(400, f"Nothing to update, expected some of {', '.join(UPDATABLE)}")
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    cursor.execute(f"UPDATE products SET {assignments} WHERE {key} = ? RETURNING id",
+                   [product[column] for column in columns] + [value])
+    row = cursor.fetchone()
+    if row is None:
+        raise OperationError(404, "Product not found")
+    return 200, "Product updated successfully", row[0]
+
+
+def delete(cursor, operation):
+    key, value = target(operation)
+    cursor.execute(f"DELETE FROM products WHERE {key} = ? RETURNING id", (value,))
+    row = cursor.fetchone()
+    if row is None:
+        raise OperationError(404, "Product not found")
+    return 200, "Product deleted successfully", row[0]
+
+
+OPERATIONS = {"create": create, "upsert": upsert, "update": update, "delete": delete}
+
+
+def apply_batch(conn, operations, atomic=False):
+    """Apply the operations in one transaction and return a result for each.
+
+    In an atomic batch the first failure rolls everything back; the operations after it
+    are not attempted and have status None.
+    """
+    results = []
+    cursor = conn.cursor()
+    committed = True
+    try:
+        with conn:
+            for index, operation in enumerate(operations):
+                try:
+                    if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+                        raise OperationError(400, f"op must be one of {', '.join(OPERATIONS)}")
+                    status, message, product_id = OPERATIONS[operation["op"]](cursor, operation)
+                    results.append({"index": index, "status": status, "message": message, "id": product_id})
+                except OperationError as e:
+                    results.append({"index": index, "status": e.status, "message": e.message, "id": None})
+                    if atomic:
+                        raise BatchAborted() from None
+    except BatchAborted:
+        committed = False
+        results.extend({"index": index, "status": None, "message": "Not applied", "id": None}
+                       for index in range(len(results), len(operations)))
+    failed = sum(1 for result in results if result["status"] is not None and result["status"] >= 300)
+    return {"results": results, "committed": committed, "failed": failed,
+            "succeeded": len(operations) - failed if committed else 0}
@@ -0,0 +1,163 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Load test for the /products endpoints. Each worker thread keeps one HTTP
+# connection open and sends a mix of reads and writes for a fixed duration.
+# With --serve the app is started in-process on a temporary database seeded
+# with --rows products, otherwise --url points at a running server (such as
+# python asgi.py). --workers 16,64,256 repeats the run at each concurrency level.
+
+
+def seed_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS products (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT,
+                        price TEXT,
+                        link TEXT UNIQUE,
+                        additional_info TEXT
+                    )''')
+    conn.executemany("INSERT INTO products (name, price, link, additional_info) VALUES (?, ?, ?, ?)",
+                     ((f"Product {i}", f"{random.randint(500, 60000)} lei", f"https://ultra.md/product/{i}", "")
+                      for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def serve_in_process(rows):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    seed_database(path, rows)
+    os.environ["PRODUCTS_DB"] = path
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, path
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+class Worker(threading.Thread):
+    def __init__(self, url, deadline, rows, write_ratio, paths):
+        super().__init__(daemon=True)
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.deadline = deadline
+        self.rows = rows
+        self.write_ratio = write_ratio
+        self.paths = paths
+        self.latencies = {}
+        self.statuses = {}
+
+    def request(self, conn, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        while time.perf_counter() < self.deadline:
+            if random.random() < self.write_ratio:
+                kind = "PUT"
+                product_id = random.randint(1, max(1, self.rows))
+                path, method = f"/products/{product_id}", "PUT"
+                body = {"name": f"Product {product_id}", "price": f"{random.randint(500, 60000)} lei",
+                        "additional_info": "updated"}
+            else:
+                kind = "GET"
+                path = random.choice(self.paths).format(offset=random.randint(0, max(0, self.rows - 20)))
+                method, body = "GET", None
+            start = time.perf_counter()
+            try:
+                status = self.request(conn, method, path, body)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                status = "error"
+            self.latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        conn.close()
+
+
+def open_file_descriptors():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def run_level(url, concurrency, duration, rows, write_ratio, paths):
+    deadline = time.perf_counter() + duration
+    workers = [Worker(url, deadline, rows, write_ratio, paths) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return workers
+
+
+def report(workers, concurrency, duration):
+    for kind in ("GET", "PUT"):
+        latencies = sorted(value for worker in workers for value in worker.latencies.get(kind, []))
+        if not latencies:
+            continue
+        print(f"{concurrency:>7}  {kind:<8}{len(latencies):>8}{len(latencies) / duration:>9.0f}"
+              f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+              f"{percentile(latencies, 99) * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}")
+    statuses = {}
+    for worker in workers:
+        for status, count in worker.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    print(f"{'':>9}Status codes: {dict(sorted(statuses.items(), key=str))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the products API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000",
+                        help="Server to test, e.g. the dev server or python asgi.py --workers 4")
+    parser.add_argument("--serve", action="store_true", help="Run the app in-process on a temporary database")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--workers", default="16",
+                        help="Concurrent connections; a comma-separated list runs one round per level, e.g. 16,64,256")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per round")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Fraction of requests that are PUTs")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.workers.split(",")]
+
+    url, server, db_path = args.url, None, None
+    if args.serve:
+        url, server, db_path = serve_in_process(args.rows)
+    fds_before = open_file_descriptors()
+
+    paths = ["/products?limit=20&offset={offset}", "/products?limit=5&offset=0"]
+    print(f"{args.duration:.0f}s per round against {url}")
+    print(f"{'workers':>7}  {'request':<8}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for concurrency in levels:
+        workers = run_level(url, concurrency, args.duration, args.rows, args.write_ratio, paths)
+        report(workers, concurrency, args.duration)
+
+    if server is not None:
+        print(f"Open file descriptors: {fds_before} before, {open_file_descriptors()} after")
+        server.shutdown()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
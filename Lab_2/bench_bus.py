@@ -0,0 +1,74 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from bus import UnixSocketBus
+
+# Checks and times chat delivery across processes. Starts --workers processes on one
+# UnixSocketBus; each publishes --messages messages and counts what it is delivered.
+# Every worker should receive every message, its own included.
+#
+#   python bench_bus.py --workers 4 --messages 20000
+
+
+def worker(index, path, messages, rooms, barrier, results):
+    received = 0
+    done = threading.Event()
+    expected = messages * barrier.parties
+    seen = set()
+    lock = threading.Lock()
+
+    def deliver(room, message):
+        nonlocal received
+        with lock:
+            received += 1
+            seen.add(message["from"])
+            if received == expected:
+                done.set()
+
+    bus = UnixSocketBus(path)
+    bus.start(deliver)
+    barrier.wait()
+    start = time.perf_counter()
+    for i in range(messages):
+        bus.publish(f"room-{i % rooms}", {"from": index, "seq": i})
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+    results.put((index, bus.is_hub, received, sorted(seen), elapsed))
+    # Stay on the bus until everyone has their messages
+    barrier.wait()
+    bus.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat delivery across processes on a unix socket bus")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=10000, help="Messages published by each worker")
+    parser.add_argument("--rooms", type=int, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+    barrier = multiprocessing.Barrier(args.workers)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(i, path, args.messages, args.rooms, barrier, results))
+                 for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    rows = sorted(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+
+    expected = args.messages * args.workers
+    print(f"{'worker':>6} {'role':>6} {'received':>10} {'from':>10} {'seconds':>8} {'msg/s':>9}")
+    for index, is_hub, received, senders, elapsed in rows:
+        print(f"{index:>6} {'hub' if is_hub else 'peer':>6} {received:>10} {len(senders):>10} "
+              f"{elapsed:>8.2f} {received / elapsed:>9.0f}")
+    complete = all(received == expected for _, _, received, _, _ in rows)
+    print(f"Every worker received all {expected} messages: {'yes' if complete else 'NO'}")
+    raise SystemExit(0 if complete else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+# Message bus for chat room broadcasts. A worker publishes (room, message) to the bus,
+# and the bus hands it to every worker's deliver callback, its own included; each worker
+# then sends it to the clients it has in that room. Pick one with CHAT_BUS:
+#
+#   local              LocalBus: one process, delivery is a function call
+#   unix:/path.sock    UnixSocketBus: every process on this machine using the same path
+#
+# With UnixSocketBus one of the workers is the hub. It listens on the socket and relays
+# every frame it gets to all the other workers. Frames are a 4-byte big-endian length
+# followed by the JSON [room, message]. The hub is whoever holds the lock on path + ".lock";
+# if it exits, the lock is released and one of the remaining workers takes over.
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 << 20
+RECONNECT_DELAY = 0.2  # Seconds
+
+logger = logging.getLogger("chat.bus")
+
+
+def from_url(url):
+    if not url or url == "local":
+        return LocalBus()
+    if url.startswith("unix:"):
+        return UnixSocketBus(url[len("unix:"):])
+    raise ValueError(f"Unknown chat bus {url!r}, expected local or unix:/path")
+
+
+class LocalBus:
+    """Delivers in-process only."""
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, room, message):
+        if self._deliver is not None:
+            self._deliver(room, message)
+
+    def close(self):
+        self._deliver = None
+
+
+def encode(room, message):
+    body = json.dumps([room, message], separators=(",", ":")).encode()
+    return HEADER.pack(len(body)) + body
+
+
+def read_frames(sock):
+    """Yield (room, message, frame) for the frames sent on sock until it is closed."""
+    stream = sock.makefile("rb")
+    try:
+        while True:
+            header = stream.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            (size,) = HEADER.unpack(header)
+            if size > MAX_FRAME:
+                raise ValueError(f"Bus frame of {size} bytes")
+            body = stream.read(size)
+            if len(body) < size:
+                return
+            room, message = json.loads(body)
+            yield room, message, header + body
+    finally:
+        stream.close()
+
+
+class UnixSocketBus:
+    """Shares broadcasts between the processes on this machine using the same socket path."""
+
+    def __init__(self, path, connect_timeout=5.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.is_hub = False
+        self._deliver = None
+        self._closed = False
+        self._hub = None  # Socket to the hub, when this worker is not the hub
+        self._listener = None  # When it is
+        self._peers = {}  # Hub only: socket -> lock serializing its writes
+        self._lock = threading.Lock()
+        self._linked = threading.Event()
+        self._lock_file = None
+
+    def start(self, deliver):
+        """Join the bus; returns once this worker is the hub or connected to it."""
+        self._deliver = deliver
+        threading.Thread(target=self._run, name="chat-bus", daemon=True).start()
+        if not self._linked.wait(self.connect_timeout):
+            logger.warning("Chat bus at %s is not reachable yet", self.path)
+
+    def publish(self, room, message):
+        frame = encode(room, message)
+        self._deliver(room, message)
+        if self.is_hub:
+            self._relay(frame, None)
+            return
+        hub = self._hub
+        if hub is None:
+            logger.warning("Chat bus is reconnecting, message to %s only reached this worker", room)
+            return
+        try:
+            with self._lock:
+                hub.sendall(frame)
+        except OSError:
+            logger.warning("Chat bus hub went away, message to %s only reached this worker", room)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            sockets = [sock for sock in (self._listener, self._hub) if sock is not None] + list(self._peers)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _run(self):
+        while not self._closed:
+            try:
+                if self._take_hub_lock():
+                    self._serve_as_hub()
+                else:
+                    self._serve_as_worker()
+            except OSError as e:
+                if self._closed:
+                    return
+                logger.warning("Chat bus at %s: %s", self.path, e)
+            time.sleep(RECONNECT_DELAY)
+
+    def _take_hub_lock(self):
+        if self._lock_file is None:
+            self._lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _serve_as_hub(self):
+        # Holding the lock means any socket file left there belongs to a hub that exited
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(128)
+        self._listener = listener
+        self.is_hub = True
+        self._linked.set()
+        logger.info("Chat bus hub listening on %s", self.path)
+        with listener:
+            while not self._closed:
+                conn, _ = listener.accept()
+                with self._lock:
+                    self._peers[conn] = threading.Lock()
+                threading.Thread(target=self._serve_peer, args=(conn,), name="chat-bus-peer", daemon=True).start()
+
+    def _serve_peer(self, conn):
+        try:
+            for room, message, frame in read_frames(conn):
+                self._deliver(room, message)
+                self._relay(frame, conn)
+        except (OSError, ValueError) as e:
+            logger.warning("Dropping chat bus peer: %s", e)
+        finally:
+            with self._lock:
+                self._peers.pop(conn, None)
+            conn.close()
+
+    def _relay(self, frame, sender):
+        with self._lock:
+            peers = [(peer, lock) for peer, lock in self._peers.items() if peer is not sender]
+        for peer, lock in peers:
+            try:
+                with lock:
+                    peer.sendall(frame)
+            except OSError:
+                # Its reader thread notices too and forgets it
+                pass
+
+    def _serve_as_worker(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            # The hub holds the lock but is not listening yet, or just exited
+            sock.close()
+            return
+        self._hub = sock
+        self._linked.set()
+        try:
+            for room, message, _ in read_frames(sock):
+                self._deliver(room, message)
+        finally:
+            self._hub = None
+            sock.close()
+        if not self._closed:
+            logger.warning("Chat bus hub at %s went away, reconnecting", self.path)
@@ -0,0 +1,93 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, make_response, request
+
+# In-memory cache for GET responses, keyed by path and query string. Every write bumps
+# the version, which drops all entries; entries also expire after ttl seconds, which
+# bounds how stale a page can be when another process wrote to the database. Responses
+# carry a strong ETag (a hash of the body), so a client revalidating a cached page gets
+# 304 Not Modified without the database being queried.
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=5.0, max_body=1 << 20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_body = max_body  # Larger responses (e.g. limit=-1) are not kept
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (version, expires, etag, body, mimetype)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] != self.version or entry[1] < time.monotonic()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, etag, body, mimetype):
+        entry = (version, time.monotonic() + self.ttl, etag, body, mimetype)
+        if len(body) > self.max_body:
+            return entry
+        with self._lock:
+            # A write during the request made this page stale already
+            if version != self.version:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl,
+                    "version": self.version, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "not_modified": self.not_modified, "evictions": self.evictions}
+
+    def cached(self, view):
+        """Decorator for GET views: serve 200 responses from the cache and answer If-None-Match."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = self.get(key)
+            if entry is None:
+                version = self.version  # Read before the query, see put
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = self.put(key, version, hashlib.sha1(body).hexdigest(), body, response.mimetype)
+            _, _, etag, body, mimetype = entry
+
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            # Clients may keep the page but have to revalidate it before using it
+            response.headers["Cache-Control"] = "no-cache"
+            response.make_conditional(request)
+            if response.status_code == 304:
+                with self._lock:
+                    self.not_modified += 1
+            return response
+        return wrapper
@@ -0,0 +1,229 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+import bus as message_bus
+from history import RoomHistory
+
+# Chat event handling shared by the Flask-SocketIO handlers in app.py and the
+# single-port ASGI server in asgi.py. Each server does the joining and sending with
+# its own Socket.IO API; room membership and broadcasting are kept here.
+#
+# Messages are not sent to a room as they arrive. They are queued per room and a
+# flush loop in the server sends each room's queue every WINDOW seconds: a single
+# message as a 'message' event like before, several as one 'message_batch' event
+# holding the list, so a busy room costs one fan-out per window instead of one per
+# message.
+#
+# Messages reach the queues through a message bus (see bus.py), so with CHAT_BUS set to
+# a shared unix socket every server process on the machine sends a room's messages to
+# its own members of that room.
+#
+# Every delivered message is also kept in the room's history (see history.py) and gets a
+# sequence number there. Both events carry a second argument {"room", "seq", "ts"} for the
+# last message they hold; a client sends these back as since_seq or since when it joins
+# again, and gets what it missed in a 'history' event. CHAT_HISTORY_DB also writes the
+# history to SQLite.
+
+WINDOW = float(os.environ.get("CHAT_WINDOW", 0.025))  # Seconds
+MAX_BATCH = 100  # Messages per 'message_batch' event
+
+logger = logging.getLogger("chat")
+
+
+def setup_logging(level=None):
+    """Log chat events through a queue, so handlers never wait on the console.
+
+    Joins and leaves are logged at INFO, every message at DEBUG (CHAT_LOG_LEVEL=DEBUG).
+    """
+    records = queue.SimpleQueue()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(records, console)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(level or os.environ.get("CHAT_LOG_LEVEL", "INFO"))
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def parse_event(data, *keys, event="message", optional=()):
+    """Return the values of keys from an event payload, or None if the payload is not usable.
+
+    Clients send either an object or a JSON string holding one. The values of the
+    optional keys follow, None when missing.
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning("Received %s data is not valid JSON: %r", event, data)
+            return None
+    if not isinstance(data, dict):
+        logger.warning("Received %s data is not in the expected format: %r", event, data)
+        return None
+    values = tuple(data.get(key) for key in keys)
+    if not all(values):
+        logger.warning("Invalid %s data received: %r", event, data)
+        return None
+    return values + tuple(data.get(key) for key in optional)
+
+
+def joined(username, room):
+    logger.info("%s has joined the room %s", username, room)
+    return f"{username} has joined the room {room}."
+
+
+def left(username, room):
+    logger.info("%s has left the room %s", username, room)
+    return f"{username} has left the room {room}."
+
+
+def received(room, message):
+    # Only formatted when debug logging is on
+    logger.debug("[%s] Message: %s", room, message)
+    return message
+
+
+class Rooms:
+    """Which connections are in which room, for membership counts."""
+
+    def __init__(self):
+        self._members = defaultdict(set)  # room -> sids
+        self._rooms = defaultdict(set)  # sid -> rooms
+        self._lock = threading.Lock()
+
+    def join(self, sid, room):
+        with self._lock:
+            self._members[room].add(sid)
+            self._rooms[sid].add(room)
+            return len(self._members[room])
+
+    def leave(self, sid, room):
+        with self._lock:
+            self._discard(sid, room)
+            self._rooms[sid].discard(room)
+            if not self._rooms[sid]:
+                del self._rooms[sid]
+            return len(self._members.get(room, ()))
+
+    def disconnect(self, sid):
+        """Forget a closed connection; returns the rooms it was in."""
+        with self._lock:
+            rooms = self._rooms.pop(sid, set())
+            for room in rooms:
+                self._discard(sid, room)
+            return rooms
+
+    def _discard(self, sid, room):
+        members = self._members.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._members[room]
+
+    def counts(self):
+        with self._lock:
+            return {room: len(members) for room, members in self._members.items()}
+
+
+class RoomBroadcaster:
+    """Queues messages per room until the server's flush loop drains them."""
+
+    def __init__(self, window=WINDOW, max_batch=MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.sent = 0
+        self.events = 0
+        self._pending = defaultdict(list)
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start_once(self, start):
+        """Call start() (which launches the flush loop) the first time only."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        start()
+
+    def publish(self, room, entry):
+        # entry is (seq, ts, message)
+        with self._lock:
+            self._pending[room].append(entry)
+
+    def drain(self):
+        """Return (event, args, room) for everything queued, oldest first per room."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+        emits = []
+        for room, entries in pending.items():
+            for start in range(0, len(entries), self.max_batch):
+                batch = entries[start:start + self.max_batch]
+                seq, ts, _ = batch[-1]
+                meta = {"room": room, "seq": seq, "ts": ts}
+                if len(batch) == 1:
+                    emits.append(("message", (batch[0][2], meta), room))
+                else:
+                    emits.append(("message_batch", ([message for _, _, message in batch], meta), room))
+            self.sent += len(entries)
+        self.events += len(emits)
+        return emits
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(messages) for messages in self._pending.values())
+        return {"messages": self.sent, "events": self.events, "pending": pending, "window": self.window}
+
+
+# One of each per process, whichever server is running uses them
+rooms = Rooms()
+broadcaster = RoomBroadcaster()
+history = RoomHistory(os.environ.get("CHAT_HISTORY_DB") or None)
+bus = message_bus.from_url(os.environ.get("CHAT_BUS"))
+atexit.register(history.close)
+_deliver_lock = threading.Lock()
+
+
+def deliver(room, message):
+    # Called by the bus for every message, on every server process
+    with _deliver_lock:
+        # Held so messages are queued in the order of their sequence numbers
+        broadcaster.publish(room, history.append(room, message["text"], message["ts"]))
+
+
+def start(start_flush_loop):
+    """Called for every new connection; the first one joins the bus and starts the flush loop."""
+    def start_once():
+        bus.start(deliver)
+        start_flush_loop()
+    broadcaster.start_once(start_once)
+
+
+def publish(room, text):
+    # To this room's members on every server process
+    message = {"text": text, "ts": time.time()}
+    history.persist(room, text, message["ts"])
+    bus.publish(room, message)
+
+
+def number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def replay(room, wants_history, since, since_seq):
+    """The 'history' event payload for a client joining room, or None if it asked for none.
+
+    A join with "history": true gets the recent messages, with "since" (a ts) or
+    "since_seq" (a seq) the ones after it.
+    """
+    since, since_seq = number(since), number(since_seq)
+    if not wants_history and since is None and since_seq is None:
+        return None
+    return {"room": room, "messages": history.replay(room, since=since, since_seq=since_seq)}
@@ -0,0 +1,222 @@
+# Copied into Lab_3: edit the Lab_2 version and run sync_shared.py --write
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DATABASE = os.environ.get("PRODUCTS_DB", "products.db")
+
+# Applied to every new connection. WAL lets readers run while a write is in progress,
+# synchronous=NORMAL only fsyncs at checkpoints, and busy_timeout makes writers wait
+# for the lock instead of failing immediately.
+PRAGMAS = (
+    # First, so switching the file to WAL waits for a lock held by another process too
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+)
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                price TEXT,
+                link TEXT UNIQUE,
+                additional_info TEXT
+            )'''
+
+# Integer price parsed from the scraped text ("12 999 lei" -> 12999) the way
+# Lab_1/main.py::validate_product does it, NULL when it isn't a whole number
+PRICE_VALUE = '''CASE WHEN REPLACE(REPLACE(price, ' ', ''), 'lei', '') GLOB '[0-9]*'
+                     AND REPLACE(REPLACE(price, ' ', ''), 'lei', '') NOT GLOB '*[^0-9]*'
+                   THEN CAST(REPLACE(REPLACE(price, ' ', ''), 'lei', '') AS INTEGER) END'''
+
+# Schema changes, in order. PRAGMA user_version records how many have been applied
+# to a database, so each one runs exactly once. Append new steps, never edit old ones.
+MIGRATIONS = [
+    (SCHEMA,),
+    # Row count kept up to date by triggers, so listing pages don't need a COUNT(*) over the table.
+    # INSERT OR REPLACE would bypass the delete trigger, writes use upserts instead.
+    (
+        '''CREATE TABLE IF NOT EXISTS product_stats (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               row_count INTEGER NOT NULL
+           )''',
+        "INSERT OR REPLACE INTO product_stats (id, row_count) SELECT 1, COUNT(*) FROM products",
+        '''CREATE TRIGGER IF NOT EXISTS products_count_insert AFTER INSERT ON products
+           BEGIN UPDATE product_stats SET row_count = row_count + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_count_delete AFTER DELETE ON products
+           BEGIN UPDATE product_stats SET row_count = row_count - 1 WHERE id = 1; END''',
+    ),
+    # A generated column always matches price, so existing rows need no backfill and no
+    # writer has to know about it. It is computed on read, only the indexes store it.
+    (
+        f"ALTER TABLE products ADD COLUMN price_value INTEGER GENERATED ALWAYS AS ({PRICE_VALUE}) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS products_price_value ON products (price_value)",
+        "CREATE INDEX IF NOT EXISTS products_name ON products (name)",
+    ),
+    # Full-text index over name and additional_info. It stores no copy of the text
+    # (content='products'), the triggers keep it in step with the table. Prefixes of
+    # 2 and 3 characters are indexed for type-ahead, and rank weighs name matches 10x.
+    (
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+               name, additional_info, content='products', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+           )''',
+        "INSERT INTO products_fts (products_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+               INSERT INTO products_fts (rowid, name, additional_info) VALUES (NEW.id, NEW.name, NEW.additional_info);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+               INSERT INTO products_fts (products_fts, rowid, name, additional_info)
+               VALUES ('delete', OLD.id, OLD.name, OLD.additional_info);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, additional_info ON products BEGIN
+               INSERT INTO products_fts (products_fts, rowid, name, additional_info)
+               VALUES ('delete', OLD.id, OLD.name, OLD.additional_info);
+               INSERT INTO products_fts (rowid, name, additional_info) VALUES (NEW.id, NEW.name, NEW.additional_info);
+           END''',
+    ),
+]
+
+
+def migrate(conn):
+    """Bring the database schema up to date; safe to call from several processes at once."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
+    # IMMEDIATE takes the write lock up front, so the version read below can't go stale
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections shared by the request threads.
+
+    A thread gets back the connection it used last when that one is idle, so
+    its page cache and prepared statements stay warm. sqlite3 keeps up to
+    cached_statements compiled statements per connection, keyed by the SQL
+    text, so routes reuse them as long as their queries are constant strings.
+    """
+
+    def __init__(self, path=DATABASE, max_size=8, timeout=10.0, cached_statements=256):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._all = []
+        self._size = 0  # Open connections plus the ones being opened
+        self._closed = False
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connect(self):
+        # Connections may be handed to a different thread later, the pool makes sure only one uses it at a time
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row  # Allows us to return rows as dictionaries
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if not self._initialized:
+            migrate(conn)
+            self._initialized = True
+        return conn
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("The connection pool is closed")
+                preferred = getattr(self._local, "conn", None)
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    return preferred
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._local.conn = conn
+                    return conn
+                if self._size < self.max_size:
+                    # Reserve the slot now and open the connection outside the lock, so other
+                    # threads can keep acquiring and releasing in the meantime
+                    self._size += 1
+                    break
+                if not self._condition.wait(self.timeout):
+                    raise PoolTimeout(f"No database connection available after {self.timeout} seconds")
+
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._all.append(conn)
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                return
+        with self._condition:
+            if self._closed:
+                self._discard_locked(conn)
+                return
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def _discard(self, conn):
+        with self._condition:
+            self._discard_locked(conn)
+
+    def _discard_locked(self, conn):
+        # The slot is freed, so a waiting thread can open a replacement
+        if conn in self._all:
+            self._all.remove(conn)
+            self._size -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close the idle connections now and the ones in use when they are released."""
+        with self._condition:
+            self._closed = True
+            for conn in self._idle:
+                self._discard_locked(conn)
+            self._idle = []
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {"size": len(self._all), "idle": len(self._idle), "max_size": self.max_size}
@@ -1,69 +1,193 @@
+import argparse
+import hashlib
 import requests
-from bs4 import BeautifulSoup
 import sqlite3
+from datetime import datetime, timezone
+from db import migrate
+from requests.adapters import HTTPAdapter
+from extract import extract_detail_info, extract_listing
+from fetcher import FetchEngine
 
-# Connect to the SQLite database (it will create the file if it doesn't exist)
-conn = sqlite3.connect("products.db")
-cursor = conn.cursor()
-
-# Create the products table
-cursor.execute('''CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    price TEXT,
-                    link TEXT UNIQUE,
-                    additional_info TEXT
-                )''')
-conn.commit()
-
-url = "https://ultra.md/category/tv-televizory"
-
-# Make the GET request
-response = requests.get(url)
-
-# Check if the request was successful
-if response.status_code == 200:
-    print("Successfully retrieved HTML content.")
-
-    soup = BeautifulSoup(response.text, "html.parser")
-    products = soup.find_all("div", class_="product-block")
-
-    for product in products:
-        try:
-            name = product.find("a", class_="product-text").text.strip()
-            price = " ".join(product.find("span", class_="text-blue text-xl font-bold dark:text-white").text.split())
-            link = product.find("a", class_="product-text")["href"]
-
-            response2 = requests.get(link)
-            soup2 = BeautifulSoup(response2.text, "html.parser")
-
-            # Check if the label exists before accessing its text
-            info_label = soup2.find("label", class_="cursor-pointer font-semibold")
-            info = info_label.text.strip() if info_label else "No additional info"
-
-            # Check if the product already exists in the database
-            cursor.execute("SELECT COUNT(*) FROM products WHERE link=?", (link,))
-            if cursor.fetchone()[0] == 0:  # If the product doesn't exist
-                # Insert the product data into the database
-                cursor.execute('''INSERT INTO products (name, price, link, additional_info) 
-                                  VALUES (?, ?, ?, ?)''', (name, price, link, info))
-                print(f"Inserted: {name}")
-            else:
-                print(f"Product already exists: {name}")
-
-        except Exception as e:
-            print(f"Error processing product: {e}")
-
-    # Commit all insertions at once
+URL = "https://ultra.md/category/tv-televizory"
+
+# Detail page fetching
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+RATE_LIMIT = 10  # Requests per second per host
+
+
+def create_session():
+    # One pooled session shared by all fetch threads so connections are reused
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_PER_HOST, pool_maxsize=MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def create_tables(conn):
+    # Create the products table, with the same schema and triggers the API uses
+    migrate(conn)
+    cursor = conn.cursor()
+    # HTTP validators and a hash of the stored fields for every scraped detail page,
+    # fetched_at is when they last changed
+    cursor.execute('''CREATE TABLE IF NOT EXISTS page_cache (
+                        link TEXT PRIMARY KEY,
+                        etag TEXT,
+                        last_modified TEXT,
+                        content_hash TEXT,
+                        fetched_at TEXT
+                    )''')
     conn.commit()
 
-    # Optional: Confirm data retrieval
-    cursor.execute("SELECT COUNT(*) FROM products")
-    count = cursor.fetchone()[0]
-    print(f"\nThere are {count} products in the database.")
 
-else:
-    print(f"Failed to retrieve content. Status code: {response.status_code}")
+def load_known_pages(cursor):
+    cursor.execute('''SELECT p.link, p.additional_info, c.etag, c.last_modified, c.content_hash
+                      FROM products p LEFT JOIN page_cache c ON c.link = p.link''')
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def fetch_page(session, link, headers=None):
+    response = session.get(link, headers=headers, timeout=15)
+    # Server errors and throttling are worth retrying, anything else is returned as is
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return response
+
+
+def conditional_headers(known):
+    if known is None:
+        return None
+    _, etag, last_modified, _ = known
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def content_hash(name, price, info):
+    return hashlib.sha256(f"{name}\0{price}\0{info}".encode()).hexdigest()
+
+
+def parse_listing(html):
+    # Keyed by link, so a product listed twice is only fetched once
+    return {link: (name.strip(), price) for name, price, link in extract_listing(html)}
+
+
+def parse_info(html):
+    info = extract_detail_info(html)
+    return info if info is not None else "No additional info"
+
+
+def main(incremental=False):
+    # Connect to the SQLite database (it will create the file if it doesn't exist)
+    conn = sqlite3.connect("products.db")
+    cursor = conn.cursor()
+    create_tables(conn)
+
+    session = create_session()
+
+    # Make the GET request
+    response = session.get(URL)
+
+    # Check if the request was successful
+    if response.status_code == 200:
+        print("Successfully retrieved HTML content.")
+
+        products = parse_listing(response.text)
+        # In incremental mode pages we have seen before are revalidated with If-None-Match/If-Modified-Since
+        known_pages = load_known_pages(cursor) if incremental else {}
+        engine = FetchEngine(lambda link: fetch_page(session, link, conditional_headers(known_pages.get(link))),
+                             max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, rate_limit=RATE_LIMIT)
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "not_modified": 0}
+
+        # Detail pages are fetched concurrently, the database is only written from this thread
+        for result in engine.fetch_all(products):
+            link = result.link
+            name, price = products[link]
+            if result.error is not None:
+                print(f"Error processing product: {result.error}")
+                continue
+
+            try:
+                page = result.value
+                known = known_pages.get(link)
+                if page.status_code == 304 and known is not None:
+                    # The detail page did not change, only the listing fields can differ
+                    counts["not_modified"] += 1
+                    info = known[0]
+                elif page.status_code == 200:
+                    info = parse_info(page.text)
+                else:
+                    print(f"Error processing product: {link} returned {page.status_code}")
+                    continue
+                page_hash = content_hash(name, price, info)
+
+                if not incremental:
+                    # Check if the product already exists in the database
+                    cursor.execute("SELECT COUNT(*) FROM products WHERE link=?", (link,))
+                    if cursor.fetchone()[0] == 0:  # If the product doesn't exist
+                        # Insert the product data into the database
+                        cursor.execute('''INSERT INTO products (name, price, link, additional_info)
+                                          VALUES (?, ?, ?, ?)''', (name, price, link, info))
+                        counts["inserted"] += 1
+                        print(f"Inserted: {name}")
+                    else:
+                        counts["unchanged"] += 1
+                        print(f"Product already exists: {name}")
+                elif known is None:
+                    cursor.execute('''INSERT OR IGNORE INTO products (name, price, link, additional_info)
+                                      VALUES (?, ?, ?, ?)''', (name, price, link, info))
+                    counts["inserted"] += 1
+                    print(f"Inserted: {name}")
+                elif page_hash == known[3]:
+                    counts["unchanged"] += 1
+                else:
+                    # Only rows whose fields actually differ are rewritten
+                    cursor.execute('''UPDATE products SET name = ?, price = ?, additional_info = ?
+                                      WHERE link = ? AND (name IS NOT ? OR price IS NOT ? OR additional_info IS NOT ?)''',
+                                   (name, price, info, link, name, price, info))
+                    if cursor.rowcount:
+                        counts["updated"] += 1
+                        print(f"Updated: {name}")
+                    else:
+                        counts["unchanged"] += 1
+
+                etag = page.headers.get("ETag") or (known[1] if known else None)
+                last_modified = page.headers.get("Last-Modified") or (known[2] if known else None)
+                # The cache row is only rewritten when a validator or the content changed, so an
+                # unchanged catalog costs no writes at all
+                if known is None or (etag, last_modified, page_hash) != known[1:]:
+                    cursor.execute('''INSERT OR REPLACE INTO page_cache (link, etag, last_modified, content_hash, fetched_at)
+                                      VALUES (?, ?, ?, ?, ?)''',
+                                   (link, etag, last_modified, page_hash, datetime.now(timezone.utc).isoformat()))
+
+            except Exception as e:
+                print(f"Error processing product: {e}")
+
+        # Commit all insertions at once
+        conn.commit()
+
+        print(f"\nInserted {counts['inserted']}, updated {counts['updated']}, unchanged {counts['unchanged']} "
+              f"({counts['not_modified']} answered 304 Not Modified).")
+
+        # Optional: Confirm data retrieval
+        cursor.execute("SELECT COUNT(*) FROM products")
+        count = cursor.fetchone()[0]
+        print(f"There are {count} products in the database.")
+
+    else:
+        print(f"Failed to retrieve content. Status code: {response.status_code}")
+
+    # Close the database connection when done
+    conn.close()
+
 
-# Close the database connection when done
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape ultra.md TVs into products.db")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Revalidate known pages with conditional requests and only update changed products")
+    args = parser.parse_args()
+    main(incremental=args.incremental)
@@ -0,0 +1,96 @@
+# Copied into Lab_2 and Lab_3: edit the Lab_1 version and run sync_shared.py --write
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+# value is whatever the fetch function returned; error is the last exception when every attempt failed
+FetchResult = namedtuple("FetchResult", ["link", "value", "error", "attempts"])
+
+
+class HostLimiter:
+    """Caps in-flight requests to one host and spaces out their start times."""
+
+    def __init__(self, max_in_flight, min_interval):
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class FetchEngine:
+    """Fetches many links on a thread pool and yields the results as they complete.
+
+    fetch is called as fetch(link) and may raise to signal a failed attempt;
+    failed attempts are retried with exponential backoff and jitter.
+    rate_limit is the maximum number of requests per second started per host.
+    """
+
+    def __init__(self, fetch, max_workers=8, max_per_host=4, rate_limit=None, retries=3, backoff=0.5,
+                 default_host=""):
+        self.fetch = fetch
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0.0
+        self.retries = retries
+        self.backoff = backoff
+        self.default_host = default_host
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def fetch_all(self, links):
+        """Yield a FetchResult per link in completion order.
+
+        links may be any iterable (including a generator); only a bounded
+        window of links is in flight at a time, so it is consumed lazily.
+        """
+        links = iter(links)
+        window = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < window:
+                    link = next(links, None)
+                    if link is None:
+                        exhausted = True
+                    else:
+                        pending.add(executor.submit(self._fetch_with_retries, link))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def _limiter(self, link):
+        host = urlsplit(link).netloc or self.default_host
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = HostLimiter(self.max_per_host, self.min_interval)
+            return limiter
+
+    def _fetch_with_retries(self, link):
+        limiter = self._limiter(link)
+        error = None
+        for attempt in range(1, self.retries + 2):
+            with limiter.slots:
+                limiter.wait_turn()
+                try:
+                    return FetchResult(link, self.fetch(link), None, attempt)
+                except Exception as e:
+                    error = e
+            if attempt <= self.retries:
+                # Sleep outside the host slot so other links for the host can proceed
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        return FetchResult(link, None, error, self.retries + 1)
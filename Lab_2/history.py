@@ -0,0 +1,196 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from db import PRAGMAS
+
+# Recent chat messages per room, so a client joining or reconnecting can catch up.
+# Each room keeps its last HISTORY_SIZE messages in a ring buffer, trimmed further to
+# MAX_ROOM_BYTES; all rooms together are held under MAX_BYTES by dropping the least
+# recently active rooms first, and a room idle for IDLE_SECONDS is dropped entirely.
+#
+# With a database path, the messages this process publishes are also written to the
+# chat_history table, in one transaction per FLUSH_INTERVAL (or FLUSH_SIZE messages).
+# A replay that reaches further back than the ring buffer is answered by one query.
+#
+# Sequence numbers count the messages of a room in this process, and timestamps come
+# from the process that published the message. With several server processes sharing a
+# bus, only timestamps mean the same thing on all of them.
+
+HISTORY_SIZE = 100  # Messages per room
+MAX_ROOM_BYTES = 64 * 1024
+MAX_BYTES = 32 << 20
+IDLE_SECONDS = 600
+ENTRY_OVERHEAD = 100  # Rough bytes per entry besides the text
+FLUSH_INTERVAL = 1.0  # Seconds
+FLUSH_SIZE = 500
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                room TEXT NOT NULL,
+                ts REAL NOT NULL,
+                message TEXT NOT NULL
+            )'''
+INDEX = "CREATE INDEX IF NOT EXISTS chat_history_room_ts ON chat_history (room, ts)"
+
+
+class Room:
+    __slots__ = ("entries", "bytes", "next_seq", "active")
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)  # (seq, ts, message)
+        self.bytes = 0
+        self.next_seq = 1
+        self.active = time.monotonic()
+
+
+def entry_size(message):
+    return len(message) + ENTRY_OVERHEAD
+
+
+class RoomHistory:
+    def __init__(self, db_path=None, size=HISTORY_SIZE, max_room_bytes=MAX_ROOM_BYTES, max_bytes=MAX_BYTES,
+                 idle_seconds=IDLE_SECONDS, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.size = size
+        self.max_room_bytes = max_room_bytes
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.flush_interval = flush_interval
+        self.bytes = 0
+        self.evicted_rooms = 0
+        self._rooms = OrderedDict()  # Least recently active first
+        self._lock = threading.Lock()
+        self._pending = []  # (room, ts, message) waiting to be written
+        self._flush = threading.Condition()
+        self._writer = None
+        self._closed = False
+
+    def append(self, room, message, ts):
+        """Record a message delivered to room; returns its (seq, ts, message)."""
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                state = self._rooms[room] = Room(self.size)
+            else:
+                self._rooms.move_to_end(room)
+            state.active = time.monotonic()
+            if len(state.entries) == state.entries.maxlen:
+                self._forget(state, state.entries[0])
+            entry = (state.next_seq, ts, message)
+            state.next_seq += 1
+            state.entries.append(entry)
+            state.bytes += entry_size(message)
+            self.bytes += entry_size(message)
+            while state.bytes > self.max_room_bytes and len(state.entries) > 1:
+                self._forget(state, state.entries.popleft())
+            self._evict(room)
+            return entry
+
+    def _forget(self, state, entry):
+        # entry is leaving the ring, either pushed out by maxlen or popped
+        state.bytes -= entry_size(entry[2])
+        self.bytes -= entry_size(entry[2])
+
+    def _evict(self, current):
+        # Oldest activity first: idle rooms, then whatever keeps the total over the cap
+        idle_before = time.monotonic() - self.idle_seconds
+        while self._rooms:
+            room, state = next(iter(self._rooms.items()))
+            if room == current or (state.active > idle_before and self.bytes <= self.max_bytes):
+                break
+            del self._rooms[room]
+            self.bytes -= state.bytes
+            self.evicted_rooms += 1
+
+    def replay(self, room, since=None, since_seq=None, limit=HISTORY_SIZE):
+        """Messages of room after timestamp since or sequence number since_seq, oldest first.
+
+        Without either, the last limit messages. Each is a dict with seq, ts and message;
+        messages read back from the database have no seq.
+        """
+        with self._lock:
+            state = self._rooms.get(room)
+            entries = list(state.entries) if state is not None else []
+        if since_seq is not None:
+            entries = [entry for entry in entries if entry[0] > since_seq]
+        elif since is not None:
+            covered = entries and entries[0][1] <= since
+            entries = [entry for entry in entries if entry[1] > since]
+            if not covered and self.db_path is not None:
+                return self._load(room, since, limit, entries)
+        elif (len(entries) < limit and self.db_path is not None
+              and (state is None or len(entries) == state.next_seq - 1)):
+            # Nothing was trimmed, so older messages can only be in the database (the room
+            # was evicted, or was active before this process started)
+            return self._load(room, None, limit, entries)
+        return [{"seq": seq, "ts": ts, "message": message} for seq, ts, message in entries[-limit:]]
+
+    def stats(self):
+        with self._lock:
+            return {"rooms": len(self._rooms), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "evicted_rooms": self.evicted_rooms, "pending_writes": len(self._pending)}
+
+    # Persistence
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with conn:
+            conn.execute(SCHEMA)
+            conn.execute(INDEX)
+        return conn
+
+    def _load(self, room, since, limit, entries):
+        conn = self._connect()
+        try:
+            rows = conn.execute('''SELECT ts, message FROM (
+                                       SELECT id, ts, message FROM chat_history
+                                       WHERE room = ? AND ts > ? ORDER BY ts DESC, id DESC LIMIT ?
+                                   ) ORDER BY ts, id''', (room, since if since is not None else 0, limit)).fetchall()
+        finally:
+            conn.close()
+        messages = [{"seq": None, "ts": ts, "message": message} for ts, message in rows]
+        # The ring buffer has what was delivered since, including messages not written yet
+        newest = rows[-1][0] if rows else 0
+        messages.extend({"seq": seq, "ts": ts, "message": message} for seq, ts, message in entries if ts > newest)
+        return messages[-limit:]
+
+    def persist(self, room, message, ts):
+        """Queue a message published by this process for the next batched write."""
+        if self.db_path is None:
+            return
+        with self._flush:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="chat-history", daemon=True)
+                self._writer.start()
+            self._pending.append((room, ts, message))
+            if len(self._pending) >= FLUSH_SIZE:
+                self._flush.notify()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self._flush:
+                    self._flush.wait_for(lambda: self._closed or len(self._pending) >= FLUSH_SIZE,
+                                         self.flush_interval)
+                    batch, self._pending = self._pending, []
+                    closed = self._closed
+                if batch:
+                    with conn:
+                        conn.executemany("INSERT INTO chat_history (room, ts, message) VALUES (?, ?, ?)", batch)
+                if closed:
+                    return
+        finally:
+            conn.close()
+
+    def close(self):
+        """Write what is still queued and stop the writer."""
+        with self._flush:
+            self._closed = True
+            self._flush.notify()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
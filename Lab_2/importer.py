@@ -0,0 +1,254 @@
+import codecs
+import csv
+import json
+import os
+import re
+
+# Streaming bulk import for /upload. The upload is decoded and parsed a chunk at a time,
+# so memory use depends on the batch size rather than the file size, and rows are written
+# with executemany, one transaction per batch.
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+FORMATS = ("json", "ndjson", "csv")
+EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+NUMBER_START = re.compile(r"-?[0-9.eE+-]*")
+ESCAPE_START = re.compile(r"u[0-9a-fA-F]{0,4}(\\(u[0-9a-fA-F]{0,4})?)?")  # Maybe half of a surrogate pair
+
+# Each batch is staged in a temporary table and copied with one INSERT ... SELECT.
+# executemany runs one statement per row, and the FTS index flushes its pending data
+# at the end of every statement, which made bulk imports twice as slow.
+STAGING_TABLE = "CREATE TEMP TABLE IF NOT EXISTS import_batch (name, price, link, additional_info)"
+STAGE = "INSERT INTO import_batch (name, price, link, additional_info) VALUES (?, ?, ?, ?)"
+INSERT = '''INSERT OR IGNORE INTO products (name, price, link, additional_info)
+            SELECT name, price, link, additional_info FROM import_batch ORDER BY rowid'''
+CLEAR = "DELETE FROM import_batch"
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def iter_text(stream, chunk_size=CHUNK_SIZE, encoding="utf-8-sig"):
+    """Yield decoded text chunks from a binary stream; a character split between reads is kept whole."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_lines(chunks):
+    """Yield lines (with their line endings) from text chunks."""
+    pending = ""
+    for chunk in chunks:
+        # Only \n ends a line: str.splitlines would also split on characters such as
+        # U+2028 that are valid inside JSON strings and CSV fields
+        lines = (pending + chunk).split("\n")
+        # The last piece may continue in the next chunk
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+
+def cut_off(error, text):
+    """Whether the decoder failed only because the JSON continues past the end of text."""
+    if error.msg.startswith("Unterminated string"):
+        return True  # Reported where the string starts
+    if error.msg.startswith("Invalid \\uXXXX escape"):
+        return ESCAPE_START.fullmatch(text, error.pos) is not None
+    # Whatever follows the error position must be the start of a literal or a number
+    rest = text[error.pos:]
+    return (any(literal.startswith(rest) for literal in ("true", "false", "null", "NaN", "Infinity", "-Infinity"))
+            or NUMBER_START.fullmatch(rest) is not None)
+
+
+def iter_json_array(chunks):
+    """Yield the items of a top-level JSON array, parsing each one as soon as it is complete."""
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    offset = 0  # Characters dropped from the front of the buffer, for error messages
+
+    def fill(wanted):
+        # Read until the unparsed text has grown by at least wanted characters, so an item
+        # much larger than a chunk is retried a few times rather than once per chunk
+        nonlocal buffer, pos, eof, offset
+        offset += pos
+        parts, size = [buffer[pos:]], 0
+        while size < wanted:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            parts.append(chunk)
+            size += len(chunk)
+        buffer, pos = "".join(parts), 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill(1)
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != "[":
+        raise ImportFormatError("Expected a JSON array of products")
+    pos += 1
+    skip_whitespace()
+    if buffer[pos:pos + 1] == "]":
+        pos += 1
+    else:
+        index = 0
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A number at the end of the buffer ("1", "1.5e") may continue in the next chunk
+                complete = eof or not (isinstance(item, (int, float)) and NUMBER_START.fullmatch(buffer, end))
+            except json.JSONDecodeError as e:
+                # Only read on when the item may just continue past the buffer, or a syntax
+                # error early in the upload would buffer the rest of it before being reported
+                if eof or not cut_off(e, buffer):
+                    raise ImportFormatError(f"Item {index}: {e.msg} at character {offset + e.pos}") from None
+                complete = False
+            if not complete:
+                fill(max(CHUNK_SIZE, len(buffer) - pos))
+                continue
+            yield item
+            index += 1
+            pos = end
+            skip_whitespace()
+            separator = buffer[pos:pos + 1]
+            pos += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise ImportFormatError(f"Expected ',' or ']' after item {index - 1} at character {offset + pos - 1}")
+            skip_whitespace()
+    skip_whitespace()
+    if pos < len(buffer):
+        raise ImportFormatError(f"Unexpected data after the array at character {offset + pos}")
+
+
+class InvalidItem:
+    """Stands in for an item that could not be parsed, so it is counted instead of stopping the import."""
+
+
+def iter_ndjson(chunks):
+    for line in iter_lines(chunks):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield InvalidItem()
+
+
+def iter_csv(chunks):
+    # The first row names the columns, the way csv.DictWriter writes them
+    reader = csv.DictReader(iter_lines(chunks))
+    if reader.fieldnames is None:
+        return
+    if "link" not in reader.fieldnames:
+        raise ImportFormatError("The CSV header has no link column")
+    yield from reader
+
+
+def detect_format(filename, first_chunk):
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+    start = first_chunk.lstrip()[:1]
+    if start == "[":
+        return "json"
+    if start == "{":
+        return "ndjson"
+    return "csv"
+
+
+def iter_items(stream, filename=None, format=None, chunk_size=CHUNK_SIZE):
+    """Yield the products in an uploaded file as dicts; the format is guessed when not given."""
+    chunks = iter_text(stream, chunk_size)
+    first = next(chunks, "")
+    if format is None:
+        format = detect_format(filename, first)
+    elif format not in FORMATS:
+        raise ImportFormatError(f"Unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+
+    def all_chunks():
+        if first:
+            yield first
+        yield from chunks
+
+    if format == "json":
+        return iter_json_array(all_chunks())
+    if format == "ndjson":
+        return iter_ndjson(all_chunks())
+    return iter_csv(all_chunks())
+
+
+def to_row(item):
+    """The values to insert for one item, or None when it is not a usable product."""
+    if not isinstance(item, dict):
+        return None
+    link = item.get("link")
+    if not isinstance(link, str) or not link:
+        return None
+    row = (item.get("name"), item.get("price"), link, item.get("additional_info") or "")
+    # sqlite3 can only bind scalars
+    if any(isinstance(value, (dict, list)) for value in row):
+        return None
+    return row
+
+
+def import_products(conn, items, batch_size=BATCH_SIZE):
+    """Insert items in batches of batch_size, committing each batch.
+
+    Returns a report with the inserted/ignored/invalid counts of every batch and the
+    totals. Products whose link is already stored are ignored. A format error stops the
+    import: the items read before it are still inserted, and the error is in the report.
+    """
+    report = {"batches": [], "inserted": 0, "ignored": 0, "invalid": 0, "error": None}
+    cursor = conn.cursor()
+    cursor.execute(STAGING_TABLE)
+
+    def flush(rows, invalid):
+        inserted = 0
+        if rows:
+            with conn:
+                cursor.executemany(STAGE, rows)
+                # Rows whose link already exists are skipped and not counted
+                inserted = cursor.execute(INSERT).rowcount
+                cursor.execute(CLEAR)
+        batch = {"batch": len(report["batches"]) + 1, "rows": len(rows) + invalid,
+                 "inserted": inserted, "ignored": len(rows) - inserted, "invalid": invalid}
+        report["batches"].append(batch)
+        for key in ("inserted", "ignored", "invalid"):
+            report[key] += batch[key]
+
+    rows, invalid = [], 0
+    try:
+        for item in items:
+            row = to_row(item)
+            if row is None:
+                invalid += 1
+            else:
+                rows.append(row)
+            if len(rows) + invalid >= batch_size:
+                flush(rows, invalid)
+                rows, invalid = [], 0
+    except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        report["error"] = str(e)
+    if rows or invalid:
+        flush(rows, invalid)
+    return report
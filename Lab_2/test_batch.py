@@ -0,0 +1,61 @@
+import sqlite3
+import unittest
+from batch import apply_batch
+from db import migrate
+
+# Run with: python -m unittest test_batch (or pytest) from Lab_2
+
+
+def product(i, **fields):
+    return dict({"name": f"TV {i}", "price": f"{1000 + i} lei", "link": f"https://ultra.md/product/{i}",
+                 "additional_info": ""}, **fields)
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        migrate(self.conn)
+        apply_batch(self.conn, [{"op": "create", "product": product(i)} for i in range(3)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def rows(self):
+        return self.conn.execute("SELECT id, name, price FROM products ORDER BY id").fetchall()
+
+    def test_mixed_operations(self):
+        report = apply_batch(self.conn, [
+            {"op": "create", "product": product(3)},
+            {"op": "create", "product": product(0)},
+            {"op": "upsert", "product": product(1, name="Renamed")},
+            {"op": "upsert", "product": product(4)},
+            {"op": "update", "id": 3, "product": {"price": "5 lei"}},
+            {"op": "update", "link": "https://ultra.md/product/2", "product": {"name": "By link"}},
+            {"op": "delete", "id": 4},
+            {"op": "delete", "id": 99},
+            {"op": "rename"},
+        ])
+        self.assertEqual([(r["status"], r["id"]) for r in report["results"]],
+                         [(201, 4), (400, None), (200, 2), (200, 6), (200, 3), (200, 3), (200, 4), (404, None),
+                          (400, None)])
+        self.assertEqual((report["committed"], report["succeeded"], report["failed"]), (True, 6, 3))
+        self.assertEqual(self.rows(), [(1, "TV 0", "1000 lei"), (2, "Renamed", "1001 lei"), (3, "By link", "5 lei"),
+                                       (6, "TV 4", "1004 lei")])
+        self.assertEqual(self.conn.execute("SELECT row_count FROM product_stats").fetchone()[0], 4)
+
+    def test_unchanged_upsert_returns_id(self):
+        report = apply_batch(self.conn, [{"op": "upsert", "product": product(2)}])
+        self.assertEqual((report["results"][0]["status"], report["results"][0]["id"]), (200, 3))
+
+    def test_atomic_batch_rolls_back(self):
+        before = self.rows()
+        report = apply_batch(self.conn, [{"op": "create", "product": product(5)}, {"op": "delete", "id": 2},
+                                         {"op": "create", "product": product(0)}, {"op": "delete", "id": 3}],
+                             atomic=True)
+        self.assertEqual([r["status"] for r in report["results"]], [201, 200, 400, None])
+        self.assertEqual((report["committed"], report["succeeded"]), (False, 0))
+        self.assertEqual(self.rows(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from bus import LocalBus, UnixSocketBus, from_url
+
+# Run with: python -m unittest test_bus (or pytest) from Lab_2
+
+
+def publish_and_collect(index, path, workers, barrier, results):
+    received = []
+    done = threading.Event()
+
+    def deliver(room, message):
+        received.append((room, message))
+        if len(received) == 3 * workers:
+            done.set()
+
+    bus = UnixSocketBus(path)
+    bus.start(deliver)
+    barrier.wait()
+    for i in range(3):
+        bus.publish(f"room-{i}", f"{index}:{i}")
+    done.wait(10)
+    results.put((index, sorted(received)))
+    barrier.wait()
+    bus.close()
+
+
+class Collector:
+    def __init__(self):
+        self.received = []
+        self.condition = threading.Condition()
+
+    def __call__(self, room, message):
+        with self.condition:
+            self.received.append((room, message))
+            self.condition.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.received) >= count, timeout)
+
+
+class BusTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+
+    def test_local_bus(self):
+        collector = Collector()
+        bus = from_url("local")
+        self.assertIsInstance(bus, LocalBus)
+        bus.start(collector)
+        bus.publish("r", "hi")
+        self.assertEqual(collector.received, [("r", "hi")])
+
+    def test_messages_reach_every_worker_process(self):
+        workers = 3
+        barrier = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=publish_and_collect, args=(i, self.path, workers, barrier, results))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        received = [results.get(timeout=20) for _ in processes]
+        for process in processes:
+            process.join(10)
+        expected = sorted((f"room-{i}", f"{w}:{i}") for w in range(workers) for i in range(3))
+        self.assertEqual([messages for _, messages in sorted(received)], [expected] * workers)
+
+    def test_a_worker_takes_over_when_the_hub_exits(self):
+        first, second, third = Collector(), Collector(), Collector()
+        hub, peer = UnixSocketBus(self.path), UnixSocketBus(self.path)
+        hub.start(first)
+        peer.start(second)
+        self.assertTrue(hub.is_hub)
+        hub.close()
+        deadline = time.monotonic() + 5
+        while not peer.is_hub and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(peer.is_hub)
+        late = UnixSocketBus(self.path)
+        late.start(third)
+        late.publish("r", "after failover")
+        self.assertTrue(second.wait_for(1))
+        self.assertEqual(second.received, [("r", "after failover")])
+        peer.close()
+        late.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
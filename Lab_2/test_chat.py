@@ -0,0 +1,41 @@
+import unittest
+from chat import Rooms, RoomBroadcaster, parse_event
+
+# Run with: python -m unittest test_chat (or pytest) from Lab_2
+
+
+class RoomsTest(unittest.TestCase):
+    def test_counts_follow_joins_leaves_and_disconnects(self):
+        rooms = Rooms()
+        self.assertEqual([rooms.join("a", "r1"), rooms.join("b", "r1"), rooms.join("a", "r2")], [1, 2, 1])
+        self.assertEqual(rooms.leave("b", "r1"), 1)
+        self.assertEqual(rooms.leave("b", "r1"), 1)
+        self.assertEqual(rooms.disconnect("a"), {"r1", "r2"})
+        self.assertEqual(rooms.counts(), {})
+
+
+class BroadcasterTest(unittest.TestCase):
+    def test_messages_are_batched_per_room(self):
+        broadcaster = RoomBroadcaster(max_batch=3)
+        for i in range(4):
+            broadcaster.publish("busy", (i + 1, 100.0 + i, f"m{i}"))
+        broadcaster.publish("quiet", (1, 200.0, "hello"))
+        self.assertEqual(broadcaster.drain(), [
+            ("message_batch", (["m0", "m1", "m2"], {"room": "busy", "seq": 3, "ts": 102.0}), "busy"),
+            ("message", ("m3", {"room": "busy", "seq": 4, "ts": 103.0}), "busy"),
+            ("message", ("hello", {"room": "quiet", "seq": 1, "ts": 200.0}), "quiet"),
+        ])
+        self.assertEqual(broadcaster.drain(), [])
+        self.assertEqual(broadcaster.stats()["messages"], 5)
+
+    def test_parse_event(self):
+        self.assertEqual(parse_event({"room": "r", "message": "hi"}, "room", "message"), ("r", "hi"))
+        self.assertEqual(parse_event('{"room": "r", "message": "hi"}', "room", "message"), ("r", "hi"))
+        self.assertIsNone(parse_event("not json", "room", "message"))
+        self.assertIsNone(parse_event({"room": "r"}, "room", "message"))
+        self.assertEqual(parse_event({"username": "u", "room": "r", "since_seq": 4}, "username", "room",
+                                     optional=("history", "since_seq")), ("u", "r", None, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
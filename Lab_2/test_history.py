@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from history import RoomHistory
+
+# Run with: python -m unittest test_history (or pytest) from Lab_2
+
+
+class HistoryTest(unittest.TestCase):
+    def test_ring_buffer_and_replay(self):
+        history = RoomHistory(size=3)
+        for i in range(5):
+            self.assertEqual(history.append("r", f"m{i}", 100.0 + i), (i + 1, 100.0 + i, f"m{i}"))
+        self.assertEqual([m["message"] for m in history.replay("r")], ["m2", "m3", "m4"])
+        self.assertEqual([m["seq"] for m in history.replay("r", since_seq=3)], [4, 5])
+        self.assertEqual([m["message"] for m in history.replay("r", since=103.0)], ["m4"])
+        self.assertEqual(history.replay("other"), [])
+
+    def test_memory_caps(self):
+        history = RoomHistory(max_room_bytes=1000, max_bytes=2500)
+        for i in range(20):
+            history.append("a", "x" * 200, float(i))
+        self.assertLessEqual(history.stats()["bytes"], 1000)
+        history.append("b", "y" * 900, 1.0)
+        history.append("c", "z" * 900, 2.0)
+        # "a" was the least recently active room once the total went over
+        self.assertEqual(history.replay("a"), [])
+        self.assertEqual(history.stats()["rooms"], 2)
+
+    def test_idle_rooms_are_dropped(self):
+        history = RoomHistory(idle_seconds=0)
+        history.append("quiet", "hello", 1.0)
+        history.append("busy", "hi", 2.0)
+        self.assertEqual(history.stats()["rooms"], 1)
+
+    def test_persisted_history_is_replayed(self):
+        path = os.path.join(tempfile.mkdtemp(), "chat.db")
+        writer = RoomHistory(path, flush_interval=0.01)
+        for i in range(5):
+            writer.persist("r", f"m{i}", 100.0 + i)
+        writer.close()
+
+        history = RoomHistory(path, size=10)
+        self.assertEqual([m["message"] for m in history.replay("r")], ["m0", "m1", "m2", "m3", "m4"])
+        history.append("r", "live", 200.0)
+        self.assertEqual([m["message"] for m in history.replay("r", since=102.0)], ["m3", "m4", "live"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import sqlite3
+import unittest
+from db import migrate
+from importer import ImportFormatError, import_products, iter_items, iter_json_array
+
+# Run with: python -m unittest test_importer (or pytest) from Lab_2
+
+
+def products(count):
+    return [{"name": f'TV "{i}" ăî', "price": f"{1000 + i} lei", "link": f"https://ultra.md/product/{i}",
+             "additional_info": "line\nbreak, comma\u2028"} for i in range(count)]
+
+
+def items(data, filename=None, format=None, chunk_size=7):
+    return list(iter_items(io.BytesIO(data.encode()), filename, format, chunk_size))
+
+
+class ParseTest(unittest.TestCase):
+    def test_json_array_across_chunks(self):
+        value = products(20) + [12345, [1, [2]], "x", None, 1.5e3]
+        text = json.dumps(value, indent=1, ensure_ascii=False)
+        for chunk_size in (1, 2, 3, 16, len(text)):
+            with self.subTest(chunk_size=chunk_size):
+                chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+                self.assertEqual(list(iter_json_array(chunks)), value)
+
+    def test_multibyte_characters_split_between_reads(self):
+        self.assertEqual(items(json.dumps(products(3), ensure_ascii=False), chunk_size=1), products(3))
+
+    def test_empty_and_malformed_arrays(self):
+        self.assertEqual(items(" [ ] \n"), [])
+        for text in ["", "{}", '[{"a": 1} {"b": 2}]', '[{"a": 1},', "[1] x", '[{"a": tru}]']:
+            with self.subTest(text=text):
+                with self.assertRaises(ImportFormatError):
+                    items(text, format="json")
+
+    def test_syntax_error_is_reported_without_reading_on(self):
+        read = []
+
+        def chunks():
+            yield '[{"name": "TV", "price": x}, '
+            for item in products(1000):
+                read.append(item)
+                yield json.dumps(item) + ", "
+            yield "1]"
+
+        with self.assertRaises(ImportFormatError):
+            list(iter_json_array(chunks()))
+        self.assertLess(len(read), 5)
+
+    def test_ndjson(self):
+        text = "\n".join(json.dumps(item) for item in products(5)) + "\n\n"
+        self.assertEqual(items(text, "dump.jsonl"), products(5))
+        self.assertEqual(items(text), products(5))  # Detected from the first character
+
+    def test_csv(self):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=["name", "price", "link", "additional_info"])
+        writer.writeheader()
+        writer.writerows(products(5))
+        self.assertEqual(items(output.getvalue(), "dump.csv"), products(5))
+        with self.assertRaises(ImportFormatError):
+            items("name,price\nx,1\n", "dump.csv")
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        migrate(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_batches_and_counts(self):
+        data = products(10) + [products(1)[0], "not an object", {"name": "no link"}, {"link": "x", "name": {}}]
+        report = import_products(self.conn, data, batch_size=4)
+        self.assertEqual([(b["rows"], b["inserted"], b["ignored"], b["invalid"]) for b in report["batches"]],
+                         [(4, 4, 0, 0), (4, 4, 0, 0), (4, 2, 1, 1), (2, 0, 0, 2)])
+        self.assertEqual((report["inserted"], report["ignored"], report["invalid"]), (10, 1, 3))
+        self.assertIsNone(report["error"])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 10)
+
+    def test_format_error_keeps_earlier_rows(self):
+        text = json.dumps(products(10))[:-40]
+        report = import_products(self.conn, iter_items(io.BytesIO(text.encode()), "dump.json"), batch_size=3)
+        self.assertIsNotNone(report["error"])
+        self.assertEqual(report["inserted"], self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0])
+        self.assertGreaterEqual(report["inserted"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
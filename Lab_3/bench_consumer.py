@@ -0,0 +1,117 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import requests
+
+# How fast the product queue drains: one POST per product with auto-ack (what consumer.py
+# used to do) against BulkConsumer writing through POST /products/batch and straight into
+# the database, then the HTTP run's products again (a re-scrape) without and with the
+# LinkFilter that skips stored links. The queue is the in-process stand-in broker,
+# pre-filled with --messages products; webserver.py runs in-process on a temporary database.
+#
+#   python bench_consumer.py --messages 5000 --per-message 100
+
+
+def fill_queue(broker, queue_name, prefix, count, per_message):
+    products = [{"name": f"TV {i}", "price": f"{1000 + i} lei", "link": f"https://ultra.md/{prefix}/{i}"}
+                for i in range(count)]
+    for start in range(0, count, per_message):
+        chunk = products[start:start + per_message]
+        broker.publish(queue_name, json.dumps(chunk if per_message > 1 else chunk[0]))
+
+
+def serve_webserver():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["PRODUCTS_DB"] = path
+
+    from werkzeug.serving import make_server
+    import webserver
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    webserver.init_db()
+    server = make_server("127.0.0.1", 0, webserver.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, path
+
+
+def post_each(connection, queue_name, url):
+    # The old consumer: auto-ack, a new HTTP connection per product
+    channel = connection.channel()
+
+    def callback(ch, method, properties, body):
+        message = json.loads(body)
+        for product in message if isinstance(message, list) else [message]:
+            product.setdefault("additional_info", "")
+            requests.post(url + "/products", json=product)
+
+    channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+    channel.start_consuming()
+
+
+def bulk(connection, queue_name, sink, args, seen=None):
+    from consumer import BulkConsumer
+    consumer = BulkConsumer(connection, sink, queue_name, prefetch=args.prefetch, batch_size=args.batch_size,
+                            workers=args.workers, seen=seen)
+    consumer.run()
+    return consumer.counts["duplicates"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ways of draining the product queue")
+    parser.add_argument("--messages", type=int, default=5000, help="Products in the queue")
+    parser.add_argument("--per-message", type=int, default=1, help="Products per message (100 from BatchPublisher)")
+    parser.add_argument("--prefetch", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--skip-per-product", action="store_true", help="Leave out the slow one-POST-per-product run")
+    args = parser.parse_args()
+
+    url, server, path = serve_webserver()
+    from consumer import DBSink, HTTPSink
+    from dedup import LinkFilter
+    from standin_broker import StandInBroker
+
+    # (name, which products, run); the re-scrapes queue the HTTP run's products again
+    runs = [("POST per product, auto-ack", 0, lambda conn, queue: post_each(conn, queue, url)),
+            ("bulk, POST /products/batch", 1,
+             lambda conn, queue: bulk(conn, queue, HTTPSink(url, args.workers), args)),
+            ("bulk, straight to the database", 2,
+             lambda conn, queue: bulk(conn, queue, DBSink(path, args.workers), args)),
+            ("re-scrape, bulk HTTP, no dedup", 1,
+             lambda conn, queue: bulk(conn, queue, HTTPSink(url, args.workers), args)),
+            ("re-scrape, bulk HTTP, dedup", 1,
+             lambda conn, queue: bulk(conn, queue, HTTPSink(url, args.workers), args, LinkFilter(path)))]
+    if args.skip_per_product:
+        runs = runs[1:]
+
+    print(f"{'mode':<32} {'products':>9} {'stored':>8} {'dupes':>6} {'seconds':>8} {'products/s':>11}")
+    try:
+        for index, (name, prefix, run) in enumerate(runs):
+            queue_name = f"bench_{index}"
+            broker = StandInBroker(stop_when_drained=True)
+            fill_queue(broker, queue_name, prefix, args.messages, args.per_message)
+            connection = broker.connect()
+            start = time.perf_counter()
+            duplicates = run(connection, queue_name)
+            elapsed = time.perf_counter() - start
+            with sqlite3.connect(path) as conn:
+                stored = conn.execute("SELECT COUNT(*) FROM products WHERE link LIKE ?",
+                                      (f"https://ultra.md/{prefix}/%",)).fetchone()[0]
+            duplicates = "-" if duplicates is None else duplicates
+            print(f"{name:<32} {args.messages:>9} {stored:>8} {duplicates:>6} {elapsed:>8.2f} "
+                  f"{args.messages / elapsed:>11.0f}")
+    finally:
+        server.shutdown()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,306 @@
+import argparse
 import pika
 import requests
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import batch
+from db import ConnectionPool
+from dedup import LinkFilter
 
-# Consume Messages and Forward to Webserver
-def consume_and_forward(queue_name="scraper_queue", webserver_url="http://localhost:5000/products"):
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
-    channel.queue_declare(queue=queue_name)
+# Products that cannot be stored are not requeued in place, where they would come right
+# back: a write that keeps failing goes through scraper_queue.retry.1s, .5s and .30s
+# (queues whose messages expire back into scraper_queue), then to scraper_queue.dlq,
+# where products the webserver rejected go straight away. Duplicates are acked.
+
+QUEUE_NAME = "scraper_queue"
+WEBSERVER_URL = "http://localhost:5000"
+PREFETCH = 2000  # Unacknowledged messages the broker lets us hold
+BATCH_SIZE = 500  # Products per bulk write
+BATCH_DELAY = 0.2  # Seconds a product waits for its batch to fill up
+WORKERS = 4  # Bulk writes in flight
+RETRIES = 3  # Attempts on the worker thread before the batch goes to the retry queues
+BACKOFF = 0.5  # Seconds, doubled after every failed attempt
+RETRY_DELAYS = (1, 5, 30)  # Seconds a failed message waits in each retry queue, then it is dead
+DUPLICATE = "Product already exists"  # What the webserver and batch.apply_batch answer for a stored link
+
+
+class HTTPSink:
+    """Writes products through the webserver's POST /products/batch, on pooled connections."""
+
+    def __init__(self, url=WEBSERVER_URL, workers=WORKERS):
+        self.url = url.rstrip("/") + "/products/batch"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def write(self, operations):
+        """Apply the operations and return their results (see batch.apply_batch)."""
+        response = self.session.post(self.url, json={"operations": operations}, timeout=60)
+        # Per-product failures come back as results, anything else is worth retrying
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def close(self):
+        self.session.close()
+
+
+class DBSink:
+    """Writes products straight into the database, skipping the HTTP hop."""
+
+    def __init__(self, path, workers=WORKERS):
+        self.pool = ConnectionPool(path, max_size=workers)
+
+    def write(self, operations):
+        with self.pool.connection() as conn:
+            return batch.apply_batch(conn, operations)["results"]
+
+    def close(self):
+        self.pool.close_all()
+
+
+class BulkConsumer:
+    """Consumes products with manual acks and forwards them to a sink in bulk writes.
+
+    Messages (one product, or a JSON array from publisher.BatchPublisher) are collected
+    until batch_size products or batch_delay seconds, then written by a pool of worker
+    threads. With a dedup.LinkFilter, products whose link is already stored are dropped
+    before the write. A message is acknowledged once its products are written, turned
+    down as duplicates, or moved to another queue: products the sink rejects for any
+    other reason go to the dead-letter queue, and a write that keeps failing sends its
+    messages to the retry queues. Acks and publishes happen on the connection's thread
+    (pika is not thread-safe), acks with multiple=True up to the oldest message in flight.
+    """
 
-    def callback(ch, method, properties, body):
-        product = json.loads(body)
-        print(f"Received: {product}")
+    def __init__(self, connection, sink, queue_name=QUEUE_NAME, prefetch=PREFETCH, batch_size=BATCH_SIZE,
+                 batch_delay=BATCH_DELAY, workers=WORKERS, retries=RETRIES, backoff=BACKOFF,
+                 retry_delays=RETRY_DELAYS, seen=None):
+        self.connection = connection
+        self.sink = sink
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.seen = seen
+        self.counts = {"messages": 0, "products": 0, "written": 0, "duplicates": 0, "rejected": 0, "retried": 0,
+                       "dead": 0, "batches": 0}
+        self.channel = connection.channel()
+        self.channel.queue_declare(queue=queue_name)
+        self.channel.basic_qos(prefetch_count=prefetch)
+        # Retried and dead messages are published with confirms before the original is acked
+        self.publish_channel = connection.channel()
+        self.publish_channel.confirm_delivery()
+        self.retry_queues = [declare_retry_queue(self.publish_channel, queue_name, delay) for delay in retry_delays]
+        self.dead_letter_queue = queue_name + ".dlq"
+        self.publish_channel.queue_declare(queue=self.dead_letter_queue, durable=True)
+        # Not bounded itself: the prefetch limit caps what can be waiting in it
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="forward")
+        self._messages = []  # (delivery tag, products, retries so far) of the batch being collected
+        self._collected = 0  # Products in them
+        self._timer = None
+        self._unacked = deque()  # Every delivery tag not acked yet, in order
+        self._done = set()  # Those of them that are finished
 
-        # Add missing fields if required by the webserver
-        product.setdefault("additional_info", "")
+    def run(self):
+        self.channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+        print("Waiting for messages...")
+        try:
+            self.channel.start_consuming()
+        finally:
+            self.close()
 
-        # Forward product data to the webserver
-        response = requests.post(webserver_url, json=product)
-        print(f"Forwarded to Webserver: {response.status_code}, {response.text}")
+    def stop(self):
+        self.channel.stop_consuming()
+
+    def close(self):
+        # Write what was collected, then wait for the writes so their acks go out
+        self._flush()
+        self._executor.shutdown(wait=True)
+        self.connection.process_data_events(time_limit=0)
+        self.sink.close()
+
+    def _on_message(self, channel, method, properties, body):
+        self._unacked.append(method.delivery_tag)
+        self.counts["messages"] += 1
+        retries = (properties.headers or {}).get("x-retries", 0)
+        try:
+            message = json.loads(body)
+        except ValueError:
+            print(f"Dead-lettering a message that is not JSON: {body[:100]!r}")
+            self._dead_letter(body, retries, "Not JSON")
+            self._finish([method.delivery_tag])
+            return
+        # One product, or a batch of them from publisher.BatchPublisher
+        products = message if isinstance(message, list) else [message]
+        self._messages.append((method.delivery_tag, products, retries))
+        self._collected += len(products)
+        self.counts["products"] += len(products)
+        if self._collected >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.connection.call_later(self.batch_delay, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+        if not self._messages:
+            return
+        messages = self._messages
+        self._messages, self._collected = [], 0
+        self._executor.submit(self._forward, messages)
+
+    def _forward(self, messages):
+        # On a worker thread. Every message has to be settled whatever goes wrong: the
+        # cumulative ack stops at one that is not, and once prefetch fills, so does delivery
+        try:
+            self._write(messages)
+        except Exception as e:
+            print(f"Could not forward {len(messages)} messages, retrying them later: {e!r}")
+            error = repr(e)
+            self.connection.add_callback_threadsafe(lambda: self._retry(messages, error, 0))
+
+    def _write(self, messages):
+        links = [product.get("link") if isinstance(product, dict) else None
+                 for _, products, _ in messages for product in products]
+        new = iter(self.seen.new(links) if self.seen is not None else [True] * len(links))
+        operations = []
+        owners = []  # The message each operation came from
+        for index, (_, products, _) in enumerate(messages):
+            for product in products:
+                if not next(new):
+                    continue
+                if isinstance(product, dict):
+                    # Add missing fields if required by the webserver
+                    product.setdefault("additional_info", "")
+                operations.append({"op": "create", "product": product})
+                owners.append(index)
+        duplicates = len(links) - len(operations)
+        results = []
+        for attempt in range(self.retries + 1):
+            if not operations:
+                break
+            try:
+                results = self.sink.write(operations)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Could not write {len(operations)} products, retrying them later: {e!r}")
+                    left = [(tag, [operation["product"] for operation, owner in zip(operations, owners)
+                                   if owner == index], retries)
+                            for index, (tag, _, retries) in enumerate(messages)]
+                    error = repr(e)
+                    self.connection.add_callback_threadsafe(lambda: self._retry(left, error, duplicates))
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+        written = 0
+        stored = []  # Links written or found to be there already
+        rejected = {}  # Message index -> (products, errors)
+        for operation, owner, result in zip(operations, owners, results):
+            if result["status"] < 300:
+                written += 1
+                stored.append(operation["product"].get("link"))
+            elif result["status"] == 400 and result["message"] == DUPLICATE:
+                duplicates += 1
+                stored.append(operation["product"].get("link"))
+            else:
+                products, errors = rejected.setdefault(owner, ([], set()))
+                products.append(operation["product"])
+                errors.add(result["message"])
+        if self.seen is not None:
+            self.seen.add(stored)
+        dead = [(messages[index][0], products, messages[index][2], "; ".join(sorted(errors)))
+                for index, (products, errors) in rejected.items()]
+        self.connection.add_callback_threadsafe(
+            lambda: self._written([tag for tag, _, _ in messages], written, duplicates, dead))
+
+    def _written(self, tags, written, duplicates, dead):
+        # Products the sink turned down are not retried, they would be turned down again
+        self.counts["batches"] += 1
+        self.counts["written"] += written
+        self.counts["duplicates"] += duplicates
+        for _, products, retries, error in dead:
+            self._dead_letter(json.dumps(products), retries, error)
+            self.counts["rejected"] += len(products)
+        self._finish(tags)
+
+    def _retry(self, messages, error, duplicates):
+        self.counts["duplicates"] += duplicates
+        for tag, products, retries in messages:
+            if not products:
+                continue  # Only duplicates in it
+            if retries >= len(self.retry_queues):
+                self._dead_letter(json.dumps(products), retries, error)
+            else:
+                self._publish(self.retry_queues[retries], json.dumps(products), {"x-retries": retries + 1})
+                self.counts["retried"] += 1
+        self._finish([tag for tag, _, _ in messages])
+
+    def _dead_letter(self, body, retries, error):
+        self._publish(self.dead_letter_queue, body, {"x-retries": retries, "x-error": error})
+        self.counts["dead"] += 1
+
+    def _publish(self, queue, body, headers):
+        self.publish_channel.basic_publish(exchange="", routing_key=queue, body=body,
+                                           properties=pika.BasicProperties(content_type="application/json",
+                                                                           delivery_mode=2, headers=headers))
+
+    def _finish(self, tags):
+        # Batches finish out of order; one ack covers everything up to the oldest one still in flight
+        self._done.update(tags)
+        last = None
+        while self._unacked and self._unacked[0] in self._done:
+            last = self._unacked.popleft()
+            self._done.remove(last)
+        if last is not None:
+            self.channel.basic_ack(delivery_tag=last, multiple=True)
+
+
+def declare_retry_queue(channel, queue_name, delay):
+    """Declare the queue that holds messages for delay seconds, then hands them back to queue_name."""
+    name = f"{queue_name}.retry.{delay:g}s"
+    channel.queue_declare(queue=name, durable=True,
+                          arguments={"x-message-ttl": int(delay * 1000), "x-dead-letter-exchange": "",
+                                     "x-dead-letter-routing-key": queue_name})
+    return name
+
+
+# Consume Messages and Forward to Webserver
+def consume_and_forward(queue_name=QUEUE_NAME, webserver_url=WEBSERVER_URL, db_path=None, host="localhost",
+                        dedup=True, seen_db=None, **options):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host))
+    workers = options.get("workers", WORKERS)
+    sink = DBSink(db_path, workers) if db_path else HTTPSink(webserver_url, workers)
+    seen = LinkFilter(seen_db or db_path) if dedup else None
+    consumer = BulkConsumer(connection, sink, queue_name, seen=seen, **options)
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Consumed: {consumer.counts}")
+        if seen is not None:
+            print(f"Dedup: {seen.counts}")
+            seen.close()
+        connection.close()
 
-    channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
-    print("Waiting for messages...")
-    channel.start_consuming()
 
 if __name__ == "__main__":
-    consume_and_forward()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Forward the products queued by publisher.py to the database")
+    parser.add_argument("--url", default=WEBSERVER_URL, help="Webserver to send the products to")
+    parser.add_argument("--db", help="Write to this database directly instead of through the webserver")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Products per bulk write")
+    parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Bulk writes in flight")
+    parser.add_argument("--seen-db", help="Database to look up stored links in (defaults to --db, else only "
+                                          "recently stored links are skipped)")
+    parser.add_argument("--no-dedup", action="store_true", help="Send every product to the sink")
+    args = parser.parse_args()
+    consume_and_forward(webserver_url=args.url, db_path=args.db, dedup=not args.no_dedup, seen_db=args.seen_db,
+                        prefetch=args.prefetch, batch_size=args.batch_size, batch_delay=args.batch_delay,
+                        workers=args.workers)
@@ -0,0 +1,128 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from db import ConnectionPool
+
+# Re-scraping ultra.md queues mostly products that are already stored. consumer.py asks a
+# LinkFilter which links are new before writing, so the duplicates are acked without a
+# trip to the webserver and its unique constraint on link.
+
+RECENT = 100_000  # Links kept exactly, most recently seen first
+CAPACITY = 1_000_000  # Links the Bloom filter holds at ERROR_RATE, more only raise the rate
+ERROR_RATE = 0.001
+LOOKUP_CHUNK = 500  # Links per SELECT ... IN (...)
+
+
+class BloomFilter:
+    """A set of strings that answers "maybe" or "definitely not", in about 1.8 MB per million."""
+
+    def __init__(self, capacity=CAPACITY, error_rate=ERROR_RATE):
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Two halves of one digest, combined into as many hashes as needed
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class LinkFilter:
+    """Tells which product links are already stored, so their messages can skip the write.
+
+    The last `recent` links stored are kept exactly. With a database, every stored link is
+    also in a Bloom filter: a link it has never seen is new without asking the database,
+    and one it may have seen is looked up there, since the filter has false positives.
+    Without a database, links that fell out of the recent ones are let through and the
+    unique constraint catches them. Safe to share between threads.
+    """
+
+    def __init__(self, db_path=None, recent=RECENT, capacity=CAPACITY, error_rate=ERROR_RATE):
+        self.recent = OrderedDict()
+        self.recent_size = recent
+        self.bloom = BloomFilter(capacity, error_rate) if db_path else None
+        self.pool = ConnectionPool(db_path, max_size=2) if db_path else None
+        self.counts = {"checked": 0, "recent": 0, "stored": 0, "lookups": 0}
+        self._lock = threading.Lock()
+        if self.pool is not None:
+            self._load()
+
+    def _load(self):
+        with self.pool.connection() as conn:
+            links = [row[0] for row in conn.execute("SELECT link FROM products WHERE link IS NOT NULL ORDER BY id")]
+        for link in links:
+            self.bloom.add(link)
+        self._remember(links[-self.recent_size:])
+
+    def _remember(self, links):
+        for link in links:
+            self.recent[link] = True
+            self.recent.move_to_end(link)
+        while len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+
+    def new(self, links):
+        """Return whether each link is new: not stored and not earlier in the list.
+
+        Anything that is not a string counts as new, the sink decides what to do with it.
+        """
+        result = []
+        maybe = []  # Indexes the Bloom filter may have seen
+        with self._lock:
+            self.counts["checked"] += len(links)
+            batch = set()
+            for index, link in enumerate(links):
+                if not isinstance(link, str):
+                    result.append(True)
+                    continue
+                if link in batch or link in self.recent:
+                    self.counts["recent"] += 1
+                    result.append(False)
+                    continue
+                batch.add(link)
+                result.append(True)
+                if self.bloom is not None and link in self.bloom:
+                    maybe.append(index)
+        if maybe:
+            stored = self._stored([links[index] for index in maybe])
+            for index in maybe:
+                if links[index] in stored:
+                    result[index] = False
+            with self._lock:
+                self.counts["stored"] += len(stored)
+                self.counts["lookups"] += math.ceil(len(maybe) / LOOKUP_CHUNK)
+        return result
+
+    def _stored(self, links):
+        stored = set()
+        with self.pool.connection() as conn:
+            for start in range(0, len(links), LOOKUP_CHUNK):
+                chunk = links[start:start + LOOKUP_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                stored.update(row[0] for row in
+                              conn.execute(f"SELECT link FROM products WHERE link IN ({placeholders})", chunk))
+        return stored
+
+    def add(self, links):
+        """Mark the links as stored."""
+        links = [link for link in links if isinstance(link, str)]
+        with self._lock:
+            self._remember(links)
+            if self.bloom is not None:
+                for link in links:
+                    self.bloom.add(link)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close_all()
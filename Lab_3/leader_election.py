@@ -1,102 +1,232 @@
+import argparse
+import random
+import selectors
 import socket
 import threading
 import time
-import random
+
+# Leader election over UDP between nodes listening on 127.0.0.1:5000 + node id, along the
+# lines of Raft: every vote and heartbeat carries a term, a node votes at most once per
+# term, a candidate needs a majority of the whole cluster, and any message from a later
+# term turns its receiver back into a follower of that term.
+#
+# Each node is one thread blocked in selectors.select() until a datagram arrives or its
+# next deadline is due (the election timeout, or the next heartbeat as leader), so an
+# idle cluster costs next to no CPU. Messages are "kind term sender [granted]".
+#
+#   python leader_election.py --nodes 5 --duration 10 --kill-leader 4
+#   python leader_election.py --nodes 3 --id 0        (one node per process, start 0, 1 and 2)
+
+HOST = "127.0.0.1"
+BASE_PORT = 5000
+ELECTION_TIMEOUT = (0.15, 0.3)  # Seconds without a heartbeat before standing, picked at random in this range
+HEARTBEAT_INTERVAL = 0.05  # Seconds, well under the election timeout
+
+
+def address(node_id):
+    return HOST, BASE_PORT + node_id
+
 
 class Node:
-    def __init__(self, node_id, peers):
+    def __init__(self, node_id, peers, election_timeout=ELECTION_TIMEOUT, heartbeat_interval=HEARTBEAT_INTERVAL):
         self.node_id = node_id
-        self.peers = peers
+        self.peers = peers  # Addresses of the other nodes
+        self.election_timeout = election_timeout
+        self.heartbeat_interval = heartbeat_interval
         self.state = "follower"
-        self.voted_for = None
+        self.term = 0
+        self.voted_for = None  # In this term
+        self.votes = set()  # Nodes that voted for us in this term, as a candidate
         self.leader = None
-        self.timeout = random.randint(5, 10)  # Election timeout in seconds
-        self.lock = threading.Lock()
-        self.simulation_end_time = None
+        self.elections = 0
+        self.election_deadline = None
+        self.heartbeat_deadline = None  # Only while leader
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address(node_id))
+        self.sock.setblocking(False)
+        # stop() writes to it, so a node waiting in select() wakes up at once
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self._wakeup, selectors.EVENT_READ)
+        self.running = False
 
-    def send_message(self, target, message):
-        """Send a UDP message to a peer."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.sendto(message.encode(), target)
+    def majority(self):
+        return (len(self.peers) + 1) // 2 + 1
+
+    def send_message(self, target, *fields):
+        """Send a UDP message to a peer; a peer that is down just misses it."""
+        try:
+            self.sock.sendto(" ".join(str(field) for field in fields).encode(), target)
+        except OSError:
+            pass
+
+    def broadcast(self, *fields):
+        for peer in self.peers:
+            self.send_message(peer, *fields)
+
+    def reset_election_timer(self):
+        self.election_deadline = time.monotonic() + random.uniform(*self.election_timeout)
+
+    def run(self, duration=None):
+        """Handle messages and timers until stop() is called or duration seconds have passed."""
+        end = time.monotonic() + duration if duration else None
+        self.running = True
+        self.reset_election_timer()
+        try:
+            while self.running:
+                now = time.monotonic()
+                if end is not None and now >= end:
+                    break
+                deadline = min(d for d in (self.election_deadline, self.heartbeat_deadline, end) if d is not None)
+                for key, _ in self.selector.select(max(0.0, deadline - now)):
+                    if key.fileobj is self._wakeup:
+                        self._wakeup.recv(64)
+                    else:
+                        self.receive_messages()
+                self.check_timers()
+        finally:
+            self.running = False
+            self.close()
+
+    def stop(self):
+        """Make run() return; safe to call from another thread."""
+        self.running = False
+        try:
+            self._waker.send(b"x")
+        except OSError:
+            pass
+
+    def close(self):
+        self.selector.close()
+        for sock in (self.sock, self._wakeup, self._waker):
+            sock.close()
 
     def receive_messages(self):
-        """Listen for incoming messages and handle them."""
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind(("127.0.0.1", 5000 + self.node_id))
-            while time.time() < self.simulation_end_time:
-                data, _ = sock.recvfrom(1024)
-                message = data.decode()
-                self.handle_message(message)
-
-    def handle_message(self, message):
-        """Process received messages."""
-        with self.lock:
-            if message.startswith("heartbeat"):
-                self.timeout = random.randint(5, 10)  # Reset timeout
-                self.leader = int(message.split()[1])
-                print(f"Node {self.node_id} received heartbeat from Leader {self.leader}")
-            elif message.startswith("vote_request"):
-                candidate_id = int(message.split()[1])
-                if self.voted_for is None:
-                    self.voted_for = candidate_id
-                    self.send_message(("127.0.0.1", 5000 + candidate_id), f"vote_granted {self.node_id}")
-                    print(f"Node {self.node_id} voted for {candidate_id}")
-            elif message.startswith("vote_granted"):
-                print(f"Node {self.node_id} received a vote from Node {message.split()[1]}")
+        """Handle every datagram waiting on the socket."""
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(1024)
+            except BlockingIOError:
+                return
+            except OSError:
+                continue  # An ICMP error from a peer that is down
+            try:
+                kind, term, sender, *rest = data.decode().split()
+                self.handle_message(kind, int(term), int(sender), rest)
+            except ValueError:
+                print(f"Node {self.node_id} ignored a malformed message: {data[:100]!r}")
 
-    def start_election(self):
-        """Start an election process."""
-        with self.lock:
-            self.state = "candidate"
-            self.voted_for = self.node_id
-            votes = 1  # Vote for itself
-            for peer in self.peers:
-                self.send_message(peer, f"vote_request {self.node_id}")
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if votes > len(self.peers) // 2:
-                    self.state = "leader"
-                    self.leader = self.node_id
-                    print(f"Node {self.node_id} became the leader!")
-                    self.send_heartbeats()
-                    return
+    def handle_message(self, kind, term, sender, rest):
+        """Process one received message."""
+        if term > self.term:
+            self.become_follower(term)
+        if kind == "vote_request":
+            granted = term == self.term and self.voted_for in (None, sender)
+            if granted:
+                self.voted_for = sender
+                self.reset_election_timer()
+            self.send_message(address(sender), "vote", self.term, self.node_id, int(granted))
+        elif kind == "vote":
+            if self.state == "candidate" and term == self.term and rest == ["1"]:
+                self.votes.add(sender)
+                if len(self.votes) >= self.majority():
+                    self.become_leader()
+        elif kind == "heartbeat":
+            if term < self.term:
+                # A leader from an earlier term: tell it about this one so it steps down
+                self.send_message(address(sender), "term", self.term, self.node_id)
+                return
+            if self.leader != sender:
+                print(f"Node {self.node_id} follows Leader {sender} in term {term}")
             self.state = "follower"
+            self.leader = sender
+            self.reset_election_timer()
+
+    def check_timers(self):
+        now = time.monotonic()
+        if self.state == "leader":
+            if now >= self.heartbeat_deadline:
+                self.send_heartbeats()
+        elif now >= self.election_deadline:
+            self.start_election()
+
+    def become_follower(self, term):
+        if self.state == "leader":
+            print(f"Node {self.node_id} steps down, term {term} has started")
+        self.state = "follower"
+        self.term = term
+        self.voted_for = None
+        self.votes = set()
+        self.heartbeat_deadline = None
+        self.reset_election_timer()
+
+    def start_election(self):
+        """Stand for leader in a new term; the timer starts another if this one is not won in time."""
+        self.state = "candidate"
+        self.term += 1
+        self.elections += 1
+        self.leader = None
+        self.voted_for = self.node_id
+        self.votes = {self.node_id}
+        self.reset_election_timer()
+        print(f"Node {self.node_id} starting an election for term {self.term}...")
+        if len(self.votes) >= self.majority():
+            self.become_leader()  # A cluster of one
+            return
+        self.broadcast("vote_request", self.term, self.node_id)
+
+    def become_leader(self):
+        self.state = "leader"
+        self.leader = self.node_id
+        self.election_deadline = None
+        print(f"Node {self.node_id} became the leader of term {self.term} with {len(self.votes)} votes!")
+        self.send_heartbeats()
 
     def send_heartbeats(self):
-        """Send periodic heartbeats to peers as the leader."""
-        while self.state == "leader" and time.time() < self.simulation_end_time:
-            for peer in self.peers:
-                self.send_message(peer, f"heartbeat {self.node_id}")
-            time.sleep(2)
-
-    def run(self, simulation_duration):
-        """Run the node, handling timeouts and elections."""
-        self.simulation_end_time = time.time() + simulation_duration
-        threading.Thread(target=self.receive_messages, daemon=True).start()
-        while time.time() < self.simulation_end_time:
-            time.sleep(1)
-            self.timeout -= 1
-            if self.timeout <= 0 and self.state != "leader":
-                print(f"Node {self.node_id} starting an election...")
-                self.start_election()
+        """Tell the followers the leader is alive, and schedule the next round."""
+        self.broadcast("heartbeat", self.term, self.node_id)
+        self.heartbeat_deadline = time.monotonic() + self.heartbeat_interval
 
 
-if __name__ == "__main__":
-    # Configuration
-    num_nodes = 5  # Number of nodes in the simulation
-    simulation_duration = 30  # Duration of the simulation in seconds
-
-    # Initialize nodes and peers
-    nodes = []
-    peers = [("127.0.0.1", 5000 + i) for i in range(num_nodes)]
-    for i in range(num_nodes):
-        node_peers = peers[:i] + peers[i + 1:]
-        nodes.append(Node(i, node_peers))
-
-    # Start all nodes
+def main():
+    parser = argparse.ArgumentParser(description="Elect a leader among UDP nodes")
+    parser.add_argument("--nodes", type=int, default=5, help="Nodes in the cluster")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run for")
+    parser.add_argument("--id", type=int, help="Run only this node, the others in their own processes")
+    parser.add_argument("--election-timeout", type=float, nargs=2, default=ELECTION_TIMEOUT, metavar=("MIN", "MAX"))
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL, help="Seconds between heartbeats")
+    parser.add_argument("--kill-leader", type=float, metavar="SECONDS",
+                        help="Stop whichever node leads after this long, to watch the others take over")
+    args = parser.parse_args()
+
+    ids = [args.id] if args.id is not None else range(args.nodes)
+    nodes = [Node(i, [address(peer) for peer in range(args.nodes) if peer != i], tuple(args.election_timeout),
+                  args.heartbeat) for i in ids]
+    threads = [threading.Thread(target=node.run, args=(args.duration,), daemon=True) for node in nodes]
+    start, cpu = time.monotonic(), time.process_time()
+    for thread in threads:
+        thread.start()
+
+    stopped = set()
+    if args.kill_leader is not None:
+        time.sleep(args.kill_leader)
+        for node in nodes:
+            if node.state == "leader":
+                print(f"Stopping Leader {node.node_id}")
+                stopped.add(node.node_id)
+                node.stop()
+    for thread in threads:
+        thread.join()
+
+    elapsed, cpu = time.monotonic() - start, time.process_time() - cpu
     for node in nodes:
-        threading.Thread(target=node.run, args=(simulation_duration,), daemon=True).start()
+        state = "stopped" if node.node_id in stopped else node.state
+        print(f"Node {node.node_id}: {state}, term {node.term}, leader {node.leader}, "
+              f"{node.elections} elections")
+    print(f"Simulation finished: {cpu:.3f} s of CPU in {elapsed:.1f} s ({cpu / elapsed:.2%})")
+
 
-    # Keep the program running for the simulation duration
-    time.sleep(simulation_duration)
-    print("Simulation finished.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
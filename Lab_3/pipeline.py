@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import batch
+from db import DATABASE, ConnectionPool
+from extract import extract_detail_info, extract_listing
+from fetcher import HostLimiter
+
+# Scrape -> store on one machine without RabbitMQ or HTTP in between. Every stage reads
+# from a bounded asyncio queue and writes to the next one, so when the database falls
+# behind the queues fill up and the scraper waits instead of piling products up in memory.
+#
+#   listing -> fetch (detail pages) -> parse -> batch -> store
+#
+# fetch and parse only run with --details. Blocking work runs in a thread pool per stage,
+# or with --processes, parse and store run in a process pool instead (one SQLite
+# connection per process). --synthetic N feeds N made-up products instead of scraping,
+# for measuring the store side. Per-stage stats are printed every --stats seconds.
+
+URL = "https://ultra.md/category/tv-televizory"
+QUEUE_SIZE = 1000  # Items waiting in front of each stage
+BATCH_SIZE = 500
+BATCH_DELAY = 0.2  # Seconds
+FETCH_WORKERS = 8
+MAX_PER_HOST = 4
+RATE_LIMIT = 10  # Requests per second per host
+PARSE_WORKERS = 2
+STORE_WORKERS = 1  # SQLite takes one writer at a time, more only add lock waits
+FEED_CHUNK = 64  # Products the source hands over at a time
+
+_DONE = object()
+
+
+class Stage:
+    """One step of the pipeline: func applied to every item by `workers` concurrent workers.
+
+    func returns the item for the next stage, or None to drop it. A coroutine function
+    runs on the event loop, anything else in the stage's executor.
+    """
+
+    def __init__(self, name, func, workers=1, executor=None, queue_size=QUEUE_SIZE, size=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.executor = executor
+        self.queue_size = queue_size
+        self.size = size  # How many products an item holds, when it is a batch
+        self.queue = None
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy = 0.0  # Seconds spent in func, summed over the workers
+        self.blocked = 0.0  # Seconds spent waiting for room in the next stage's queue
+        self.max_depth = 0
+
+    async def process(self, item):
+        if asyncio.iscoroutinefunction(self.func):
+            return await self.func(item)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.func, item)
+
+    async def get(self):
+        item = await self.queue.get()
+        self.max_depth = max(self.max_depth, self.queue.qsize() + 1)
+        return item
+
+    async def work(self, output):
+        while True:
+            item = await self.get()
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                result = await self.process(item)
+            except Exception as e:
+                # One bad item must not stop the stage, the ones behind it would wait forever
+                print(f"{self.name} failed: {e!r}")
+                self.failed += 1
+                continue
+            finally:
+                self.busy += time.perf_counter() - start
+            self.processed += self.size(item) if self.size else 1
+            if result is None:
+                self.dropped += 1
+            elif output is not None:
+                await output.put(result)
+
+    async def run(self, output):
+        await asyncio.gather(*(self.work(output) for _ in range(self.workers)))
+
+    def stats(self, elapsed):
+        return {"stage": self.name, "workers": self.workers, "processed": self.processed, "failed": self.failed,
+                "per_second": self.processed / elapsed if elapsed else 0.0, "queued": self.queue.qsize(),
+                "max_queued": self.max_depth, "busy": self.busy, "blocked": self.blocked}
+
+
+class Batcher(Stage):
+    """Groups items into lists of up to size, or whatever arrived within delay seconds."""
+
+    def __init__(self, name, size=BATCH_SIZE, delay=BATCH_DELAY, queue_size=QUEUE_SIZE):
+        super().__init__(name, None, workers=1, queue_size=queue_size)
+        self.batch_size = size
+        self.delay = delay
+
+    async def work(self, output):
+        items = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is not None and item is not _DONE:
+                items.append(item)
+                self.processed += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.delay
+            if items and (item is None or item is _DONE or len(items) >= self.batch_size):
+                await output.put(items)
+                items, deadline = [], None
+            if item is _DONE:
+                return
+
+
+class Store(Stage):
+    """The last stage: func writes a batch and reports how many products the database took."""
+
+    def __init__(self, name, func, workers=1, executor=None, queue_size=QUEUE_SIZE):
+        super().__init__(name, func, workers, executor, queue_size, size=len)
+        self.stored = 0
+        self.rejected = 0  # Turned down by the database, e.g. a link that is already stored
+
+    async def process(self, item):
+        report = await super().process(item)
+        self.stored += report["stored"]
+        self.rejected += report["rejected"]
+        return report
+
+    def stats(self, elapsed):
+        stats = super().stats(elapsed)
+        stats.update(stored=self.stored, rejected=self.rejected)
+        return stats
+
+
+class BlockedQueue(asyncio.Queue):
+    """A stage's input queue that charges the time producers wait on put() to the producing stage."""
+
+    def __init__(self, maxsize, producer):
+        super().__init__(maxsize)
+        self.producer = producer
+
+    async def put(self, item):
+        if self.full() and self.producer is not None:
+            start = time.perf_counter()
+            await super().put(item)
+            self.producer.blocked += time.perf_counter() - start
+        else:
+            await super().put(item)
+
+
+class Pipeline:
+    def __init__(self, source, stages, stats_interval=None):
+        self.source = source  # Iterable of items, consumed in a thread since it may block
+        self.stages = stages
+        self.stats_interval = stats_interval
+        self.source_stats = Stage("source", None)
+        self.started = None
+
+    async def run(self):
+        self.started = time.perf_counter()
+        producers = [self.source_stats] + self.stages[:-1]
+        for stage, producer in zip(self.stages, producers):
+            stage.queue = BlockedQueue(stage.queue_size, producer)
+        loop = asyncio.get_running_loop()
+        reporter = asyncio.create_task(self.report()) if self.stats_interval else None
+        tasks = [asyncio.create_task(self.run_stage(index)) for index in range(len(self.stages))]
+        # Feeding from a thread blocks it, not the loop, while the first queue is full
+        await loop.run_in_executor(None, self.feed, loop)
+        await asyncio.gather(*tasks)
+        if reporter is not None:
+            reporter.cancel()
+        return self.stats()
+
+    def feed(self, loop):
+        # Handing items to the loop one by one would cost a thread switch each
+        first = self.stages[0].queue
+        chunk = []
+        for item in self.source:
+            chunk.append(item)
+            if len(chunk) >= FEED_CHUNK:
+                asyncio.run_coroutine_threadsafe(self.put_all(first, chunk), loop).result()
+                chunk = []
+        chunk.extend([_DONE] * self.stages[0].workers)
+        asyncio.run_coroutine_threadsafe(self.put_all(first, chunk), loop).result()
+
+    async def put_all(self, queue, items):
+        for item in items:
+            await queue.put(item)
+            if item is not _DONE:
+                self.source_stats.processed += 1
+
+    async def run_stage(self, index):
+        stage = self.stages[index]
+        following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        await stage.run(following.queue if following else None)
+        # Every worker of this stage is done, so the next stage gets no more items
+        if following is not None:
+            for _ in range(following.workers):
+                await following.queue.put(_DONE)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            print_stats(self.stats())
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        source = {"stage": "source", "workers": 1, "processed": self.source_stats.processed, "failed": 0,
+                  "per_second": self.source_stats.processed / elapsed if elapsed else 0.0, "queued": 0,
+                  "max_queued": 0, "busy": 0.0, "blocked": self.source_stats.blocked}
+        return {"elapsed": elapsed, "stages": [source] + [stage.stats(elapsed) for stage in self.stages]}
+
+
+def print_stats(stats):
+    print(f"{'stage':<8} {'workers':>7} {'processed':>10} {'failed':>7} {'per s':>9} {'queued':>7} {'max':>6} "
+          f"{'busy s':>8} {'blocked s':>9} {'stored':>8} {'rejected':>8}   after {stats['elapsed']:.1f}s")
+    for stage in stats["stages"]:
+        print(f"{stage['stage']:<8} {stage['workers']:>7} {stage['processed']:>10} {stage['failed']:>7} "
+              f"{stage['per_second']:>9.0f} {stage['queued']:>7} {stage['max_queued']:>6} {stage['busy']:>8.2f} "
+              f"{stage['blocked']:>9.2f} {stage.get('stored', '-'):>8} {stage.get('rejected', '-'):>8}")
+
+
+# Stage functions. They are module-level, so the process pool can run them; whatever
+# they keep open is per process.
+
+_session = None
+_limiter = None
+_pool = None
+_setup_lock = threading.Lock()  # The fetch workers share one session and one limiter
+
+
+def fetch_page(product):
+    global _session, _limiter
+    if _limiter is None:
+        with _setup_lock:
+            if _limiter is None:
+                _session = requests.Session()
+                _session.mount("https://", HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+                _limiter = HostLimiter(MAX_PER_HOST, 1.0 / RATE_LIMIT)
+    with _limiter.slots:
+        _limiter.wait_turn()
+        try:
+            response = _session.get(product["link"], timeout=15)
+        except requests.RequestException as e:
+            print(f"Could not fetch details for {product['link']}: {e}")
+            return product, ""
+    return product, response.text if response.status_code == 200 else ""
+
+
+def parse_page(fetched):
+    product, html = fetched
+    product["additional_info"] = (extract_detail_info(html) if html else None) or ""
+    return product
+
+
+def store_products(products, db_path=DATABASE):
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(db_path, max_size=1)
+    operations = [{"op": "create", "product": dict(product, additional_info=product.get("additional_info", ""))}
+                  for product in products]
+    with _pool.connection() as conn:
+        report = batch.apply_batch(conn, operations)
+    return {"stored": report["succeeded"], "rejected": report["failed"]}
+
+
+def scrape_listing(url=URL):
+    response = requests.get(url, timeout=15)
+    response.raise_for_status()
+    for name, price, link in extract_listing(response.text):
+        link = f"https://ultra.md{link}" if not link.startswith("http") else link
+        yield {"name": name.strip(), "price": price, "link": link}
+
+
+def synthetic_products(count):
+    run = int(time.time())
+    for i in range(count):
+        yield {"name": f"TV {i}", "price": f"{1000 + i % 50000} lei", "link": f"https://ultra.md/synthetic/{run}/{i}"}
+
+
+def build_pipeline(source, db_path=DATABASE, details=False, processes=False, fetch_workers=FETCH_WORKERS,
+                   parse_workers=PARSE_WORKERS, store_workers=STORE_WORKERS, batch_size=BATCH_SIZE,
+                   queue_size=QUEUE_SIZE, stats_interval=None):
+    threads = ThreadPoolExecutor(fetch_workers + parse_workers + store_workers)
+    cpu = ProcessPoolExecutor(parse_workers + store_workers) if processes else threads
+    stages = []
+    if details:
+        stages.append(Stage("fetch", fetch_page, fetch_workers, threads, queue_size))
+        stages.append(Stage("parse", parse_page, parse_workers, cpu, queue_size))
+    stages.append(Batcher("batch", batch_size, queue_size=queue_size))
+    # Products wait in front of it in batches, so its queue holds about as many as the others
+    stages.append(Store("store", functools.partial(store_products, db_path=db_path), store_workers, cpu,
+                        queue_size=max(1, queue_size // batch_size)))
+    return Pipeline(source, stages, stats_interval), [threads, cpu]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape ultra.md straight into the database, with backpressure")
+    parser.add_argument("--db", default=DATABASE)
+    parser.add_argument("--details", action="store_true", help="Also fetch every product page for additional_info")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="Store N made-up products instead of scraping")
+    parser.add_argument("--processes", action="store_true", help="Parse and store in worker processes")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--store-workers", type=int, default=STORE_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Items waiting in front of each stage")
+    parser.add_argument("--stats", type=float, default=5.0, help="Seconds between stats lines (0 for none)")
+    args = parser.parse_args()
+
+    source = synthetic_products(args.synthetic) if args.synthetic else scrape_listing()
+    pipeline, executors = build_pipeline(source, args.db, details=args.details and not args.synthetic,
+                                         processes=args.processes, fetch_workers=args.fetch_workers,
+                                         parse_workers=args.parse_workers, store_workers=args.store_workers,
+                                         batch_size=args.batch_size, queue_size=args.queue_size,
+                                         stats_interval=args.stats or None)
+    try:
+        stats = asyncio.run(pipeline.run())
+    finally:
+        for executor in executors:
+            executor.shutdown()
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
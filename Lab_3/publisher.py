@@ -1,39 +1,210 @@
+import argparse
 import pika
+import queue
 import requests
-from bs4 import BeautifulSoup
 import json
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from extract import extract_detail_info, extract_listing
+from fetcher import FetchEngine
+
+# Detail page fetching
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+RATE_LIMIT = 10  # Requests per second per host
 
 # RabbitMQ Setup
-def publish_message_to_queue(message, queue_name="scraper_queue"):
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
-    channel.queue_declare(queue=queue_name)
-    channel.basic_publish(exchange='', routing_key=queue_name, body=json.dumps(message))
-    connection.close()
+QUEUE_NAME = "scraper_queue"
+BATCH_SIZE = 100  # Products per message
+MAX_DELAY = 0.5  # Seconds a product waits for its batch to fill up
+MAX_PENDING = 10_000  # Products queued for the publishing thread before publish() blocks
+RETRIES = 5
+BACKOFF = 0.5  # Seconds, doubled after every failed attempt
+# Persistent, so the broker writes the messages to disk. consumer.py declares the queue
+# too, and the declarations have to agree, so scraper_queue itself stays non-durable:
+# the messages only outlive a broker restart once both declare it durable=True.
+PROPERTIES = pika.BasicProperties(content_type="application/json", delivery_mode=2)
+
+_STOP = object()
+
+
+def connect(host="localhost"):
+    return pika.BlockingConnection(pika.ConnectionParameters(host))
+
+
+class PublishError(Exception):
+    pass
+
+
+class BatchPublisher:
+    """Publishes products to RabbitMQ over one long-lived connection.
+
+    Products are collected into batches of up to batch_size, or whatever arrived within
+    max_delay of the first one, and each batch goes out as one message holding a JSON
+    array. A background thread owns the connection (pika's is not thread-safe) and waits
+    for the broker to confirm every batch. A batch that fails or is not confirmed is sent
+    again on a new connection, so delivery is at-least-once. Use it as a context manager,
+    or call close() to send what is left.
+    """
+
+    def __init__(self, queue_name=QUEUE_NAME, connect=connect, batch_size=BATCH_SIZE, max_delay=MAX_DELAY,
+                 max_pending=MAX_PENDING, retries=RETRIES, backoff=BACKOFF):
+        self.queue_name = queue_name
+        self.connect = connect
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.published = 0  # Products confirmed by the broker
+        self.batches = 0
+        self.reconnects = 0
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._connection = None
+        self._channel = None
+        self._thread = threading.Thread(target=self._run, name="publisher", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def publish(self, product):
+        if self.error is not None:
+            raise PublishError(f"Publishing stopped: {self.error!r}") from self.error
+        self._queue.put(product)
+
+    def close(self):
+        """Send the products still queued, then close the connection."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise PublishError(f"Publishing stopped: {self.error!r}") from self.error
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._send(batch)
+        except Exception as e:
+            self.error = e
+            # Unblock a publish() waiting for room in the queue
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        finally:
+            self._disconnect()
+
+    def _next_batch(self):
+        # Returns (products, whether close() was called)
+        while True:
+            try:
+                first = self._queue.get(timeout=1.0)
+                break
+            except queue.Empty:
+                # Idle: answer the broker's heartbeats so it keeps the connection
+                if self._connection is not None and self._connection.is_open:
+                    try:
+                        self._connection.process_data_events(time_limit=0)
+                    except (pika.exceptions.AMQPError, OSError) as e:
+                        # Dropped while idle; the next batch connects again
+                        print(f"Connection lost while idle ({e!r})")
+                        self._disconnect()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            try:
+                product = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if product is _STOP:
+                return batch, True
+            batch.append(product)
+        return batch, False
+
+    def _send(self, batch):
+        body = json.dumps(batch)
+        for attempt in range(self.retries + 1):
+            try:
+                # Blocks until the broker confirms; raises NackError/UnroutableError if it doesn't take it
+                self._open_channel().basic_publish(exchange="", routing_key=self.queue_name, body=body,
+                                                   properties=PROPERTIES, mandatory=True)
+                self.published += len(batch)
+                self.batches += 1
+                return
+            except (pika.exceptions.AMQPError, OSError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f"Publishing failed ({e!r}), retrying")
+                self._disconnect()
+                self.reconnects += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _open_channel(self):
+        if self._channel is None or not self._channel.is_open:
+            self._disconnect()
+            self._connection = self.connect()
+            self._channel = self._connection.channel()
+            self._channel.queue_declare(queue=self.queue_name)
+            self._channel.confirm_delivery()
+        return self._channel
+
+    def _disconnect(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except (pika.exceptions.AMQPError, OSError):
+                pass
+
+def fetch_additional_info(session, link):
+    response = session.get(link, timeout=15)
+    # Server errors and throttling are retried by the fetch engine
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return extract_detail_info(response.text) or ""
 
 # Scrape and Publish
-def scrape_and_publish():
+def scrape_and_publish(fetch_details=False):
     url = "https://ultra.md/category/tv-televizory"
-    response = requests.get(url)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_PER_HOST, pool_maxsize=MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    response = session.get(url)
     if response.status_code == 200:
-        soup = BeautifulSoup(response.text, "html.parser")
-        products = soup.find_all("div", class_="product-block")
+        listed_products = {}
+        for name, price, link in extract_listing(response.text):
+            link = f"https://ultra.md{link}" if not link.startswith("http") else link
+            listed_products[link] = {"name": name.strip(), "price": price, "link": link}
 
-        for product in products:
-            try:
-                name = product.find("a", class_="product-text").text.strip()
-                price = " ".join(product.find("span", class_="text-blue text-xl font-bold dark:text-white").text.split())
-                link = product.find("a", class_="product-text")["href"]
-
-                product_data = {
-                    "name": name,
-                    "price": price,
-                    "link": f"https://ultra.md{link}" if not link.startswith("http") else link
-                }
-                publish_message_to_queue(product_data)
-                print(f"Published: {product_data}")
-            except AttributeError:
-                print(f"Error processing product: Missing required fields.")
+        with BatchPublisher() as publisher:
+            if not fetch_details:
+                for product_data in listed_products.values():
+                    publisher.publish(product_data)
+            else:
+                # Detail pages are fetched concurrently; products are published as their page arrives
+                engine = FetchEngine(lambda link: fetch_additional_info(session, link),
+                                     max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, rate_limit=RATE_LIMIT)
+                for result in engine.fetch_all(listed_products):
+                    product_data = listed_products[result.link]
+                    if result.error is not None:
+                        print(f"Could not fetch details for {result.link}: {result.error}")
+                    product_data["additional_info"] = result.value or ""
+                    publisher.publish(product_data)
+        print(f"Published {publisher.published} products in {publisher.batches} messages")
 
 if __name__ == "__main__":
-    scrape_and_publish()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape ultra.md and publish the products to RabbitMQ")
+    parser.add_argument("--details", action="store_true",
+                        help="Also fetch every product page and publish its price with interest as additional_info")
+    args = parser.parse_args()
+    scrape_and_publish(fetch_details=args.details)
@@ -0,0 +1,196 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+import pika
+
+# An in-process stand-in for RabbitMQ, for the benchmarks: it implements the part of
+# pika's BlockingConnection/BlockingChannel API that publisher.py and consumer.py use.
+# Every method that waits for the broker's reply in AMQP (opening a connection takes
+# several) sleeps for one simulated round trip, and so does a publish while confirms are
+# on. Deliveries and acks are asynchronous in AMQP and cost nothing here.
+# Queues declared with x-message-ttl hold their messages for that long and then move them
+# to their x-dead-letter-routing-key queue, like RabbitMQ's dead-lettering through the
+# default exchange. fail_every makes every nth publish fail the way a dropped connection
+# does, and with stop_when_drained start_consuming() returns once nothing is left to
+# deliver or waiting to expire and everything is acked.
+
+RTT = 0.0002  # Seconds, about what a local broker answers in
+HANDSHAKE_ROUND_TRIPS = 7  # TCP connect, protocol header, Start, Tune/Open, channel, declare, close
+
+
+class StandInBroker:
+    def __init__(self, rtt=RTT, fail_every=None, stop_when_drained=False):
+        self.rtt = rtt
+        self.fail_every = fail_every
+        self.stop_when_drained = stop_when_drained
+        self.queues = defaultdict(deque)  # Queue name -> (body, properties)
+        self.arguments = {}  # Queue name -> the arguments it was declared with
+        self.expiring = []  # Heap of (expires, number, queue, body, properties) in TTL queues
+        self._numbers = itertools.count()
+        self.connections = 0
+        self.publishes = 0
+
+    def publish(self, queue, body, properties=None):
+        properties = properties or pika.BasicProperties()
+        ttl = self.arguments.get(queue, {}).get("x-message-ttl")
+        if ttl is None:
+            self.queues[queue].append((body, properties))
+        else:
+            heapq.heappush(self.expiring, (time.monotonic() + ttl / 1000, next(self._numbers), queue, body, properties))
+
+    def expire(self):
+        while self.expiring and self.expiring[0][0] <= time.monotonic():
+            _, _, queue, body, properties = heapq.heappop(self.expiring)
+            target = self.arguments[queue].get("x-dead-letter-routing-key", queue)
+            self.queues[target].append((body, properties))
+
+    def round_trip(self, count=1):
+        if self.rtt:
+            time.sleep(self.rtt * count)
+
+    def connect(self):
+        self.round_trip(HANDSHAKE_ROUND_TRIPS - 3)  # Channel, declare and close are counted where they happen
+        self.connections += 1
+        return Connection(self)
+
+
+class Connection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.channels = []
+        self._callbacks = deque()  # Added from other threads
+        self._timers = []  # Heap of (deadline, id, callback)
+        self._timer_ids = itertools.count()
+        self._wakeup = threading.Condition()
+
+    def channel(self):
+        self.broker.round_trip()
+        channel = Channel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        with self._wakeup:
+            self._callbacks.append(callback)
+            self._wakeup.notify()
+
+    def call_later(self, delay, callback):
+        timer_id = next(self._timer_ids)
+        heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+        return timer_id
+
+    def remove_timeout(self, timer_id):
+        self._timers = [timer for timer in self._timers if timer[1] != timer_id]
+        heapq.heapify(self._timers)
+
+    def process_data_events(self, time_limit=0):
+        if not any(channel.deliverable() for channel in self.channels):
+            # Nothing to hand out: sleep until a callback is added or a timer is due
+            timeout = time_limit
+            for pending in (self._timers, self.broker.expiring):
+                if pending:
+                    timeout = min(timeout, max(0.0, pending[0][0] - time.monotonic()))
+            with self._wakeup:
+                if not self._callbacks and timeout > 0:
+                    self._wakeup.wait(timeout)
+        while True:
+            with self._wakeup:
+                if not self._callbacks:
+                    break
+                callback = self._callbacks.popleft()
+            callback()
+        while self._timers and self._timers[0][0] <= time.monotonic():
+            heapq.heappop(self._timers)[2]()
+        self.broker.expire()
+        for channel in self.channels:
+            channel.deliver()
+
+    def close(self):
+        self.broker.round_trip()
+        self.is_open = False
+
+
+class Channel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.confirming = False
+        self.prefetch = 0
+        self.consumer = None  # (queue, callback, auto_ack)
+        self.consuming = False
+        self.unacked = {}  # Delivery tag -> (queue, body, properties)
+        self._tags = itertools.count(1)
+
+    @property
+    def is_open(self):
+        return self.connection.is_open
+
+    def queue_declare(self, queue, arguments=None, **options):
+        self.broker.round_trip()
+        self.broker.arguments.setdefault(queue, arguments or {})
+        self.broker.queues[queue]
+
+    def confirm_delivery(self):
+        self.broker.round_trip()
+        self.confirming = True
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if not self.is_open:
+            raise pika.exceptions.ChannelWrongStateError("Channel is closed.")
+        self.broker.publishes += 1
+        if self.broker.fail_every and self.broker.publishes % self.broker.fail_every == 0:
+            self.connection.is_open = False
+            raise pika.exceptions.StreamLostError("Stream connection lost: stand-in failure")
+        if self.confirming:
+            self.broker.round_trip()
+        self.broker.publish(routing_key, body, properties)
+
+    def basic_qos(self, prefetch_count=0):
+        self.broker.round_trip()
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self.broker.round_trip()
+        self.consumer = (queue, on_message_callback, auto_ack)
+
+    def deliverable(self):
+        if self.consumer is None or not self.broker.queues[self.consumer[0]]:
+            return False
+        return not self.prefetch or len(self.unacked) < self.prefetch
+
+    def deliver(self):
+        while self.consuming and self.deliverable():
+            queue, callback, auto_ack = self.consumer
+            body, properties = self.broker.queues[queue].popleft()
+            tag = next(self._tags)
+            if not auto_ack:
+                self.unacked[tag] = (queue, body, properties)
+            callback(self, pika.spec.Basic.Deliver(delivery_tag=tag, routing_key=queue), properties,
+                     body.encode() if isinstance(body, str) else body)
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming:
+            if (self.broker.stop_when_drained and not self.unacked and not self.broker.queues[self.consumer[0]]
+                    and not self.broker.expiring):
+                break
+            self.connection.process_data_events(time_limit=0.05)
+        self.consuming = False
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self.unacked.pop(tag) for tag in tags]
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self._settle(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        for queue, body, properties in reversed(self._settle(delivery_tag, multiple)):
+            if requeue:
+                self.broker.queues[queue].appendleft((body, properties))
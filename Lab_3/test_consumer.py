@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import unittest
+from consumer import DUPLICATE, BulkConsumer
+from dedup import LinkFilter
+from standin_broker import StandInBroker
+
+# Run with: python -m unittest test_consumer (or pytest) from Lab_3
+
+
+class MemorySink:
+    def __init__(self):
+        self.links = set()
+
+    def write(self, operations):
+        results = []
+        for index, operation in enumerate(operations):
+            link = operation["product"]["link"]
+            if link in self.links:
+                results.append({"index": index, "status": 400, "message": DUPLICATE, "id": None})
+            else:
+                self.links.add(link)
+                results.append({"index": index, "status": 201, "message": "Product created", "id": index})
+        return results
+
+    def close(self):
+        pass
+
+
+class FailingFilter(LinkFilter):
+    """Fails its first `failures` lookups the way a busy database does."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def new(self, links):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().new(links)
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.acks = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+def consume(broker, messages, seen=None, retry_delays=(0.05,)):
+    for message in messages:
+        broker.publish("products", json.dumps(message))
+    sink = MemorySink()
+    consumer = BulkConsumer(broker.connect(), sink, "products", batch_delay=0.01, retries=0, backoff=0,
+                            retry_delays=retry_delays, seen=seen)
+    consumer.run()
+    return consumer, sink
+
+
+class BulkConsumerTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = StandInBroker(rtt=0, stop_when_drained=True)
+
+    def test_failed_lookup_retries_the_messages(self):
+        messages = [{"name": f"TV {i}", "price": "1 lei", "link": f"https://ultra.md/{i}"} for i in range(3)]
+        consumer, sink = consume(self.broker, messages, FailingFilter(failures=1))
+        # Acked the first time round, then back from the retry queue and written
+        self.assertEqual(consumer.counts["retried"], 3)
+        self.assertEqual(consumer.counts["written"], 3)
+        self.assertEqual(sink.links, {message["link"] for message in messages})
+        self.assertFalse(consumer.channel.unacked)
+        self.assertFalse(self.broker.queues["products.dlq"])
+
+    def test_lookup_that_keeps_failing_is_dead_lettered(self):
+        consumer, sink = consume(self.broker, [{"name": "TV", "price": "1 lei", "link": "https://ultra.md/1"}],
+                                 FailingFilter(failures=2))
+        self.assertEqual(consumer.counts["dead"], 1)
+        self.assertFalse(consumer.channel.unacked)
+        [(body, properties)] = self.broker.queues["products.dlq"]
+        self.assertEqual(json.loads(body)[0]["link"], "https://ultra.md/1")
+        self.assertIn("database is locked", properties.headers["x-error"])
+
+    def test_duplicates_are_acked_without_a_write(self):
+        product = {"name": "TV", "price": "1 lei", "link": "https://ultra.md/1"}
+        consumer, sink = consume(self.broker, [product, product, [product, product]], LinkFilter())
+        self.assertEqual(consumer.counts["written"], 1)
+        self.assertEqual(consumer.counts["duplicates"], 3)
+        self.assertFalse(consumer.channel.unacked)
+
+    def test_acks_stop_at_the_oldest_unfinished_message(self):
+        consumer = BulkConsumer(self.broker.connect(), MemorySink(), "products")
+        consumer.channel = RecordingChannel()
+        consumer._unacked.extend([1, 2, 3, 4])
+        consumer._finish([2, 3])
+        self.assertEqual(consumer.channel.acks, [])
+        consumer._finish([1])
+        self.assertEqual(consumer.channel.acks, [(3, True)])
+        consumer._finish([4])
+        self.assertEqual(consumer.channel.acks, [(3, True), (4, True)])
+        self.assertFalse(consumer._unacked)
+        self.assertFalse(consumer._done)
+
+
+if __name__ == "__main__":
+    unittest.main()
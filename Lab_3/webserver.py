@@ -1,22 +1,22 @@
 from flask import Flask, request, jsonify
+import atexit
 import sqlite3
 from flask_cors import CORS
+import batch
+from db import DATABASE, ConnectionPool, migrate
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Connections are reused across requests instead of opened for every product
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
+
 # Database Initialization
 def init_db():
-    conn = sqlite3.connect("products.db")
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        price TEXT,
-                        link TEXT UNIQUE,
-                        additional_info TEXT
-                    )''')
-    conn.commit()
+    # Same schema, indexes and triggers as the Lab_2 API (db.py is shared)
+    conn = sqlite3.connect(DATABASE)
+    migrate(conn)
     conn.close()
 
 @app.route('/products', methods=['POST'])
@@ -27,18 +27,33 @@ def create_product():
     link = data.get('link')
     additional_info = data.get('additional_info', '')
 
-    conn = sqlite3.connect("products.db")
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''INSERT INTO products (name, price, link, additional_info) VALUES (?, ?, ?, ?)''',
-                       (name, price, link, additional_info))
-        conn.commit()
-        return jsonify({"message": "Product created successfully"}), 201
-    except sqlite3.IntegrityError:
-        return jsonify({"message": "Product already exists"}), 400
-    finally:
-        conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''INSERT INTO products (name, price, link, additional_info) VALUES (?, ?, ?, ?)''',
+                           (name, price, link, additional_info))
+            conn.commit()
+            return jsonify({"message": "Product created successfully"}), 201
+        except sqlite3.IntegrityError:
+            return jsonify({"message": "Product already exists"}), 400
+
+# Many creates/upserts/updates/deletes in one transaction, see batch.py
+@app.route('/products/batch', methods=['POST'])
+def batch_products():
+    data = request.get_json(silent=True)
+    atomic = False
+    if isinstance(data, dict):
+        atomic = bool(data.get('atomic', False))
+        data = data.get('operations')
+    if not isinstance(data, list):
+        return jsonify({"message": "Expected a list of operations"}), 400
+    if len(data) > batch.MAX_OPERATIONS:
+        return jsonify({"message": f"At most {batch.MAX_OPERATIONS} operations per batch"}), 413
+
+    with db_pool.connection() as conn:
+        report = batch.apply_batch(conn, data, atomic)
+    return jsonify(report), 200 if report["committed"] else 409
 
 if __name__ == "__main__":
     init_db()
-    app.run(port=5000)
\ No newline at end of file
+    app.run(port=5000)
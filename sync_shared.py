@@ -0,0 +1,47 @@
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+# Each lab is run from its own directory, so modules used by more than one lab are
+# copied into each of them. One lab holds the copy that gets edited; this script checks
+# that the other labs match it, and --write copies it over them.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Module: (lab holding the edited version, labs holding copies)
+SHARED = {
+    "extract.py": ("Lab_1", ["Lab_2", "Lab_3"]),
+    "fetcher.py": ("Lab_1", ["Lab_2", "Lab_3"]),
+    "db.py": ("Lab_2", ["Lab_3"]),
+    "batch.py": ("Lab_2", ["Lab_3"]),
+}
+
+
+def out_of_sync():
+    """Yield (source path, copy path) for every copy that differs from its source or is missing."""
+    for module, (source_lab, labs) in SHARED.items():
+        source = os.path.join(ROOT, source_lab, module)
+        for lab in labs:
+            copy = os.path.join(ROOT, lab, module)
+            if not os.path.exists(copy) or not filecmp.cmp(source, copy, shallow=False):
+                yield source, copy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the shared modules are identical in every lab")
+    parser.add_argument("--write", action="store_true", help="Copy the edited version over the stale copies")
+    args = parser.parse_args()
+
+    stale = list(out_of_sync())
+    for source, copy in stale:
+        if args.write:
+            shutil.copyfile(source, copy)
+            print(f"Updated {os.path.relpath(copy, ROOT)}")
+        else:
+            print(f"{os.path.relpath(copy, ROOT)} differs from {os.path.relpath(source, ROOT)}")
+    if stale and not args.write:
+        print("Run python sync_shared.py --write to update the copies")
+        sys.exit(1)
+    if not stale:
+        print("Shared modules are in sync")